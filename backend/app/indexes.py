@@ -0,0 +1,175 @@
+"""
+Criação dos índices do MongoDB e auditoria dos planos de consulta.
+
+``ensure_indexes`` é chamado na inicialização do backend e cria (de forma
+idempotente) os índices usados pelas consultas mais frequentes.
+``audit_query_plans`` executa ``explain`` nessas consultas e informa quais
+não estão sendo atendidas por um índice.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Set
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Índices por coleção
+INDEXES: Dict[str, List[IndexModel]] = {
+    "catalogs": [
+        IndexModel([("catalog_id", ASCENDING)], unique=True, name="catalog_id_unique"),
+        IndexModel([("content_hash", ASCENDING), ("upload_date", ASCENDING)], name="content_hash_upload_date"),
+        # Listagem paginada (keyset) com e sem filtro de status
+        IndexModel([("upload_date", DESCENDING), ("_id", DESCENDING)], name="upload_date_id"),
+        IndexModel(
+            [("status", ASCENDING), ("upload_date", DESCENDING), ("_id", DESCENDING)],
+            name="status_upload_date_id"
+        ),
+    ],
+    "annotations": [
+        IndexModel(
+            [("catalog_id", ASCENDING), ("page_number", ASCENDING)],
+            unique=True,
+            name="catalog_page_unique"
+        ),
+    ],
+    "page_text": [
+        IndexModel(
+            [("catalog_id", ASCENDING), ("page_number", ASCENDING)],
+            unique=True,
+            name="catalog_page_unique"
+        ),
+    ],
+    "ocr_results": [
+        IndexModel(
+            [("catalog_id", ASCENDING), ("page_number", ASCENDING)],
+            unique=True,
+            name="catalog_page_unique"
+        ),
+    ],
+    "detection_jobs": [
+        IndexModel([("catalog_id", ASCENDING), ("created_at", DESCENDING)], name="catalog_created_at"),
+        IndexModel([("job_id", ASCENDING)], name="job_id"),
+    ],
+}
+
+# Valor fictício usado nas consultas de auditoria
+PROBE_ID = "__query_plan_probe__"
+
+# Consultas mais frequentes da API, no mesmo formato usado pelas rotas
+HOT_QUERIES: List[Dict[str, Any]] = [
+    {
+        "name": "catalogo_por_id",
+        "collection": "catalogs",
+        "filter": {"catalog_id": PROBE_ID},
+    },
+    {
+        "name": "catalogo_por_hash",
+        "collection": "catalogs",
+        "filter": {"content_hash": PROBE_ID, "file_type": "pdf", "status": "ready"},
+        "sort": {"upload_date": 1},
+    },
+    {
+        "name": "listagem_de_catalogos",
+        "collection": "catalogs",
+        "filter": {"status": "ready"},
+        "sort": {"upload_date": -1, "_id": -1},
+    },
+    {
+        "name": "anotacao_por_pagina",
+        "collection": "annotations",
+        "filter": {"catalog_id": PROBE_ID, "page_number": 1},
+    },
+    {
+        "name": "anotacoes_por_catalogo",
+        "collection": "annotations",
+        "filter": {"catalog_id": PROBE_ID},
+    },
+    {
+        "name": "ultimo_job_de_deteccao",
+        "collection": "detection_jobs",
+        "filter": {"catalog_id": PROBE_ID},
+        "sort": {"created_at": -1},
+    },
+    {
+        "name": "proximo_job_da_fila",
+        "collection": "processing_jobs",
+        "filter": {"status": "queued", "run_at": {"$lte": datetime(2000, 1, 1)}},
+        "sort": {"run_at": 1},
+    },
+]
+
+
+async def ensure_indexes(db):
+    """
+    Cria os índices definidos em ``INDEXES``.
+
+    Cada índice é criado separadamente, para que uma falha (por exemplo,
+    documentos duplicados impedindo um índice único) não impeça os demais.
+    """
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                logger.error(
+                    f"Não foi possível criar o índice {index.document['name']} "
+                    f"em {collection_name}: {str(e)}"
+                )
+
+
+def _collect_stages(plan: Any, stages: Set[str]):
+    """
+    Percorre o plano retornado pelo explain e coleta os nomes dos estágios.
+    """
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if isinstance(stage, str):
+            stages.add(stage)
+        for value in plan.values():
+            _collect_stages(value, stages)
+    elif isinstance(plan, list):
+        for item in plan:
+            _collect_stages(item, stages)
+
+
+async def audit_query_plans(db) -> List[Dict[str, Any]]:
+    """
+    Executa ``explain`` nas consultas de ``HOT_QUERIES`` e informa, para cada
+    uma, os estágios do plano vencedor e se ela é atendida por índice.
+    """
+    report = []
+    for query in HOT_QUERIES:
+        find_command: Dict[str, Any] = {
+            "find": query["collection"],
+            "filter": query["filter"],
+            "limit": 1,
+        }
+        if "sort" in query:
+            find_command["sort"] = query["sort"]
+
+        try:
+            explain = await db.command({"explain": find_command, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            report.append({"name": query["name"], "collection": query["collection"], "error": str(e)})
+            continue
+
+        stages: Set[str] = set()
+        _collect_stages(explain.get("queryPlanner", {}).get("winningPlan", {}), stages)
+
+        index_backed = "COLLSCAN" not in stages and any(
+            stage in stages for stage in ("IXSCAN", "EXPRESS_IXSCAN", "IDHACK", "EXPRESS_IDHACK")
+        )
+        report.append({
+            "name": query["name"],
+            "collection": query["collection"],
+            "filter": query["filter"],
+            "sort": query.get("sort"),
+            "stages": sorted(stages),
+            "index_backed": index_backed,
+            # Ordenação em memória indica que o índice não cobre o sort
+            "in_memory_sort": "SORT" in stages,
+        })
+
+    return report
@@ -0,0 +1,322 @@
+"""
+Fila de jobs persistente no MongoDB.
+
+Substitui o ``BackgroundTasks`` do FastAPI para tarefas longas (como o
+processamento de catálogos). Os jobs ficam gravados na coleção
+``processing_jobs``, são reivindicados de forma atômica com
+``find_one_and_update`` e executados por um número configurável de workers.
+Falhas são repetidas com backoff exponencial. Jobs em ``processing`` cujo
+heartbeat parou (processo reiniciado, recarregado ou que caiu) voltam para a
+fila: a varredura roda na inicialização e periodicamente enquanto os
+workers estão ativos, e considera apenas a idade do heartbeat, não o dono
+do job (o pid muda a cada reload e uma réplica que caiu pode não voltar).
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Número de workers concorrentes por processo
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "2"))
+
+# Número máximo de tentativas antes de marcar o job como falho
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+
+# Atraso base (segundos) do backoff exponencial entre tentativas
+QUEUE_RETRY_BASE_DELAY = float(os.getenv("QUEUE_RETRY_BASE_DELAY", "10"))
+
+# Intervalo (segundos) entre consultas quando a fila está vazia
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "2"))
+
+# Intervalo (segundos) do heartbeat de jobs em execução
+QUEUE_HEARTBEAT_INTERVAL = float(os.getenv("QUEUE_HEARTBEAT_INTERVAL", "30"))
+
+# Número de intervalos de heartbeat sem atualização para um job ser considerado órfão
+QUEUE_STALE_HEARTBEATS = int(os.getenv("QUEUE_STALE_HEARTBEATS", "3"))
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+FailureHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Fila de jobs com reivindicação atômica, retry com backoff e recuperação de jobs órfãos.
+    """
+
+    def __init__(self, db, collection_name: str = "processing_jobs", workers: int = QUEUE_WORKERS):
+        self.collection = db[collection_name]
+        self.workers = max(1, workers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._failure_handlers: Dict[str, FailureHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register(self, job_type: str, handler: JobHandler, on_failure: Optional[FailureHandler] = None):
+        """
+        Registra a função que executa os jobs de um tipo.
+
+        ``on_failure`` é chamado apenas quando o job esgota as tentativas.
+        """
+        self._handlers[job_type] = handler
+        if on_failure:
+            self._failure_handlers[job_type] = on_failure
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        delay: float = 0
+    ) -> str:
+        """
+        Adiciona um job à fila e acorda os workers locais.
+
+        Com ``delay``, o job só pode ser reivindicado depois de ``delay`` segundos.
+        """
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "job_id": job_id,
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+            "updated_at": now,
+            "locked_by": None,
+            "lock_id": None,
+            "heartbeat_at": None,
+            "last_error": None
+        })
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    async def start(self):
+        """
+        Cria os índices da fila, recupera jobs órfãos e inicia os workers e a
+        varredura periódica de jobs órfãos.
+        """
+        await self.collection.create_index("job_id", unique=True)
+        await self.collection.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+
+        await self._sweep_stale_jobs()
+
+        # O evento é criado aqui para ficar associado ao event loop do servidor
+        self._wakeup = asyncio.Event()
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker_loop(index)))
+        self._tasks.append(asyncio.create_task(self._stale_sweep_loop()))
+
+    async def stop(self):
+        """
+        Interrompe os workers. Jobs em andamento voltam para a fila quando o heartbeat expirar.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def requeue_stale_jobs(self) -> int:
+        """
+        Devolve à fila jobs em ``processing`` cujo heartbeat parou.
+
+        Um job é órfão quando passa ``QUEUE_STALE_HEARTBEATS`` intervalos de
+        heartbeat sem atualização, seja qual for o processo que o reivindicou.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=QUEUE_HEARTBEAT_INTERVAL * QUEUE_STALE_HEARTBEATS)
+        result = await self.collection.update_many(
+            {
+                "status": "processing",
+                "$or": [
+                    {"heartbeat_at": {"$lt": stale_before}},
+                    {"heartbeat_at": None}
+                ]
+            },
+            {"$set": {
+                "status": "queued",
+                "run_at": now,
+                "locked_by": None,
+                "lock_id": None,
+                "updated_at": now
+            }}
+        )
+        return result.modified_count
+
+    async def _sweep_stale_jobs(self):
+        try:
+            requeued = await self.requeue_stale_jobs()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao recuperar jobs órfãos da fila: {str(e)}")
+            return
+        if requeued:
+            logger.info(f"{requeued} jobs presos em 'processing' foram devolvidos à fila")
+            if self._wakeup:
+                self._wakeup.set()
+
+    async def _stale_sweep_loop(self):
+        """
+        Repete a recuperação de jobs órfãos a cada intervalo de heartbeat.
+        """
+        while True:
+            await asyncio.sleep(QUEUE_HEARTBEAT_INTERVAL)
+            await self._sweep_stale_jobs()
+
+    async def claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        Reivindica atomicamente o próximo job pronto para execução.
+        """
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "status": "queued",
+                "run_at": {"$lte": now},
+                "type": {"$in": list(self._handlers)}
+            },
+            {
+                "$set": {
+                    "status": "processing",
+                    "locked_by": self.worker_id,
+                    # Identifica esta reivindicação: se o job for recuperado
+                    # como órfão e reivindicado de novo, as atualizações
+                    # desta execução deixam de valer
+                    "lock_id": str(uuid.uuid4()),
+                    "heartbeat_at": now,
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker_loop(self, index: int):
+        """
+        Loop de um worker: reivindica e executa jobs até ser cancelado.
+        """
+        while True:
+            try:
+                job = await self.claim_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {index} da fila falhou ao buscar job: {str(e)}")
+                job = None
+
+            if job is None:
+                # Aguardar novo job local ou o próximo ciclo de consulta
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=QUEUE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Erro ao registrar o resultado (ex.: MongoDB indisponível): o
+                # worker continua; se o job ficou em "processing", a varredura
+                # de órfãos o devolve à fila
+                logger.error(f"Worker {index} da fila falhou ao executar o job {job.get('job_id')}: {str(e)}")
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        """
+        Atualiza periodicamente o heartbeat de um job em execução.
+        """
+        while True:
+            await asyncio.sleep(QUEUE_HEARTBEAT_INTERVAL)
+            try:
+                await self.collection.update_one(
+                    {"job_id": job["job_id"], "lock_id": job.get("lock_id")},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao atualizar o heartbeat do job {job['job_id']}: {str(e)}")
+
+    async def _run_job(self, job: Dict[str, Any]):
+        """
+        Executa um job e registra sucesso, nova tentativa ou falha definitiva.
+        """
+        job_id = job["job_id"]
+        handler = self._handlers[job["type"]]
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+
+        try:
+            await handler(job["payload"])
+        except asyncio.CancelledError:
+            # Encerramento do servidor: o job volta para a fila quando o heartbeat expirar
+            raise
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Job {job_id} ({job['type']}) falhou na tentativa {job['attempts']}: {error}")
+            await self._handle_failure(job, error)
+        else:
+            await self.collection.update_one(
+                {"job_id": job_id, "lock_id": job.get("lock_id")},
+                {"$set": {
+                    "status": "completed",
+                    "locked_by": None,
+                    "lock_id": None,
+                    "completed_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+        finally:
+            heartbeat.cancel()
+
+    async def _handle_failure(self, job: Dict[str, Any], error: str):
+        """
+        Reagenda o job com backoff exponencial ou marca como falho.
+        """
+        now = datetime.utcnow()
+        if job["attempts"] < job.get("max_attempts", QUEUE_MAX_ATTEMPTS):
+            delay = QUEUE_RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1))
+            await self.collection.update_one(
+                {"job_id": job["job_id"], "lock_id": job.get("lock_id")},
+                {"$set": {
+                    "status": "queued",
+                    "run_at": now + timedelta(seconds=delay),
+                    "locked_by": None,
+                    "lock_id": None,
+                    "last_error": error,
+                    "updated_at": now
+                }}
+            )
+            return
+
+        result = await self.collection.update_one(
+            {"job_id": job["job_id"], "lock_id": job.get("lock_id")},
+            {"$set": {
+                "status": "failed",
+                "locked_by": None,
+                "lock_id": None,
+                "last_error": error,
+                "updated_at": now
+            }}
+        )
+
+        on_failure = self._failure_handlers.get(job["type"])
+        if on_failure and result.matched_count:
+            try:
+                await on_failure(job["payload"], error)
+            except Exception as e:
+                logger.error(f"Erro ao registrar falha do job {job['job_id']}: {str(e)}")
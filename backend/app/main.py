@@ -1,16 +1,19 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from typing import List, Dict, Any, Optional
+from fastapi.responses import JSONResponse, FileResponse, Response
+from typing import List, Dict, Any, Optional, Tuple
 import os
+import asyncio
 import motor.motor_asyncio
-import pdf2image
 import uuid
 from datetime import datetime
 import httpx
 import logging
 import json
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pydantic import ValidationError
 from .models import (
     CatalogSchema,
     AnnotationSchema,
@@ -18,31 +21,55 @@ from .models import (
     TrainingRequestSchema,
     PdfToJpgSchema
 )
+from .uploads import UploadLimitMiddleware, save_upload_stream
+from .job_queue import JobQueue
+from .cache import LRUCache
+from .responses import MongoJSONResponse
+from .indexes import ensure_indexes, audit_query_plans
+from .ml_client import MLServiceClient, STATUS_TIMEOUT, RESULTS_TIMEOUT, DETECT_TIMEOUT
+from .ocr import OCR_MARGIN, ocr_pages, parse_price, shutdown_ocr_pool
+from .rendering import (
+    render_pdf,
+    convert_image_to_page,
+    run_in_render_pool,
+    shutdown_render_pool,
+    clone_page_images,
+    page_image_filename,
+    page_image_size,
+    PAGE_IMAGE_SIZES
+)
+from .spatial import SpatialIndex, clip_bbox
+from .text_layer import extract_text_layer, join_words, words_in_bbox
 import shutil
-from PIL import Image
 import zipfile
 import io
+import re
+import base64
+from email.utils import formatdate
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Classe para ajudar na serialização do ObjectId
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        return super().default(o)
-
-# Função auxiliar para serializar objetos do MongoDB
-def serialize_mongo(obj):
-    return json.loads(JSONEncoder().encode(obj))
-
 # Inicializar aplicação FastAPI
+# (MongoJSONResponse serializa documentos do MongoDB em uma única passagem)
 app = FastAPI(
     title="Catalogo ML API",
     description="API para extração e análise de produtos em catálogos",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=MongoJSONResponse
+)
+
+# Configuração global para tamanho máximo de upload
+# 100MB = 100 * 1024 * 1024 = 104857600 bytes
+MAX_UPLOAD_SIZE = 104857600
+
+# Limite aplicado antes da leitura do formulário multipart (registrado antes do CORS,
+# para que a resposta 413 também receba os cabeçalhos de CORS)
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_size=MAX_UPLOAD_SIZE,
+    paths=("/catalogs/", "/pdf-to-jpg/")
 )
 
 # Configurar CORS
@@ -60,22 +87,85 @@ MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DATA_DIR = os.getenv("DATA_DIR", "./data")
 ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://ml-service:5000")
 
-# Configuração global para tamanho máximo de upload
-# 100MB = 100 * 1024 * 1024 = 104857600 bytes
-MAX_UPLOAD_SIZE = 104857600
-
 # Garantir que os diretórios necessários existam
 os.makedirs(f"{DATA_DIR}/uploads", exist_ok=True)
 os.makedirs(f"{DATA_DIR}/images", exist_ok=True)
 os.makedirs(f"{DATA_DIR}/annotations", exist_ok=True)
+os.makedirs(f"{DATA_DIR}/ocr_cache", exist_ok=True)
 
 # Conexão com o MongoDB
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
 db = client.catalogo_db
 
+# Fila persistente para processamento de catálogos
+job_queue = JobQueue(db)
+
+# Cliente HTTP compartilhado (pool de conexões) para o serviço de ML
+ml_client = MLServiceClient(ML_SERVICE_URL)
+
+# Intervalo (segundos) entre consultas ao serviço ML enquanto uma detecção não termina
+DETECTION_SYNC_INTERVAL = float(os.getenv("DETECTION_SYNC_INTERVAL", "30"))
+
+# Número máximo de consultas antes de desistir de copiar o resultado de uma detecção
+DETECTION_SYNC_MAX_POLLS = int(os.getenv("DETECTION_SYNC_MAX_POLLS", "2880"))
+
+# Status finais dos jobs de detecção no serviço ML
+DETECTION_FINISHED_STATUSES = {"completed", "failed", "cancelado"}
+
+# Campos retornados na listagem de catálogos
+CATALOG_LIST_PROJECTION = {
+    "catalog_id": 1,
+    "filename": 1,
+    "upload_date": 1,
+    "status": 1,
+    "page_count": 1,
+    "file_type": 1,
+    "error_message": 1,
+    "progress": 1,
+    "deduplicated_from": 1
+}
+
+# Imagens de páginas não mudam depois de renderizadas
+PAGE_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Caches em processo para servir imagens sem consultar o MongoDB nem listar o disco:
+# catalog_id -> page_count (apenas catálogos prontos) e
+# (catalog_id, página, tamanho, aceita webp) -> metadados do arquivo.
+# Um stat confirma a entrada de imagem a cada uso: outro worker pode ter
+# excluído o catálogo ou renderizado a página de novo.
+catalog_pages_cache = LRUCache(max_entries=4096, ttl=600)
+page_image_cache = LRUCache(max_entries=16384, ttl=600)
+
+# Índices espaciais das anotações: (catalog_id, página) -> (versão, anotações, índice)
+page_spatial_cache = LRUCache(max_entries=2048, ttl=600)
+
+@app.on_event("startup")
+async def startup_event():
+    # Abrir o pool de conexões com o serviço de ML
+    await ml_client.start()
+    # Garantir os índices usados pelas consultas frequentes
+    await ensure_indexes(db)
+    # Registrar os tipos de job e iniciar os workers da fila
+    job_queue.register("process_catalog", run_process_catalog_job, on_failure=mark_catalog_failed)
+    job_queue.register("ocr_catalog", run_ocr_catalog_job, on_failure=mark_ocr_failed)
+    job_queue.register("sync_detection_results", run_sync_detection_job)
+    await job_queue.start()
+    await requeue_orphan_catalogs()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Parar os workers da fila (jobs em andamento voltam para a fila quando o heartbeat expira)
+    await job_queue.stop()
+    # Encerrar o pool de processos de renderização
+    shutdown_render_pool()
+    # Encerrar o pool de processos do OCR
+    shutdown_ocr_pool()
+    # Fechar as conexões com o serviço de ML
+    await ml_client.close()
+
 # Rotas de catalogo
 @app.post("/catalogs/", response_model=Dict[str, Any])
-async def create_catalog(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def create_catalog(file: UploadFile = File(...)):
     """
     Faz upload de um novo catálogo em PDF ou imagem (JPG, JPEG, PNG) e processa para extração.
     """
@@ -94,10 +184,9 @@ async def create_catalog(background_tasks: BackgroundTasks, file: UploadFile = F
         # Determinar a extensão
         file_extension = os.path.splitext(filename_lower)[1]
         
-        # Salvar arquivo temporariamente (mantendo a extensão original)
+        # Salvar arquivo em blocos (mantendo a extensão original)
         upload_path = f"{DATA_DIR}/uploads/{catalog_id}{file_extension}"
-        with open(upload_path, "wb") as buffer:
-            buffer.write(await file.read())
+        stored = await save_upload_stream(file, upload_path, MAX_UPLOAD_SIZE)
         
         # Criar entrada no banco de dados
         catalog_info = {
@@ -107,95 +196,286 @@ async def create_catalog(background_tasks: BackgroundTasks, file: UploadFile = F
             "status": "processing",
             "page_count": 0,
             "file_path": upload_path,
-            "file_type": file_extension[1:]  # Remover o ponto da extensão
+            "file_type": file_extension[1:],  # Remover o ponto da extensão
+            "file_size": stored.size,
+            "content_hash": stored.content_hash
         }
         
         await db.catalogs.insert_one(catalog_info)
         
-        # Agendar processamento em background
-        background_tasks.add_task(process_catalog, catalog_id, upload_path)
+        # Se o mesmo arquivo já foi processado, reaproveitar imagens e detecções
+        source_catalog = await db.catalogs.find_one(
+            {
+                "content_hash": stored.content_hash,
+                "file_type": catalog_info["file_type"],
+                "status": "ready",
+                "catalog_id": {"$ne": catalog_id}
+            },
+            sort=[("upload_date", 1)]
+        )
+        if source_catalog and await reuse_catalog_assets(source_catalog, catalog_id):
+            return {
+                "message": "Catálogo idêntico já processado anteriormente; resultados reaproveitados",
+                "catalog_id": catalog_id,
+                "deduplicated_from": source_catalog["catalog_id"]
+            }
+        
+        # Agendar processamento na fila persistente
+        job_id = await job_queue.enqueue("process_catalog", {
+            "catalog_id": catalog_id,
+            "file_path": upload_path
+        })
         
         return {
             "message": "Catálogo enviado com sucesso e está sendo processado",
-            "catalog_id": catalog_id
+            "catalog_id": catalog_id,
+            "job_id": job_id
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao processar upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar o upload: {str(e)}")
 
-async def process_catalog(catalog_id: str, file_path: str):
+async def reuse_catalog_assets(source_catalog: Dict[str, Any], catalog_id: str) -> bool:
     """
-    Processa o catálogo (PDF ou imagem), convertendo em imagens e atualizando o status.
+    Copia para o novo catálogo as páginas renderizadas, anotações e jobs de
+    detecção de um catálogo com o mesmo conteúdo. Retorna False se não for
+    possível reaproveitar (o catálogo segue então o processamento normal).
     """
+    source_id = source_catalog["catalog_id"]
+    source_images = f"{DATA_DIR}/images/{source_id}"
+    if not os.path.isdir(source_images):
+        return False
+    
     try:
-        # Obter informações do catálogo
-        catalog_info = await db.catalogs.find_one({"catalog_id": catalog_id})
-        if not catalog_info:
-            raise Exception(f"Catálogo {catalog_id} não encontrado no banco de dados")
-        
-        file_type = catalog_info.get("file_type", "pdf")  # Padrão para PDF se não especificado
+        # Hard links das imagens (fora do event loop)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, clone_page_images, source_images, f"{DATA_DIR}/images/{catalog_id}")
         
-        # Criar pasta para imagens
-        images_folder = f"{DATA_DIR}/images/{catalog_id}"
-        os.makedirs(images_folder, exist_ok=True)
-        
-        page_count = 0
+        # Copiar anotações, referências aos jobs de detecção, camada de texto e OCR das detecções
+        for collection in (db.annotations, db.detection_jobs, db.page_text, db.ocr_results):
+            documents = await collection.find({"catalog_id": source_id}).to_list(length=None)
+            for document in documents:
+                document.pop("_id", None)
+                document["catalog_id"] = catalog_id
+            if documents:
+                await collection.insert_many(documents)
         
-        # Processamento baseado no tipo de arquivo
-        if file_type == "pdf":
-            # Usar pdf2image para converter PDF para imagens
-            try:
-                images = pdf2image.convert_from_path(file_path)
-                
-                # Salvar imagens
-                for i, image in enumerate(images):
-                    image_path = f"{images_folder}/page_{i+1}.jpg"
-                    image.save(image_path, "JPEG")
-                    page_count += 1
-            except Exception as pdf_error:
-                logger.error(f"Erro ao processar PDF {catalog_id}: {str(pdf_error)}")
-                raise pdf_error
-        
-        elif file_type in ["jpg", "jpeg", "png"]:
-            # Processar arquivo de imagem único
-            try:
-                # Abrir a imagem
-                with Image.open(file_path) as img:
-                    # Salvar a imagem como JPEG para padronização
-                    image_path = f"{images_folder}/page_1.jpg"
-                    img.convert("RGB").save(image_path, "JPEG")
-                    page_count = 1
-            except Exception as img_error:
-                logger.error(f"Erro ao processar imagem {catalog_id}: {str(img_error)}")
-                raise img_error
-        
-        else:
-            raise Exception(f"Tipo de arquivo não suportado: {file_type}")
-        
-        # Atualizar status no banco de dados
         await db.catalogs.update_one(
             {"catalog_id": catalog_id},
-            {"$set": {"status": "ready", "page_count": page_count}}
+            {"$set": {
+                "status": "ready",
+                "page_count": source_catalog.get("page_count", 0),
+                "deduplicated_from": source_id
+            }}
         )
-        
-        logger.info(f"Catálogo {catalog_id} processado com sucesso. {page_count} páginas extraídas.")
-        
+        logger.info(f"Catálogo {catalog_id} reaproveitou os resultados do catálogo {source_id}")
+        return True
     except Exception as e:
-        logger.error(f"Erro ao processar catálogo {catalog_id}: {str(e)}")
-        await db.catalogs.update_one(
-            {"catalog_id": catalog_id},
-            {"$set": {"status": "error", "error_message": str(e)}}
-        )
+        logger.error(f"Erro ao reaproveitar catálogo {source_id} para {catalog_id}: {str(e)}")
+        # Descartar cópias parciais antes do processamento normal
+        shutil.rmtree(f"{DATA_DIR}/images/{catalog_id}", ignore_errors=True)
+        await db.annotations.delete_many({"catalog_id": catalog_id})
+        await db.detection_jobs.delete_many({"catalog_id": catalog_id})
+        await db.page_text.delete_many({"catalog_id": catalog_id})
+        await db.ocr_results.delete_many({"catalog_id": catalog_id})
+        return False
+
+async def process_catalog(catalog_id: str, file_path: str):
+    """
+    Processa o catálogo (PDF ou imagem), convertendo em imagens e atualizando o status.
+    
+    Erros são propagados para que a fila possa tentar novamente.
+    """
+    # Obter informações do catálogo
+    catalog_info = await db.catalogs.find_one({"catalog_id": catalog_id})
+    if not catalog_info:
+        # Catálogo excluído antes do processamento: nada a fazer
+        logger.warning(f"Catálogo {catalog_id} não encontrado no banco de dados, processamento ignorado")
+        return
+    
+    file_type = catalog_info.get("file_type", "pdf")  # Padrão para PDF se não especificado
+    
+    # Criar pasta para imagens
+    images_folder = f"{DATA_DIR}/images/{catalog_id}"
+    os.makedirs(images_folder, exist_ok=True)
+    
+    page_count = 0
+    
+    # Processamento baseado no tipo de arquivo
+    if file_type == "pdf":
+        # Renderizar o PDF em janelas de páginas, em paralelo no pool de processos
+        try:
+            async def update_progress(ready_pages: int, rendered_pages: int, total_pages: int):
+                # page_count só avança sobre páginas contíguas já disponíveis
+                await db.catalogs.update_one(
+                    {"catalog_id": catalog_id},
+                    {"$set": {
+                        "page_count": ready_pages,
+                        "progress": {
+                            "rendered_pages": rendered_pages,
+                            "total_pages": total_pages,
+                            "percentage": round(rendered_pages / total_pages * 100, 1)
+                        }
+                    }}
+                )
+            
+            image_paths = await render_pdf(file_path, images_folder, on_progress=update_progress, pyramid=True)
+            page_count = len(image_paths)
+            await store_page_text(catalog_id, file_path)
+        except Exception as pdf_error:
+            logger.error(f"Erro ao processar PDF {catalog_id}: {str(pdf_error)}")
+            raise pdf_error
+    
+    elif file_type in ["jpg", "jpeg", "png"]:
+        # Processar arquivo de imagem único
+        try:
+            # Converter a imagem para JPEG fora do event loop
+            await run_in_render_pool(convert_image_to_page, file_path, images_folder)
+            page_count = 1
+        except Exception as img_error:
+            logger.error(f"Erro ao processar imagem {catalog_id}: {str(img_error)}")
+            raise img_error
+    
+    else:
+        raise Exception(f"Tipo de arquivo não suportado: {file_type}")
+    
+    # Atualizar status no banco de dados
+    await db.catalogs.update_one(
+        {"catalog_id": catalog_id},
+        {"$set": {"status": "ready", "page_count": page_count}}
+    )
+    
+    logger.info(f"Catálogo {catalog_id} processado com sucesso. {page_count} páginas extraídas.")
+
+async def store_page_text(catalog_id: str, file_path: str):
+    """
+    Extrai e grava as palavras posicionadas de cada página do PDF.
+    
+    Uma falha aqui não interrompe o processamento: as páginas ficam sem
+    camada de texto e o OCR é usado no lugar.
+    """
+    try:
+        pages = await run_in_render_pool(extract_text_layer, file_path)
+    except Exception as e:
+        logger.error(f"Erro ao extrair a camada de texto do catálogo {catalog_id}: {str(e)}")
+        return
+    
+    documents = [
+        {"catalog_id": catalog_id, "page_number": page_number, **page}
+        for page_number, page in sorted(pages.items())
+    ]
+    # Substituir o que houver de uma tentativa anterior
+    await db.page_text.delete_many({"catalog_id": catalog_id})
+    if documents:
+        await db.page_text.insert_many(documents)
+    
+    text_pages = sum(1 for document in documents if document["has_text_layer"])
+    logger.info(f"Catálogo {catalog_id}: camada de texto em {text_pages} de {len(documents)} páginas")
+
+async def run_process_catalog_job(payload: Dict[str, Any]):
+    """
+    Executa um job "process_catalog" da fila.
+    """
+    await process_catalog(payload["catalog_id"], payload["file_path"])
+
+async def mark_catalog_failed(payload: Dict[str, Any], error: str):
+    """
+    Marca o catálogo como erro quando o job esgota todas as tentativas.
+    """
+    logger.error(f"Erro ao processar catálogo {payload['catalog_id']}: {error}")
+    await db.catalogs.update_one(
+        {"catalog_id": payload["catalog_id"]},
+        {"$set": {"status": "error", "error_message": error}}
+    )
+
+async def requeue_orphan_catalogs():
+    """
+    Agenda novamente catálogos em "processing" que não têm job ativo na fila
+    (por exemplo, uploads feitos antes da fila existir).
+    """
+    async for catalog in db.catalogs.find({"status": "processing"}, {"catalog_id": 1, "file_path": 1}):
+        active_job = await job_queue.collection.find_one({
+            "type": "process_catalog",
+            "payload.catalog_id": catalog["catalog_id"],
+            "status": {"$in": ["queued", "processing"]}
+        })
+        if not active_job:
+            await job_queue.enqueue("process_catalog", {
+                "catalog_id": catalog["catalog_id"],
+                "file_path": catalog.get("file_path")
+            })
+            logger.info(f"Catálogo {catalog['catalog_id']} reagendado para processamento")
+
+def encode_catalog_cursor(catalog: Dict[str, Any]) -> str:
+    """
+    Gera o cursor opaco (upload_date + _id) que aponta para depois deste catálogo.
+    """
+    raw = json.dumps([catalog.get("upload_date"), str(catalog["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_catalog_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Converte o cursor em um filtro de keyset para a ordenação (upload_date, _id) decrescente.
+    """
+    try:
+        upload_date, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        object_id = ObjectId(object_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    
+    return {"$or": [
+        {"upload_date": {"$lt": upload_date}},
+        {"upload_date": upload_date, "_id": {"$lt": object_id}}
+    ]}
 
 @app.get("/catalogs/", response_model=List[Dict[str, Any]])
-async def list_catalogs():
+async def list_catalogs(
+    limit: int = Query(100, ge=1, le=500, description="Quantidade máxima de catálogos na página"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado no cabeçalho X-Next-Cursor"),
+    status: Optional[str] = Query(None, description="Filtrar por status (processing, ready, error)"),
+    filename: Optional[str] = Query(None, description="Filtrar por parte do nome do arquivo")
+):
     """
-    Lista todos os catálogos disponíveis.
+    Lista os catálogos, dos mais recentes para os mais antigos.
+    
+    A paginação é por keyset: o cabeçalho X-Next-Cursor traz o cursor da
+    próxima página (ausente na última), X-Total-Count o total de catálogos
+    que atendem aos filtros e X-Total-Pages a soma das páginas desses catálogos.
     """
-    catalogs = await db.catalogs.find().to_list(length=100)
-    # Converter ObjectIds para strings
-    return serialize_mongo(catalogs)
+    filters: Dict[str, Any] = {}
+    if status:
+        filters["status"] = status
+    if filename:
+        filters["filename"] = {"$regex": re.escape(filename), "$options": "i"}
+    
+    query = dict(filters)
+    if cursor:
+        query.update(decode_catalog_cursor(cursor))
+    
+    # Buscar um item a mais para saber se existe próxima página
+    catalogs = await db.catalogs.find(query, CATALOG_LIST_PROJECTION) \
+        .sort([("upload_date", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .to_list(length=limit + 1)
+    
+    headers = {}
+    if len(catalogs) > limit:
+        catalogs = catalogs[:limit]
+        headers["X-Next-Cursor"] = encode_catalog_cursor(catalogs[-1])
+    
+    # Totais de todos os catálogos filtrados, não apenas os desta página
+    totals = await db.catalogs.aggregate([
+        {"$match": filters},
+        {"$group": {"_id": None, "catalogs": {"$sum": 1}, "pages": {"$sum": "$page_count"}}}
+    ]).to_list(length=1)
+    totals = totals[0] if totals else {}
+    headers["X-Total-Count"] = str(totals.get("catalogs", 0))
+    headers["X-Total-Pages"] = str(totals.get("pages", 0))
+    
+    return MongoJSONResponse(catalogs, headers=headers)
 
 @app.get("/catalogs/{catalog_id}", response_model=Dict[str, Any])
 async def get_catalog(catalog_id: str):
@@ -206,8 +486,7 @@ async def get_catalog(catalog_id: str):
     if not catalog:
         raise HTTPException(status_code=404, detail="Catálogo não encontrado")
     
-    # Converter ObjectIds para strings
-    return serialize_mongo(catalog)
+    return MongoJSONResponse(catalog)
 
 @app.delete("/catalogs/{catalog_id}", response_model=Dict[str, Any])
 async def delete_catalog(catalog_id: str):
@@ -222,9 +501,12 @@ async def delete_catalog(catalog_id: str):
     try:
         # Remover registro do banco de dados
         await db.catalogs.delete_one({"catalog_id": catalog_id})
+        invalidate_catalog_caches(catalog_id)
         
-        # Remover anotações relacionadas
+        # Remover anotações, camada de texto e OCR relacionados
         await db.annotations.delete_many({"catalog_id": catalog_id})
+        await db.page_text.delete_many({"catalog_id": catalog_id})
+        await db.ocr_results.delete_many({"catalog_id": catalog_id})
         
         # Remover arquivos
         pdf_path = catalog.get("file_path")
@@ -256,118 +538,235 @@ async def list_catalog_pages(catalog_id: str):
     for i in range(1, catalog.get("page_count", 0) + 1):
         pages.append({
             "page_number": i,
-            "image_path": f"/api/catalogs/{catalog_id}/pages/{i}/image"
+            "image_path": f"/api/catalogs/{catalog_id}/pages/{i}/image",
+            "thumbnail_path": f"/api/catalogs/{catalog_id}/pages/{i}/image?size=thumb"
         })
     
-    # Converter ObjectIds para strings se necessário
-    return serialize_mongo(pages)
+    return MongoJSONResponse(pages)
+
+def invalidate_catalog_caches(catalog_id: str):
+    """
+    Remove do cache em processo os dados de páginas de um catálogo.
+    """
+    catalog_pages_cache.discard(catalog_id)
+    page_image_cache.discard_where(lambda key: key[0] == catalog_id)
+    page_spatial_cache.discard_where(lambda key: key[0] == catalog_id)
+
+async def get_ready_page_count(catalog_id: str) -> Optional[int]:
+    """
+    Retorna o número de páginas disponíveis do catálogo (None se não existir).
+    
+    Catálogos prontos ficam em cache; catálogos em processamento são sempre
+    consultados no MongoDB, pois o page_count ainda está aumentando.
+    """
+    page_count = catalog_pages_cache.get(catalog_id)
+    if page_count is not None:
+        return page_count
+    
+    catalog = await db.catalogs.find_one({"catalog_id": catalog_id}, {"page_count": 1, "status": 1})
+    if not catalog:
+        return None
+    
+    page_count = catalog.get("page_count", 0)
+    if catalog.get("status") == "ready":
+        catalog_pages_cache.set(catalog_id, page_count)
+    return page_count
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Verifica se o cabeçalho If-None-Match corresponde ao ETag (comparação fraca).
+    """
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(candidate.replace("W/", "", 1) == etag for candidate in candidates)
+
+def page_image_current(image_info: Dict[str, Any]) -> bool:
+    """
+    Indica se o arquivo da entrada em cache ainda existe e não foi substituído.
+    """
+    try:
+        stat_result = os.stat(image_info["path"])
+    except FileNotFoundError:
+        return False
+    cached = image_info["stat_result"]
+    return stat_result.st_mtime_ns == cached.st_mtime_ns and stat_result.st_size == cached.st_size
 
 @app.get("/catalogs/{catalog_id}/pages/{page_number}/image")
-async def get_catalog_page_image(catalog_id: str, page_number: int):
+async def get_catalog_page_image(
+    catalog_id: str,
+    page_number: int,
+    request: Request,
+    size: str = Query("full", regex="^(thumb|preview|full)$", description="Tamanho da imagem: thumb, preview ou full")
+):
     """
     Obtém a imagem de uma página específica de um catálogo.
+    
+    As variantes "thumb" e "preview" são servidas em WebP quando o navegador aceita.
+    As respostas têm cache imutável e suportam requisições condicionais (If-None-Match).
     """
-    # Verificar se o catálogo existe
-    catalog = await db.catalogs.find_one({"catalog_id": catalog_id})
-    if not catalog:
-        raise HTTPException(status_code=404, detail="Catálogo não encontrado")
+    accepts_webp = "image/webp" in request.headers.get("accept", "")
+    cache_key = (catalog_id, page_number, size, accepts_webp)
+    image_info = page_image_cache.get(cache_key)
+    if image_info is not None and not page_image_current(image_info):
+        page_image_cache.discard(cache_key)
+        image_info = None
     
-    # Verificar se a página existe
-    if page_number < 1 or page_number > catalog.get("page_count", 0):
-        raise HTTPException(status_code=404, detail="Página não encontrada")
+    if image_info is None:
+        # Verificar se o catálogo existe e se a página existe
+        page_count = await get_ready_page_count(catalog_id)
+        if page_count is None:
+            raise HTTPException(status_code=404, detail="Catálogo não encontrado")
+        if page_number < 1 or page_number > page_count:
+            raise HTTPException(status_code=404, detail="Página não encontrada")
+        
+        images_folder = f"{DATA_DIR}/images/{catalog_id}"
+        
+        # Candidatos em ordem de preferência; catálogos antigos só têm a imagem original
+        candidates = []
+        if size in PAGE_IMAGE_SIZES:
+            if accepts_webp:
+                candidates.append((page_image_filename(page_number, size, "webp"), "image/webp"))
+            candidates.append((page_image_filename(page_number, size), "image/jpeg"))
+        candidates.append((page_image_filename(page_number), "image/jpeg"))
+        
+        for filename, media_type in candidates:
+            image_path = f"{images_folder}/{filename}"
+            try:
+                stat_result = os.stat(image_path)
+            except FileNotFoundError:
+                continue
+            
+            image_info = {
+                "path": image_path,
+                "media_type": media_type,
+                "stat_result": stat_result,
+                "etag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+                "last_modified": formatdate(stat_result.st_mtime, usegmt=True)
+            }
+            page_image_cache.set(cache_key, image_info)
+            break
+        else:
+            raise HTTPException(status_code=404, detail="Imagem não encontrada")
     
-    # Caminho da imagem
-    image_path = f"{DATA_DIR}/images/{catalog_id}/page_{page_number}.jpg"
+    headers = {
+        "ETag": image_info["etag"],
+        "Last-Modified": image_info["last_modified"],
+        "Cache-Control": PAGE_IMAGE_CACHE_CONTROL,
+        "Vary": "Accept"
+    }
     
-    # Verificar se a imagem existe
-    if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    # Requisição condicional: o navegador já tem esta versão da imagem
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, image_info["etag"]):
+        return Response(status_code=304, headers=headers)
     
     # Retornar a imagem
-    return FileResponse(image_path, media_type="image/jpeg")
+    return FileResponse(
+        image_info["path"],
+        media_type=image_info["media_type"],
+        headers=headers,
+        stat_result=image_info["stat_result"]
+    )
+
+async def fetch_job_detections(catalog_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Busca as detecções do job mais recente do catálogo.
+    
+    Usa a cópia gravada em ``detection_jobs`` quando existir; caso contrário
+    consulta o serviço ML e grava a cópia se o job tiver terminado.
+    Retorna None se não houver job registrado ou se o job ainda não tiver sido
+    concluído com resultados (pendente, em andamento ou com falha), para que
+    a rota recorra às anotações manuais.
+    """
+    detection_job = await db.detection_jobs.find_one(
+        {"catalog_id": catalog_id},
+        {"job_id": 1, "results": 1},
+        sort=[("created_at", -1)]
+    )
+    if not detection_job or not detection_job.get("job_id"):
+        return None
+    
+    results = detection_job.get("results")
+    if results is None:
+        job_id = detection_job["job_id"]
+        try:
+            response = await ml_client.get(f"/results/{job_id}", timeout=RESULTS_TIMEOUT)
+        except httpx.RequestError as e:
+            logger.error(f"Erro ao buscar resultados do job {job_id}: {str(e)}")
+            return None
+        
+        if response.status_code != 200:
+            return None
+        
+        job_result = response.json()
+        await store_detection_result(job_id, job_result)
+        results = job_result.get("results")
+        if job_result.get("status") != "completed" or not isinstance(results, list):
+            return None
+    
+    # Formatar as detecções para a resposta esperada pelo frontend
+    all_annotations = []
+    for page_result in results:
+        for annotation in page_result.get("annotations", []):
+            # Adicionar informações da página ao objeto de anotação
+            annotation["page_number"] = page_result.get("page_number", 1)
+            annotation["image_url"] = page_result.get("image_url", "")
+            all_annotations.append(annotation)
+    return all_annotations
+
+async def fetch_manual_annotations(catalog_id: str, annotation_type: str = "produto") -> List[Dict[str, Any]]:
+    """
+    Retorna, em uma única agregação, as anotações manuais de um tipo em todas as páginas do catálogo.
+    """
+    pipeline = [
+        {"$match": {"catalog_id": catalog_id}},
+        {"$sort": {"page_number": 1}},
+        {"$unwind": "$annotations"},
+        {"$match": {"annotations.type": annotation_type}},
+        {"$project": {"_id": 0, "page_number": 1, "annotation": "$annotations"}}
+    ]
+    
+    annotations = []
+    async for item in db.annotations.aggregate(pipeline):
+        annotation = item["annotation"]
+        page_number = item.get("page_number", 1)
+        # Adicionar informação da página
+        annotation["page_number"] = page_number
+        annotation["image_url"] = f"/catalogs/{catalog_id}/pages/{page_number}/image"
+        annotations.append(annotation)
+    return annotations
 
 @app.get("/catalogs/{catalog_id}/detection", response_model=Dict[str, Any])
 async def get_catalog_detection(catalog_id: str):
     """
     Obtém as detecções de um catálogo específico.
+    
+    Usa o job de detecção mais recente registrado para o catálogo; se não
+    houver resultados, recorre às anotações manuais de produtos.
     """
     # Verificar se o catálogo existe
-    catalog = await db.catalogs.find_one({"catalog_id": catalog_id})
+    catalog = await db.catalogs.find_one({"catalog_id": catalog_id}, {"_id": 1})
     if not catalog:
         raise HTTPException(status_code=404, detail="Catálogo não encontrado")
     
-    # Tentar diferentes formatos de job_id
-    possible_job_ids = [
-        f"detection_job_{catalog_id}",  # Formato padrão
-        catalog_id,                      # O próprio catalog_id
-    ]
-    
-    # Buscar na coleção de jobs se existe algum job para este catálogo
-    detection_job = await db.detection_jobs.find_one({"catalog_id": catalog_id}, sort=[("created_at", -1)])
-    if detection_job and "job_id" in detection_job:
-        possible_job_ids.insert(0, detection_job["job_id"])  # Adiciona o job_id mais recente
-    
-    # Log dos job_ids que serão testados
-    print(f"Tentando recuperar resultados para o catálogo {catalog_id} com os seguintes job_ids: {possible_job_ids}")
-    
-    # Tentar cada job_id em sucessão
-    for job_id in possible_job_ids:
-        try:
-            # Chamar o serviço ML para buscar as detecções com este job_id
-            async with httpx.AsyncClient() as client:
-                print(f"Tentando buscar resultados com job_id: {job_id}")
-                response = await client.get(f"{ML_SERVICE_URL}/results/{job_id}")
-                
-                if response.status_code == 200:
-                    result_data = response.json()
-                    
-                    # Formatar as detecções para a resposta esperada pelo frontend
-                    all_annotations = []
-                    
-                    for page_result in result_data.get("results", []):
-                        for annotation in page_result.get("annotations", []):
-                            # Adicionar informações da página ao objeto de anotação
-                            annotation["page_number"] = page_result.get("page_number", 1)
-                            annotation["image_url"] = page_result.get("image_url", "")
-                            all_annotations.append(annotation)
-                    
-                    return {
-                        "catalog_id": catalog_id,
-                        "annotations": all_annotations
-                    }
-        except httpx.RequestError as e:
-            print(f"Erro ao tentar job_id {job_id}: {str(e)}")
-            continue
+    annotations = await fetch_job_detections(catalog_id)
+    if annotations is not None:
+        return MongoJSONResponse({
+            "catalog_id": catalog_id,
+            "annotations": annotations
+        })
     
-    # Se nenhum dos job_ids funcionou, tentar buscar anotações manuais
+    # Sem resultados do serviço ML: buscar anotações manuais
     try:
-        annotations = []
-        # Buscar as páginas do catálogo
-        pages = await db.pages.find({"catalog_id": catalog_id}).to_list(1000)
-        
-        for page in pages:
-            page_number = page.get("page_number", 1)
-            # Buscar anotações para esta página
-            page_annotations = await db.annotations.find_one({
-                "catalog_id": catalog_id,
-                "page_number": page_number
-            })
-            
-            if page_annotations and "annotations" in page_annotations:
-                for annotation in page_annotations["annotations"]:
-                    if annotation.get("type") == "produto":
-                        # Adicionar informação da página
-                        annotation["page_number"] = page_number
-                        annotation["image_url"] = f"/catalogs/{catalog_id}/pages/{page_number}/image"
-                        annotations.append(annotation)
-        
+        annotations = await fetch_manual_annotations(catalog_id)
         if annotations:
-            return {
+            return MongoJSONResponse({
                 "catalog_id": catalog_id,
                 "annotations": annotations
-            }
+            })
     except Exception as e:
-        print(f"Erro ao buscar anotações manuais: {str(e)}")
+        logger.error(f"Erro ao buscar anotações manuais: {str(e)}")
     
     # Se chegou aqui, não encontrou nenhum resultado
     raise HTTPException(
@@ -390,23 +789,49 @@ async def create_annotation(annotation: AnnotationSchema):
     annotation_data = annotation.dict()
     annotation_data["timestamp"] = datetime.now().isoformat()
     
-    # Verificar se já existe anotação para essa página
-    existing = await db.annotations.find_one({
-        "catalog_id": annotation.catalog_id,
-        "page_number": annotation.page_number
-    })
+    # Coordenadas limitadas à página: caixas que passam da borda são
+    # recortadas e caixas fora da página são recusadas
+    loop = asyncio.get_running_loop()
+    page_size = await loop.run_in_executor(
+        None, page_image_size, f"{DATA_DIR}/images/{annotation.catalog_id}", annotation.page_number
+    )
+    if page_size is None:
+        raise HTTPException(status_code=404, detail="Página não encontrada")
+    width, height = page_size
+    for item in annotation_data["annotations"]:
+        bbox = clip_bbox(item["bbox"], width, height)
+        if bbox is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A anotação {item['id']} está fora dos limites da página ({width}x{height} px)"
+            )
+        item["bbox"] = bbox
     
-    if existing:
-        # Atualizar anotação existente
-        result = await db.annotations.update_one(
-            {"_id": existing["_id"]},
-            {"$set": annotation_data}
+    # Upsert atômico pela chave única (catalog_id, page_number): duas
+    # requisições simultâneas para a mesma página não podem inserir duas vezes
+    page_filter = {"catalog_id": annotation.catalog_id, "page_number": annotation.page_number}
+    try:
+        previous = await db.annotations.find_one_and_update(
+            page_filter,
+            {"$set": annotation_data},
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
         )
-        return serialize_mongo({"success": True, "updated": True, "id": str(existing["_id"])})
-    else:
-        # Inserir nova anotação
-        result = await db.annotations.insert_one(annotation_data)
-        return serialize_mongo({"success": True, "updated": False, "id": str(result.inserted_id)})
+    except DuplicateKeyError:
+        # Outra requisição inseriu a página entre a busca e a inserção do upsert
+        previous = await db.annotations.find_one_and_update(
+            page_filter,
+            {"$set": annotation_data},
+            projection={"_id": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+    
+    if previous:
+        return MongoJSONResponse({"success": True, "updated": True, "id": str(previous["_id"])})
+    
+    inserted = await db.annotations.find_one(page_filter, {"_id": 1})
+    return MongoJSONResponse({"success": True, "updated": False, "id": str(inserted["_id"])})
 
 @app.get("/annotations/{catalog_id}/{page_number}", response_model=Dict[str, Any])
 async def get_annotation(catalog_id: str, page_number: int):
@@ -421,14 +846,86 @@ async def get_annotation(catalog_id: str, page_number: int):
     
     if not annotation:
         # Retornar estrutura vazia se não houver anotação
-        return serialize_mongo({
+        return MongoJSONResponse({
             "catalog_id": catalog_id,
             "page_number": page_number,
             "annotations": []
         })
     
-    # Converter ObjectIds para strings
-    return serialize_mongo(annotation)
+    return MongoJSONResponse(annotation)
+
+@app.get("/catalogs/{catalog_id}/annotations", response_model=List[Dict[str, Any]])
+async def list_catalog_annotations(catalog_id: str, since: Optional[str] = None):
+    """
+    Lista as anotações de todas as páginas de um catálogo (usado no treinamento).
+    
+    Com ``since`` (data ISO), retorna apenas as páginas anotadas depois dessa data.
+    """
+    query: Dict[str, Any] = {"catalog_id": catalog_id}
+    if since:
+        query["timestamp"] = {"$gt": since}
+    
+    cursor = db.annotations.find(query, {"_id": 0}).sort("page_number", 1)
+    return MongoJSONResponse(await cursor.to_list(length=None))
+
+async def get_page_spatial_index(catalog_id: str, page_number: int):
+    """
+    Anotações da página e o índice espacial sobre elas.
+    
+    O índice fica em cache enquanto a página não muda: a cada consulta só os
+    campos de versão do documento são lidos do MongoDB.
+    """
+    cache_key = (catalog_id, page_number)
+    query = {"catalog_id": catalog_id, "page_number": page_number}
+    version_doc = await db.annotations.find_one(query, {"_id": 0, "timestamp": 1, "ocr_timestamp": 1})
+    if not version_doc:
+        page_spatial_cache.discard(cache_key)
+        return [], SpatialIndex.from_items([])
+    
+    version = (version_doc.get("timestamp"), version_doc.get("ocr_timestamp"))
+    cached = page_spatial_cache.get(cache_key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    
+    document = await db.annotations.find_one(query, {"_id": 0, "annotations": 1, "timestamp": 1, "ocr_timestamp": 1})
+    annotations = (document or {}).get("annotations") or []
+    index = SpatialIndex.from_annotations(annotations)
+    if document:
+        page_spatial_cache.set(cache_key, (
+            (document.get("timestamp"), document.get("ocr_timestamp")), annotations, index
+        ))
+    return annotations, index
+
+@app.get("/catalogs/{catalog_id}/pages/{page_number}/annotations", response_model=Dict[str, Any])
+async def query_page_annotations(
+    catalog_id: str,
+    page_number: int,
+    x: Optional[int] = None,
+    y: Optional[int] = None,
+    w: int = Query(0, ge=0),
+    h: int = Query(0, ge=0)
+):
+    """
+    Anotações de uma página que cruzam a região (x, y, w, h), em pixels da imagem.
+    
+    Com ``w`` e ``h`` iguais a zero, a região é o ponto (x, y) (ex.: um
+    clique). Sem ``x`` e ``y``, retorna todas as anotações da página.
+    """
+    if (x is None) != (y is None):
+        raise HTTPException(status_code=400, detail="Informe x e y juntos")
+    
+    annotations, index = await get_page_spatial_index(catalog_id, page_number)
+    if x is None:
+        matches = annotations
+    else:
+        matches = [annotations[i] for i in index.query(x, y, x + w, y + h)]
+    
+    return MongoJSONResponse({
+        "catalog_id": catalog_id,
+        "page_number": page_number,
+        "total": len(annotations),
+        "annotations": matches
+    })
 
 @app.post("/detect/{catalog_id}", response_model=Dict[str, Any])
 async def detect_products(catalog_id: str, request: Request):
@@ -436,41 +933,70 @@ async def detect_products(catalog_id: str, request: Request):
     Detecta produtos em um catálogo.
     """
     try:
-        # Extrair dados do corpo da requisição (se houver)
+        # Extrair e validar os dados do corpo da requisição (se houver)
         body = await request.json() if request.headers.get("content-type") == "application/json" else {}
-        min_confidence = body.get("min_confidence", 0.5)
-        detect_classes = body.get("detect_classes", ["produto"])
+        try:
+            options = ProductDetectionSchema.parse_obj({**body, "catalog_id": catalog_id})
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+        min_confidence = options.min_confidence
+        detect_classes = [detection_class.value for detection_class in options.detect_classes or []]
+        # Inferência em tiles (opcional); os limites de tamanho são validados pelo serviço ML
+        tile_options = {
+            key: getattr(options, key) for key in ("tile_size", "tile_overlap") if getattr(options, key) is not None
+        }
         
         print(f"Detectando produtos no catálogo {catalog_id}")
         print(f"min_confidence: {min_confidence}")
         print(f"detect_classes: {detect_classes}")
         
-        async with httpx.AsyncClient() as client:
-            # Modificando para usar a rota correta com o catalog_id na URL
-            json_data = {
-                "min_confidence": min_confidence,
-                "detect_classes": detect_classes
-            }
-            print(f"Enviando para ML Service: {json_data}")
-            print(f"URL do ML Service: {ML_SERVICE_URL}/detect/{catalog_id}")
+        # Modificando para usar a rota correta com o catalog_id na URL
+        json_data = {
+            "min_confidence": min_confidence,
+            "detect_classes": detect_classes,
+            **tile_options
+        }
+        print(f"Enviando para ML Service: {json_data}")
+        print(f"URL do ML Service: {ML_SERVICE_URL}/detect/{catalog_id}")
+        
+        response = await ml_client.post(
+            f"/detect/{catalog_id}",
+            json=json_data,
+            timeout=DETECT_TIMEOUT
+        )
+        
+        print(f"Response from ML service: {response.status_code} - {response.text}")
+        
+        # O serviço ML aceita o job imediatamente (202) e processa em background
+        if response.status_code in (200, 202):
+            # Registrar o job para que as detecções do catálogo sejam encontradas depois
+            job_data = response.json()
+            if job_data.get("job_id"):
+                await db.detection_jobs.insert_one({
+                    "catalog_id": catalog_id,
+                    "job_id": job_data["job_id"],
+                    "status": job_data.get("status", "pending"),
+                    "min_confidence": min_confidence,
+                    "detect_classes": detect_classes,
+                    **tile_options,
+                    "created_at": datetime.now().isoformat()
+                })
+                # Copiar o resultado para o MongoDB antes que expire no serviço ML
+                await job_queue.enqueue(
+                    "sync_detection_results",
+                    {"job_id": job_data["job_id"]},
+                    delay=DETECTION_SYNC_INTERVAL
+                )
             
-            response = await client.post(
-                f"{ML_SERVICE_URL}/detect/{catalog_id}",
-                json=json_data,
-                timeout=30.0
+            # Repassar o JSON do serviço ML sem codificar novamente
+            return Response(content=response.content, status_code=response.status_code, media_type="application/json")
+        else:
+            error_detail = f"Erro no serviço ML: {response.text}"
+            print(f"ERRO: {error_detail}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=error_detail
             )
-            
-            print(f"Response from ML service: {response.status_code} - {response.text}")
-            
-            if response.status_code == 200:
-                return serialize_mongo(response.json())
-            else:
-                error_detail = f"Erro no serviço ML: {response.text}"
-                print(f"ERRO: {error_detail}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=error_detail
-                )
     except httpx.RequestError as e:
         error_message = f"Erro ao comunicar com serviço ML: {str(e)}"
         print(f"ERRO DE CONEXÃO: {error_message}")
@@ -482,16 +1008,27 @@ async def get_detection_status(job_id: str):
     Verifica o status de um job de detecção.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{ML_SERVICE_URL}/detect/status/{job_id}")
-            
-            if response.status_code == 200:
-                return serialize_mongo(response.json())
-            else:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Erro no serviço ML: {response.text}"
-                )
+        response = await ml_client.get(f"/detect/status/{job_id}", timeout=STATUS_TIMEOUT)
+        
+        if response.status_code == 200:
+            # Repassar o JSON do serviço ML sem decodificar e codificar novamente
+            return Response(content=response.content, media_type="application/json")
+        
+        # O serviço ML remove jobs finalizados após algum tempo; usar a cópia gravada
+        stored_job = await find_stored_detection_job(job_id)
+        if response.status_code == 404 and stored_job:
+            return {
+                "job_id": job_id,
+                "status": stored_job["status"],
+                "created_at": stored_job.get("created_at"),
+                "updated_at": stored_job.get("completed_at") or stored_job.get("synced_at"),
+                "error": None
+            }
+        else:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Erro no serviço ML: {response.text}"
+            )
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Erro ao comunicar com serviço ML: {str(e)}")
 
@@ -500,20 +1037,338 @@ async def get_detection_results(job_id: str):
     """
     Obtém os resultados de uma detecção.
     """
+    # Resultados já copiados para o MongoDB não dependem do serviço ML
+    stored_job = await find_stored_detection_job(job_id)
+    if stored_job and "results" in stored_job:
+        return {
+            "job_id": job_id,
+            "status": stored_job["status"],
+            "created_at": stored_job.get("created_at"),
+            "completed_at": stored_job.get("completed_at"),
+            "results": stored_job["results"]
+        }
+    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{ML_SERVICE_URL}/results/{job_id}")
-            
-            if response.status_code == 200:
-                return serialize_mongo(response.json())
-            else:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Erro no serviço ML: {response.text}"
-                )
+        response = await ml_client.get(f"/results/{job_id}", timeout=RESULTS_TIMEOUT)
+        
+        if response.status_code == 200:
+            # Repassar o JSON do serviço ML sem decodificar e codificar novamente
+            return Response(content=response.content, media_type="application/json")
+        else:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Erro no serviço ML: {response.text}"
+            )
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Erro ao comunicar com serviço ML: {str(e)}")
 
+async def find_stored_detection_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna o job de detecção gravado em ``detection_jobs`` se ele já tiver terminado.
+    """
+    return await db.detection_jobs.find_one(
+        {"job_id": job_id, "status": {"$in": list(DETECTION_FINISHED_STATUSES)}},
+        {"_id": 0}
+    )
+
+async def store_detection_result(job_id: str, job_result: Dict[str, Any]):
+    """
+    Copia para ``detection_jobs`` o resultado de um job de detecção que terminou.
+    
+    O serviço ML remove jobs finalizados após ``JOB_TTL_SECONDS``; com a cópia,
+    as detecções do catálogo continuam disponíveis depois disso. Todos os
+    registros do job são atualizados (catálogos duplicados compartilham o job).
+    """
+    status = job_result.get("status")
+    if status not in DETECTION_FINISHED_STATUSES:
+        return
+    
+    fields = {"status": status, "synced_at": datetime.now().isoformat()}
+    if job_result.get("completed_at"):
+        fields["completed_at"] = job_result["completed_at"]
+    if status == "completed" and isinstance(job_result.get("results"), list):
+        fields["results"] = job_result["results"]
+    await db.detection_jobs.update_many({"job_id": job_id}, {"$set": fields})
+
+async def run_sync_detection_job(payload: Dict[str, Any]):
+    """
+    Executa um job "sync_detection_results" da fila.
+    
+    Consulta o job de detecção no serviço ML e grava o resultado quando ele
+    termina; enquanto isso, agenda uma nova consulta para daqui a
+    ``DETECTION_SYNC_INTERVAL`` segundos (até ``DETECTION_SYNC_MAX_POLLS`` consultas).
+    """
+    job_id = payload["job_id"]
+    polls = payload.get("polls", 0) + 1
+    
+    # Catálogo excluído ou resultado já copiado (por exemplo, por uma leitura)
+    if not await db.detection_jobs.find_one({"job_id": job_id}, {"_id": 1}):
+        return
+    if await find_stored_detection_job(job_id):
+        return
+    
+    try:
+        response = await ml_client.get(f"/results/{job_id}", timeout=RESULTS_TIMEOUT)
+    except httpx.RequestError as e:
+        logger.error(f"Erro ao consultar o job de detecção {job_id}: {str(e)}")
+        response = None
+    
+    if response is not None and response.status_code == 404:
+        logger.error(f"Job de detecção {job_id} não existe mais no serviço ML")
+        return
+    if response is not None and response.status_code == 200:
+        job_result = response.json()
+        if job_result.get("status") in DETECTION_FINISHED_STATUSES:
+            await store_detection_result(job_id, job_result)
+            return
+    
+    if polls >= DETECTION_SYNC_MAX_POLLS:
+        logger.error(f"Resultado do job de detecção {job_id} não copiado após {polls} consultas")
+        return
+    await job_queue.enqueue(
+        "sync_detection_results",
+        {"job_id": job_id, "polls": polls},
+        delay=DETECTION_SYNC_INTERVAL
+    )
+
+@app.get("/catalogs/{catalog_id}/pages/{page_number}/text", response_model=Dict[str, Any])
+async def get_page_text(catalog_id: str, page_number: int):
+    """
+    Retorna as palavras da camada de texto de uma página (coordenadas em pixels da imagem).
+    """
+    page_text = await db.page_text.find_one({"catalog_id": catalog_id, "page_number": page_number}, {"_id": 0})
+    if not page_text:
+        raise HTTPException(status_code=404, detail="Camada de texto não encontrada para esta página")
+    return MongoJSONResponse(page_text)
+
+# Rotas de OCR
+@app.post("/catalogs/{catalog_id}/ocr", response_model=Dict[str, Any])
+async def start_catalog_ocr(catalog_id: str):
+    """
+    Agenda o OCR dos produtos anotados (ou detectados) em um catálogo.
+    
+    O texto, a confiança e o preço encontrado são gravados no ``metadata``
+    de cada anotação do tipo produto. Catálogos sem anotações usam as
+    detecções do job mais recente, e o resultado fica na coleção
+    ``ocr_results`` (ver ``GET /catalogs/{catalog_id}/ocr``), sem criar
+    anotações. Páginas de PDF com camada de texto usam as palavras do
+    próprio arquivo, sem OCR.
+    """
+    catalog = await db.catalogs.find_one({"catalog_id": catalog_id}, {"status": 1, "ocr_status": 1})
+    if not catalog:
+        raise HTTPException(status_code=404, detail="Catálogo não encontrado")
+    if catalog.get("status") != "ready":
+        raise HTTPException(status_code=409, detail="O catálogo ainda não foi processado")
+    if (catalog.get("ocr_status") or {}).get("status") in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail="Já existe um OCR em andamento para este catálogo")
+    
+    job_id = await job_queue.enqueue("ocr_catalog", {"catalog_id": catalog_id})
+    await db.catalogs.update_one(
+        {"catalog_id": catalog_id},
+        {"$set": {"ocr_status": {"status": "queued", "job_id": job_id}}}
+    )
+    return MongoJSONResponse({"catalog_id": catalog_id, "job_id": job_id, "status": "queued"}, status_code=202)
+
+@app.get("/catalogs/{catalog_id}/ocr", response_model=Dict[str, Any])
+async def get_catalog_ocr(catalog_id: str):
+    """
+    Situação do OCR do catálogo e, quando ele foi feito sobre as detecções
+    (catálogo sem anotações), o resultado por página.
+    """
+    catalog = await db.catalogs.find_one({"catalog_id": catalog_id}, {"ocr_status": 1})
+    if not catalog:
+        raise HTTPException(status_code=404, detail="Catálogo não encontrado")
+    
+    pages = await db.ocr_results.find({"catalog_id": catalog_id}, {"_id": 0}).sort("page_number", 1).to_list(length=None)
+    return MongoJSONResponse({
+        "catalog_id": catalog_id,
+        "ocr_status": catalog.get("ocr_status"),
+        "pages": pages
+    })
+
+async def load_ocr_sources(catalog_id: str) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Coleção onde o resultado do OCR será gravado e os documentos de entrada.
+    
+    Com anotações salvas, o OCR é gravado nas próprias anotações. Sem elas,
+    as detecções do job mais recente são copiadas para ``ocr_results``: as
+    detecções não são anotações revisadas e não podem aparecer na API de
+    anotações nem no treinamento.
+    """
+    documents = await db.annotations.find({"catalog_id": catalog_id}).sort("page_number", 1).to_list(length=None)
+    if documents:
+        return db.annotations, documents
+    
+    detections = await fetch_job_detections(catalog_id)
+    if not detections:
+        return db.ocr_results, []
+    
+    annotations_by_page: Dict[int, List[Dict[str, Any]]] = {}
+    for detection in detections:
+        page_number = detection.pop("page_number", 1)
+        detection.pop("image_url", None)
+        annotations_by_page.setdefault(page_number, []).append(detection)
+    
+    # Substitui o resultado anterior: as detecções podem ser de um job mais novo
+    timestamp = datetime.now().isoformat()
+    documents = [
+        {
+            "catalog_id": catalog_id,
+            "page_number": page_number,
+            "source": "detection",
+            "annotations": annotations,
+            "timestamp": timestamp
+        }
+        for page_number, annotations in sorted(annotations_by_page.items())
+    ]
+    await db.ocr_results.delete_many({"catalog_id": catalog_id})
+    await db.ocr_results.insert_many(documents)
+    return db.ocr_results, documents
+
+def text_layer_results(words: List[Dict[str, Any]], crops: List[Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Texto de cada produto montado a partir das palavras da camada de texto do PDF.
+    """
+    words_index = SpatialIndex.from_items(words)
+    results = {}
+    for index, bbox in crops:
+        text = join_words(words_in_bbox(words, bbox, margin=OCR_MARGIN, index=words_index))
+        results[index] = {"text": text, "confidence": 1.0, "price": parse_price(text), "cached": False, "source": "pdf"}
+    return results
+
+async def ocr_catalog(catalog_id: str):
+    """
+    Extrai o texto de todos os produtos do catálogo e grava o resultado nas
+    anotações (ou em ``ocr_results``, quando o catálogo só tem detecções).
+    
+    Páginas com camada de texto usam as palavras do próprio PDF; as demais
+    passam pelo OCR. Cada página é gravada assim que termina. Se a página foi
+    editada durante o OCR (``timestamp`` diferente), o resultado dela é
+    descartado para não sobrescrever a edição.
+    """
+    collection, documents = await load_ocr_sources(catalog_id)
+    text_layers = {
+        page["page_number"]: page["words"]
+        async for page in db.page_text.find(
+            {"catalog_id": catalog_id, "has_text_layer": True},
+            {"_id": 0, "page_number": 1, "words": 1}
+        )
+    }
+    
+    pages = []
+    text_pages = []
+    documents_by_page = {}
+    for document in documents:
+        crops = [
+            (index, annotation["bbox"])
+            for index, annotation in enumerate(document.get("annotations", []))
+            if annotation.get("type") == "produto"
+        ]
+        if not crops:
+            continue
+        page_number = document["page_number"]
+        documents_by_page[page_number] = document
+        if page_number in text_layers:
+            text_pages.append((page_number, crops))
+        else:
+            pages.append((page_number, f"{DATA_DIR}/images/{catalog_id}/page_{page_number}.jpg", crops))
+    
+    summary = {
+        "total_pages": len(documents_by_page),
+        "processed_pages": 0,
+        "text_layer_pages": len(text_pages),
+        "products": 0,
+        "cached": 0,
+        "skipped_pages": 0
+    }
+    await db.catalogs.update_one(
+        {"catalog_id": catalog_id},
+        {"$set": {"ocr_status.status": "processing", "ocr_status.progress": summary}}
+    )
+    
+    async def save_page(page_number: int, results: Dict[int, Dict[str, Any]]):
+        document = documents_by_page[page_number]
+        updates = {}
+        for index, result in results.items():
+            annotation = document["annotations"][index]
+            metadata = dict(annotation.get("metadata") or {})
+            metadata.update({
+                "ocr_text": result["text"],
+                "ocr_confidence": result["confidence"],
+                "ocr_price": result["price"],
+                "text_source": result["source"]
+            })
+            if "hash" in result:
+                metadata["ocr_hash"] = result["hash"]
+            updates[f"annotations.{index}.metadata"] = metadata
+            summary["cached"] += int(result["cached"])
+        
+        # O timestamp não é alterado: o OCR não conta como edição da página
+        updates["ocr_timestamp"] = datetime.now().isoformat()
+        update_result = await collection.update_one(
+            {"_id": document["_id"], "timestamp": document.get("timestamp")},
+            {"$set": updates}
+        )
+        if update_result.matched_count == 0:
+            logger.warning(f"Página {page_number} do catálogo {catalog_id} foi alterada durante o OCR; resultado descartado")
+            summary["skipped_pages"] += 1
+        else:
+            summary["products"] += len(results)
+        
+        summary["processed_pages"] += 1
+        await db.catalogs.update_one(
+            {"catalog_id": catalog_id},
+            {"$set": {"ocr_status.progress": {
+                **summary,
+                "percentage": round(summary["processed_pages"] / summary["total_pages"] * 100, 1)
+            }}}
+        )
+    
+    for page_number, crops in text_pages:
+        await save_page(page_number, text_layer_results(text_layers[page_number], crops))
+    await ocr_pages(pages, f"{DATA_DIR}/ocr_cache", on_page=save_page)
+    
+    await db.catalogs.update_one(
+        {"catalog_id": catalog_id},
+        {"$set": {
+            "ocr_status.status": "completed",
+            "ocr_status.progress": summary,
+            "ocr_status.finished_at": datetime.now().isoformat()
+        }}
+    )
+    logger.info(f"OCR do catálogo {catalog_id} concluído: {summary['products']} produtos em "
+                f"{summary['total_pages']} páginas ({len(text_pages)} pela camada de texto, {summary['cached']} do cache)")
+
+async def run_ocr_catalog_job(payload: Dict[str, Any]):
+    """
+    Executa um job "ocr_catalog" da fila.
+    """
+    await ocr_catalog(payload["catalog_id"])
+
+async def mark_ocr_failed(payload: Dict[str, Any], error: str):
+    """
+    Marca o OCR do catálogo como erro quando o job esgota todas as tentativas.
+    """
+    logger.error(f"Erro no OCR do catálogo {payload['catalog_id']}: {error}")
+    await db.catalogs.update_one(
+        {"catalog_id": payload["catalog_id"]},
+        {"$set": {"ocr_status.status": "error", "ocr_status.error_message": error}}
+    )
+
+# Rotas administrativas
+@app.get("/admin/query-plans", response_model=Dict[str, Any])
+async def get_query_plans():
+    """
+    Executa explain nas consultas mais frequentes e informa quais não usam índice.
+    """
+    report = await audit_query_plans(db)
+    not_index_backed = [item["name"] for item in report if not item.get("index_backed")]
+    return {
+        "queries": report,
+        "all_index_backed": not not_index_backed,
+        "not_index_backed": not_index_backed
+    }
+
 @app.get("/manifest.json", include_in_schema=False)
 async def get_manifest():
     return JSONResponse({
@@ -534,7 +1389,7 @@ async def get_manifest():
 
 @app.get("/")
 async def root():
-    return serialize_mongo({"message": "Catalogo ML API - Sistema de Extração e Análise de Produtos em Catálogos"})
+    return MongoJSONResponse({"message": "Catalogo ML API - Sistema de Extração e Análise de Produtos em Catálogos"})
 
 # Função para converter PDF para JPG
 async def convert_pdf_to_jpg(file_path: str, output_dir: str, dpi: int = 200, quality: int = 90):
@@ -544,23 +1399,14 @@ async def convert_pdf_to_jpg(file_path: str, output_dir: str, dpi: int = 200, qu
     os.makedirs(output_dir, exist_ok=True)
     
     try:
-        # Converter PDF para imagens
-        images = pdf2image.convert_from_path(
+        # Converter PDF para imagens em paralelo, sem bloquear o event loop
+        return await render_pdf(
             file_path,
+            output_dir,
             dpi=dpi,
-            output_folder=None,
-            fmt="jpeg"
+            quality=quality,
+            filename_pattern="pagina_{page}.jpg"
         )
-        
-        image_paths = []
-        
-        # Salvar cada página como um arquivo JPG
-        for i, image in enumerate(images):
-            image_path = os.path.join(output_dir, f"pagina_{i+1}.jpg")
-            image.save(image_path, "JPEG", quality=quality)
-            image_paths.append(image_path)
-            
-        return image_paths
     except Exception as e:
         logger.error(f"Erro ao converter PDF para JPG: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao converter PDF: {str(e)}")
@@ -594,21 +1440,12 @@ async def pdf_to_jpg(
     pdf_path = os.path.join(temp_dir, "arquivo.pdf")
     
     try:
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"Arquivo muito grande. O tamanho máximo permitido é 100MB. Seu arquivo tem {file_size / (1024 * 1024):.2f}MB"
-            )
-            
-        with open(pdf_path, "wb") as pdf_file:
-            pdf_file.write(content)
-            
-        # Resetar o cursor do arquivo para o início
-        await file.seek(0)
+        # Copiar em blocos, abortando assim que o limite for ultrapassado
+        await save_upload_stream(file, pdf_path, MAX_FILE_SIZE)
     
+    except HTTPException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
     except Exception as e:
         # Limpar diretório temporário em caso de erro
         shutil.rmtree(temp_dir, ignore_errors=True)
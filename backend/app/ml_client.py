@@ -0,0 +1,89 @@
+"""
+Cliente HTTP compartilhado para o serviço de ML.
+
+Um único ``httpx.AsyncClient`` é criado na inicialização da aplicação e
+fechado no encerramento, reaproveitando conexões (keep-alive) entre as
+requisições em vez de abrir uma conexão TCP nova a cada chamada.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Limites do pool de conexões
+ML_SERVICE_MAX_CONNECTIONS = int(os.getenv("ML_SERVICE_MAX_CONNECTIONS", "50"))
+ML_SERVICE_MAX_KEEPALIVE = int(os.getenv("ML_SERVICE_MAX_KEEPALIVE", "20"))
+ML_SERVICE_KEEPALIVE_EXPIRY = float(os.getenv("ML_SERVICE_KEEPALIVE_EXPIRY", "30"))
+
+# Tentativas extras em caso de falha de conexão
+ML_SERVICE_RETRIES = int(os.getenv("ML_SERVICE_RETRIES", "2"))
+
+# Timeouts por tipo de rota: consultas de status são rápidas e frequentes,
+# resultados podem ser grandes e o início de detecção pode demorar mais
+STATUS_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+RESULTS_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+DETECT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+# Erros típicos de uma conexão keep-alive já fechada pelo servidor. Falhas ao
+# conectar são repetidas pelo próprio transporte; estas só em GETs (idempotentes)
+RETRYABLE_ERRORS = (httpx.RemoteProtocolError, httpx.ReadError)
+
+
+class MLServiceClient:
+    """
+    Cliente com pool de conexões, keep-alive e retry para o serviço de ML.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """
+        Cria o cliente HTTP (chamado no startup da aplicação).
+        """
+        limits = httpx.Limits(
+            max_connections=ML_SERVICE_MAX_CONNECTIONS,
+            max_keepalive_connections=ML_SERVICE_MAX_KEEPALIVE,
+            keepalive_expiry=ML_SERVICE_KEEPALIVE_EXPIRY
+        )
+        # O transporte repete automaticamente falhas ao estabelecer a conexão
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=ML_SERVICE_RETRIES)
+        self._client = httpx.AsyncClient(base_url=self.base_url, transport=transport, timeout=RESULTS_TIMEOUT)
+
+    async def close(self):
+        """
+        Fecha as conexões abertas (chamado no shutdown da aplicação).
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Cliente do serviço ML não foi inicializado")
+        return self._client
+
+    async def get(self, path: str, timeout: httpx.Timeout = RESULTS_TIMEOUT) -> httpx.Response:
+        """
+        GET idempotente, repetido com backoff curto se a conexão cair.
+        """
+        for attempt in range(ML_SERVICE_RETRIES + 1):
+            try:
+                return await self.client.get(path, timeout=timeout)
+            except RETRYABLE_ERRORS as e:
+                if attempt == ML_SERVICE_RETRIES:
+                    raise
+                logger.warning(f"Conexão com o serviço ML interrompida em GET {path} ({str(e)}), tentando novamente")
+                await asyncio.sleep(0.1 * (2 ** attempt))
+
+    async def post(self, path: str, json: Any = None, timeout: httpx.Timeout = DETECT_TIMEOUT) -> httpx.Response:
+        """
+        POST (não idempotente): só é repetido pelo transporte quando a conexão falha.
+        """
+        return await self.client.post(path, json=json, timeout=timeout)
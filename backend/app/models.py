@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from typing import List, Dict, Any, Optional
 from enum import Enum
 
@@ -47,6 +47,18 @@ class ProductDetectionSchema(BaseModel):
     detect_classes: Optional[List[AnnotationType]] = Field(
         [AnnotationType.PRODUTO], description="Classes a serem detectadas"
     )
+    tile_size: Optional[int] = Field(
+        None, gt=0, description="Tamanho (pixels) dos tiles; sem valor, a página é processada inteira"
+    )
+    tile_overlap: Optional[int] = Field(None, ge=0, description="Sobreposição (pixels) entre tiles vizinhos")
+
+    @validator("tile_overlap")
+    def overlap_smaller_than_tile(cls, value, values):
+        # A sobreposição só faz sentido com tiles e não pode passar de metade do tile
+        tile_size = values.get("tile_size")
+        if value is not None and tile_size is not None and value > tile_size // 2:
+            raise ValueError("tile_overlap deve ser no máximo metade do tile_size")
+        return value
 
 
 class DetectionResult(BaseModel):
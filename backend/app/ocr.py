@@ -0,0 +1,235 @@
+"""
+OCR do texto dos produtos detectados.
+
+Para cada anotação do tipo "produto", a região da bbox (mais uma margem) é
+recortada da página, pré-processada com OpenCV (tons de cinza, ampliação de
+recortes pequenos, remoção de ruído e binarização) e lida pelo Tesseract.
+
+Cada página vira uma tarefa em um ``ProcessPoolExecutor`` próprio (a página é
+decodificada uma única vez para todos os recortes dela), de forma que as
+páginas de um catálogo são processadas em paralelo. Os resultados ficam em
+cache no disco, indexados pelo hash do recorte: rodar o OCR de novo em um
+catálogo (ou em um catálogo duplicado) não chama o Tesseract outra vez.
+
+Páginas de PDFs com camada de texto não passam por aqui: o texto delas vem
+do próprio PDF (ver ``text_layer``).
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+# Margem (pixels) adicionada em volta da bbox antes do recorte
+OCR_MARGIN = int(os.getenv("OCR_MARGIN", "12"))
+
+# Idioma e parâmetros do Tesseract
+OCR_LANG = os.getenv("OCR_LANG", "por")
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--oem 1 --psm 6")
+
+# Recortes com altura menor que esta são ampliados antes do OCR
+OCR_MIN_HEIGHT = int(os.getenv("OCR_MIN_HEIGHT", "200"))
+
+# Número de processos usados no OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+# Versão do pré-processamento; faz parte da chave do cache
+OCR_PIPELINE_VERSION = "1"
+
+# Preços no formato brasileiro (R$ 1.234,56)
+PRICE_PATTERN = re.compile(r"R\$\s*(\d{1,3}(?:\.\d{3})*|\d+),(\d{2})")
+
+# Pool de processos do OCR (criado sob demanda)
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+
+# Recorte a ler: (índice da anotação na página, bbox {x1, y1, x2, y2})
+CropRequest = Tuple[int, Dict[str, int]]
+
+# Callback chamado ao fim de cada página: (número da página, resultados por anotação)
+PageCallback = Callable[[int, Dict[int, Dict[str, Any]]], Awaitable[None]]
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """
+    Retorna o pool de processos do OCR, criando-o na primeira chamada.
+
+    É separado do pool de renderização para que um OCR longo não atrase a
+    renderização de catálogos recém-enviados.
+    """
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=max(1, OCR_WORKERS),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _ocr_pool
+
+
+def shutdown_ocr_pool():
+    """
+    Encerra o pool de processos do OCR, se existir.
+    """
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def crop_with_margin(image: np.ndarray, bbox: Dict[str, int], margin: int = OCR_MARGIN) -> np.ndarray:
+    """
+    Recorta a bbox da imagem com uma margem, limitada às bordas da página.
+    """
+    height, width = image.shape[:2]
+    x1 = max(0, min(bbox["x1"], bbox["x2"]) - margin)
+    y1 = max(0, min(bbox["y1"], bbox["y2"]) - margin)
+    x2 = min(width, max(bbox["x1"], bbox["x2"]) + margin)
+    y2 = min(height, max(bbox["y1"], bbox["y2"]) + margin)
+    return image[y1:y2, x1:x2]
+
+
+def crop_hash(crop: np.ndarray) -> str:
+    """
+    Chave do cache: pixels do recorte mais os parâmetros que afetam o resultado.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{crop.shape}|{OCR_LANG}|{OCR_TESSERACT_CONFIG}|{OCR_PIPELINE_VERSION}".encode())
+    digest.update(np.ascontiguousarray(crop).tobytes())
+    return digest.hexdigest()
+
+
+def preprocess_crop(crop: np.ndarray) -> np.ndarray:
+    """
+    Prepara o recorte para o Tesseract: cinza, ampliação, suavização e binarização.
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    if gray.shape[0] < OCR_MIN_HEIGHT:
+        scale = OCR_MIN_HEIGHT / max(1, gray.shape[0])
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    gray = cv2.medianBlur(gray, 3)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def parse_price(text: str) -> Optional[float]:
+    """
+    Primeiro preço (R$) encontrado no texto.
+    """
+    match = PRICE_PATTERN.search(text)
+    if not match:
+        return None
+    return float(f"{match.group(1).replace('.', '')}.{match.group(2)}")
+
+
+def run_tesseract(image: np.ndarray) -> Dict[str, Any]:
+    """
+    Executa o Tesseract e monta o texto linha a linha com a confiança média.
+    """
+    data = pytesseract.image_to_data(
+        image, lang=OCR_LANG, config=OCR_TESSERACT_CONFIG, output_type=pytesseract.Output.DICT
+    )
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for index, word in enumerate(data["text"]):
+        word = word.strip()
+        confidence = float(data["conf"][index])
+        if not word or confidence < 0:
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return {
+        "text": text,
+        "confidence": round(sum(confidences) / len(confidences) / 100, 4) if confidences else None,
+        "price": parse_price(text)
+    }
+
+
+def cache_path(cache_dir: str, key: str) -> str:
+    # Subpastas pelo prefixo do hash para não acumular milhares de arquivos em uma pasta
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def ocr_page_crops(image_path: str, crops: List[CropRequest], cache_dir: str) -> Dict[int, Dict[str, Any]]:
+    """
+    Lê o texto de vários recortes de uma página (executado no pool de processos).
+
+    Retorna, por índice da anotação, o texto, a confiança, o preço e se o
+    resultado veio do cache.
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"Imagem da página não encontrada: {image_path}")
+
+    results = {}
+    for index, bbox in crops:
+        crop = crop_with_margin(image, bbox)
+        if crop.size == 0:
+            continue
+
+        key = crop_hash(crop)
+        path = cache_path(cache_dir, key)
+        if os.path.exists(path):
+            with open(path) as f:
+                result = json.load(f)
+            result["cached"] = True
+        else:
+            result = run_tesseract(preprocess_crop(crop))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Grava em arquivo temporário para outro processo não ler um JSON incompleto
+            temp_path = f"{path}.{os.getpid()}.part"
+            with open(temp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+            result["cached"] = False
+
+        result["hash"] = key
+        result["source"] = "ocr"
+        results[index] = result
+    return results
+
+
+async def ocr_pages(
+    pages: List[Tuple[int, str, List[CropRequest]]],
+    cache_dir: str,
+    on_page: Optional[PageCallback] = None
+) -> Dict[int, Dict[int, Dict[str, Any]]]:
+    """
+    Executa o OCR de várias páginas em paralelo no pool de processos.
+
+    ``pages`` é uma lista de (número da página, caminho da imagem, recortes).
+    Retorna, por página, os resultados de ``ocr_page_crops``; ``on_page`` é
+    chamado assim que cada página termina (em qualquer ordem).
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_ocr_pool()
+
+    async def ocr_page(page_number: int, image_path: str, crops: List[CropRequest]):
+        results = await loop.run_in_executor(pool, partial(ocr_page_crops, image_path, crops, cache_dir))
+        return page_number, results
+
+    tasks = [asyncio.ensure_future(ocr_page(*page)) for page in pages]
+
+    results_by_page = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            page_number, results = await next_done
+            results_by_page[page_number] = results
+            if on_page:
+                await on_page(page_number, results)
+    except BaseException:
+        # Cancelar as páginas que ainda não começaram
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return results_by_page
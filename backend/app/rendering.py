@@ -0,0 +1,292 @@
+"""
+Rasterização de PDFs em janelas de páginas.
+
+Em vez de converter o PDF inteiro de uma vez (o que mantém todas as páginas
+decodificadas na memória), as páginas são renderizadas em janelas de tamanho
+fixo usando ``first_page``/``last_page`` do pdf2image. Cada janela é salva em
+disco e liberada antes da próxima, de modo que o pico de memória depende do
+tamanho da janela e não do tamanho do catálogo.
+
+As janelas são distribuídas entre processos de um ``ProcessPoolExecutor``,
+de forma que a renderização usa vários núcleos e nunca bloqueia o event loop
+do FastAPI.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import pdf2image
+from PIL import Image, features
+
+# Quantidade de páginas renderizadas por vez
+RENDER_WINDOW_SIZE = int(os.getenv("RENDER_WINDOW_SIZE", "4"))
+
+# DPI padrão usado pelo pdf2image
+RENDER_DPI = int(os.getenv("RENDER_DPI", "200"))
+
+# Número de processos usados para renderização
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+# Variantes reduzidas geradas para cada página: nome -> largura máxima em pixels.
+# A variante "full" é a imagem original renderizada.
+PAGE_IMAGE_SIZES = {
+    "thumb": int(os.getenv("PAGE_THUMB_WIDTH", "320")),
+    "preview": int(os.getenv("PAGE_PREVIEW_WIDTH", "1024"))
+}
+
+# Gerar também WebP para as variantes reduzidas (se o Pillow tiver suporte)
+PAGE_IMAGE_WEBP = os.getenv("PAGE_IMAGE_WEBP", "1") == "1" and features.check("webp")
+
+# Pool de processos compartilhado (criado sob demanda)
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+# Callback de progresso: (páginas contíguas prontas, páginas prontas, total de páginas)
+ProgressCallback = Callable[[int, int, int], Awaitable[None]]
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """
+    Retorna o pool de processos de renderização, criando-o na primeira chamada.
+
+    Os processos são iniciados com "spawn" para não herdar as threads do
+    cliente MongoDB e do servidor.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=max(1, RENDER_WORKERS),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """
+    Encerra o pool de processos de renderização, se existir.
+    """
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+async def run_in_render_pool(func, *args, **kwargs):
+    """
+    Executa uma função síncrona no pool de processos sem bloquear o event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_render_pool(), partial(func, *args, **kwargs))
+
+
+def get_pdf_page_count(file_path: str) -> int:
+    """
+    Lê o número de páginas do PDF sem renderizá-lo.
+    """
+    info = pdf2image.pdfinfo_from_path(file_path)
+    return int(info["Pages"])
+
+
+def split_page_windows(page_count: int, window_size: int = RENDER_WINDOW_SIZE) -> List[Tuple[int, int]]:
+    """
+    Divide as páginas 1..page_count em janelas (first_page, last_page) inclusivas.
+    """
+    window_size = max(1, window_size)
+    return [
+        (first_page, min(first_page + window_size - 1, page_count))
+        for first_page in range(1, page_count + 1, window_size)
+    ]
+
+
+def page_image_filename(page_number: int, size: str = "full", fmt: str = "jpg") -> str:
+    """
+    Nome do arquivo de uma variante da página (ex.: page_3.jpg, page_3_thumb.webp).
+    """
+    suffix = "" if size == "full" else f"_{size}"
+    return f"page_{page_number}{suffix}.{fmt}"
+
+
+def page_image_size(images_dir: str, page_number: int) -> Optional[Tuple[int, int]]:
+    """
+    Largura e altura (pixels) da imagem original da página, lidas do
+    cabeçalho do arquivo; None se a página não foi renderizada.
+    """
+    try:
+        with Image.open(os.path.join(images_dir, page_image_filename(page_number))) as image:
+            return image.size
+    except FileNotFoundError:
+        return None
+
+
+def save_page_pyramid(image: Image.Image, output_dir: str, page_number: int, quality: int = 75) -> str:
+    """
+    Salva a página em tamanho original e nas variantes reduzidas (JPEG e WebP).
+
+    Cada variante é gerada a partir da anterior, da maior para a menor, o que
+    evita redimensionar a página original várias vezes. Retorna o caminho da
+    imagem original.
+    """
+    full_path = os.path.join(output_dir, page_image_filename(page_number))
+    image.save(full_path, "JPEG", quality=quality)
+
+    source = image
+    for size, max_width in sorted(PAGE_IMAGE_SIZES.items(), key=lambda item: -item[1]):
+        if source.width > max_width:
+            height = max(1, round(source.height * max_width / source.width))
+            resized = source.resize((max_width, height), Image.LANCZOS)
+        else:
+            resized = source.copy()
+
+        resized.save(os.path.join(output_dir, page_image_filename(page_number, size)), "JPEG", quality=quality)
+        if PAGE_IMAGE_WEBP:
+            resized.save(os.path.join(output_dir, page_image_filename(page_number, size, "webp")), "WEBP", quality=quality)
+
+        if source is not image:
+            source.close()
+        source = resized
+
+    if source is not image:
+        source.close()
+    return full_path
+
+
+def render_page_window(
+    file_path: str,
+    output_dir: str,
+    first_page: int,
+    last_page: int,
+    dpi: int = RENDER_DPI,
+    quality: int = 75,
+    filename_pattern: str = "page_{page}.jpg",
+    pyramid: bool = False
+) -> List[str]:
+    """
+    Renderiza as páginas first_page..last_page e salva cada uma como JPEG.
+
+    Com ``pyramid=True``, salva também as variantes reduzidas da página
+    (ver ``save_page_pyramid``) e ignora ``filename_pattern``.
+
+    As imagens são fechadas logo após serem salvas para liberar a memória
+    antes da próxima janela.
+    """
+    images = pdf2image.convert_from_path(
+        file_path,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page
+    )
+
+    image_paths = []
+    try:
+        for offset, image in enumerate(images):
+            page_number = first_page + offset
+            if pyramid:
+                image_path = save_page_pyramid(image, output_dir, page_number, quality=quality)
+            else:
+                image_path = os.path.join(output_dir, filename_pattern.format(page=page_number))
+                image.save(image_path, "JPEG", quality=quality)
+            image_paths.append(image_path)
+    finally:
+        for image in images:
+            image.close()
+
+    return image_paths
+
+
+def convert_image_to_page(file_path: str, output_dir: str, quality: int = 75) -> str:
+    """
+    Converte um arquivo de imagem único (JPG/PNG) para a página 1 do catálogo,
+    gerando também as variantes reduzidas.
+    """
+    with Image.open(file_path) as img:
+        # Salvar a imagem como JPEG para padronização
+        with img.convert("RGB") as rgb_image:
+            return save_page_pyramid(rgb_image, output_dir, 1, quality=quality)
+
+
+def clone_page_images(source_dir: str, target_dir: str) -> int:
+    """
+    Reaproveita as imagens já renderizadas de outro catálogo.
+
+    Usa hard links (instantâneos e sem ocupar espaço extra); se o sistema de
+    arquivos não suportar, copia os arquivos. Retorna o número de arquivos.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    count = 0
+    for name in os.listdir(source_dir):
+        source_path = os.path.join(source_dir, name)
+        target_path = os.path.join(target_dir, name)
+        if not os.path.isfile(source_path):
+            continue
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copy2(source_path, target_path)
+        count += 1
+    return count
+
+
+async def render_pdf(
+    file_path: str,
+    output_dir: str,
+    dpi: int = RENDER_DPI,
+    quality: int = 75,
+    filename_pattern: str = "page_{page}.jpg",
+    window_size: int = RENDER_WINDOW_SIZE,
+    on_progress: Optional[ProgressCallback] = None,
+    pyramid: bool = False
+) -> List[str]:
+    """
+    Renderiza todas as páginas do PDF em paralelo no pool de processos.
+
+    Retorna os caminhos das imagens na ordem das páginas. O callback
+    ``on_progress`` é chamado a cada janela concluída; como as janelas podem
+    terminar fora de ordem, ele recebe também quantas páginas a partir da
+    primeira já estão prontas sem lacunas.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    total_pages = await run_in_render_pool(get_pdf_page_count, file_path)
+
+    async def render_window(window: Tuple[int, int]):
+        first_page, last_page = window
+        paths = await run_in_render_pool(
+            render_page_window,
+            file_path,
+            output_dir,
+            first_page,
+            last_page,
+            dpi=dpi,
+            quality=quality,
+            filename_pattern=filename_pattern,
+            pyramid=pyramid
+        )
+        return first_page, paths
+
+    tasks = [
+        asyncio.ensure_future(render_window(window))
+        for window in split_page_windows(total_pages, window_size)
+    ]
+
+    paths_by_page = {}
+    contiguous_pages = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            first_page, paths = await next_done
+            for offset, path in enumerate(paths):
+                paths_by_page[first_page + offset] = path
+
+            while contiguous_pages + 1 in paths_by_page:
+                contiguous_pages += 1
+
+            if on_progress:
+                await on_progress(contiguous_pages, len(paths_by_page), total_pages)
+    except BaseException:
+        # Cancelar as janelas que ainda não começaram
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return [paths_by_page[page] for page in sorted(paths_by_page)]
@@ -0,0 +1,45 @@
+"""
+Resposta JSON com suporte aos tipos do MongoDB/BSON.
+
+Serializa direto para bytes com orjson, em uma única passagem, tratando
+``ObjectId`` e ``Decimal128`` e, nativamente, ``datetime``. Substitui o
+antigo ``serialize_mongo``, que codificava o documento em JSON, decodificava
+de volta para objetos Python e deixava o FastAPI codificar novamente.
+"""
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def bson_default(obj: Any) -> Any:
+    """
+    Converte tipos BSON que o orjson não conhece.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    raise TypeError(f"Tipo não serializável em JSON: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializa um objeto (incluindo documentos do MongoDB) para bytes JSON.
+    """
+    return orjson.dumps(content, default=bson_default, option=ORJSON_OPTIONS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    JSONResponse que aceita documentos do MongoDB diretamente.
+
+    Quando uma rota retorna esta resposta, o FastAPI não aplica o
+    ``jsonable_encoder`` ao conteúdo: a serialização acontece uma única vez.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,167 @@
+"""
+Índice espacial das bboxes de uma página.
+
+Consultas do tipo "quais caixas cruzam esta região" (clique na ferramenta de
+anotação, associação de palavras aos produtos) eram varreduras lineares
+sobre a lista de anotações da página. O índice divide a página em uma grade
+uniforme e guarda, em arrays NumPy no formato CSR, quais caixas tocam cada
+célula; uma consulta só testa as caixas das células que cruzam a região.
+"""
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Lado (pixels) das células da grade; páginas renderizadas a 200 DPI têm ~1700x2300 px
+SPATIAL_CELL_SIZE = int(os.getenv("SPATIAL_CELL_SIZE", "128"))
+
+# Número máximo de células da grade. Caixas espalhadas por uma área muito
+# maior que uma página (coordenadas fora do normal) aumentam o lado das
+# células em vez do número delas, limitando a memória do índice
+SPATIAL_MAX_CELLS = int(os.getenv("SPATIAL_MAX_CELLS", "4096"))
+
+
+def boxes_to_array(items: Iterable[Dict[str, Any]]) -> np.ndarray:
+    """
+    Converte bboxes ({x1, y1, x2, y2}) em um array (N, 4) normalizado (x1 <= x2, y1 <= y2).
+    """
+    boxes = np.array(
+        [[item["x1"], item["y1"], item["x2"], item["y2"]] for item in items],
+        dtype=np.int64
+    ).reshape(-1, 4)
+    return np.concatenate(
+        [np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])],
+        axis=1
+    )
+
+
+def clip_bbox(bbox: Dict[str, Any], width: int, height: int) -> Optional[Dict[str, int]]:
+    """
+    Normaliza a bbox (x1 <= x2, y1 <= y2) e a recorta aos limites da página.
+
+    Retorna None se não sobrar área dentro da página.
+    """
+    x1, x2 = sorted((int(bbox["x1"]), int(bbox["x2"])))
+    y1, y2 = sorted((int(bbox["y1"]), int(bbox["y2"])))
+    clipped = {
+        "x1": min(max(x1, 0), width),
+        "y1": min(max(y1, 0), height),
+        "x2": min(max(x2, 0), width),
+        "y2": min(max(y2, 0), height)
+    }
+    if clipped["x2"] <= clipped["x1"] or clipped["y2"] <= clipped["y1"]:
+        return None
+    return clipped
+
+
+def grid_cell_size(extent_x: int, extent_y: int, cell_size: int, max_cells: int) -> int:
+    """
+    Menor lado de célula (a partir de ``cell_size``) com o qual a grade
+    sobre a extensão informada tem no máximo ``max_cells`` células.
+    """
+    def cells(size: int) -> int:
+        return -(-extent_x // size) * -(-extent_y // size)
+
+    if cells(cell_size) <= max_cells:
+        return cell_size
+    size = max(cell_size, math.isqrt(extent_x * extent_y // max_cells))
+    while cells(size) > max_cells:
+        size += max(1, size // 16)
+    return size
+
+
+class SpatialIndex:
+    """
+    Grade uniforme sobre um conjunto fixo de caixas (N, 4).
+
+    ``query`` retorna os índices (em ordem crescente) das caixas que
+    cruzam a região; caixas que apenas encostam na borda contam como
+    cruzamento, de forma que um clique sobre a borda encontra a caixa.
+    """
+
+    def __init__(self, boxes: np.ndarray, cell_size: int = SPATIAL_CELL_SIZE, max_cells: int = SPATIAL_MAX_CELLS):
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.cell_size = max(1, cell_size)
+
+        if len(self.boxes) == 0:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.shape = (0, 0)
+            self.cell_starts = np.zeros(1, dtype=np.int64)
+            self.cell_boxes = np.zeros(0, dtype=np.int64)
+            return
+
+        # Células cobertas por cada caixa (intervalos inclusivos)
+        self.origin = self.boxes[:, :2].min(axis=0)
+        extent_x, extent_y = (int(value) + 1 for value in self.boxes[:, 2:].max(axis=0) - self.origin)
+        self.cell_size = grid_cell_size(extent_x, extent_y, self.cell_size, max(1, max_cells))
+        first_cells = (self.boxes[:, :2] - self.origin) // self.cell_size
+        last_cells = (self.boxes[:, 2:] - self.origin) // self.cell_size
+        columns, rows = last_cells.max(axis=0) + 1
+        self.shape = (int(rows), int(columns))
+
+        # Pares (célula, caixa) gerados sem laço em Python
+        spans = last_cells - first_cells + 1
+        counts = spans[:, 0] * spans[:, 1]
+        box_ids = np.repeat(np.arange(len(self.boxes)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        span_x = spans[box_ids, 0]
+        cell_x = first_cells[box_ids, 0] + offsets % span_x
+        cell_y = first_cells[box_ids, 1] + offsets // span_x
+        cell_ids = cell_y * columns + cell_x
+
+        order = np.argsort(cell_ids, kind="stable")
+        self.cell_boxes = box_ids[order]
+        self.cell_starts = np.searchsorted(cell_ids[order], np.arange(rows * columns + 1))
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict[str, Any]], cell_size: int = SPATIAL_CELL_SIZE) -> "SpatialIndex":
+        """
+        Índice sobre uma lista de bboxes ou de palavras ({x1, y1, x2, y2}).
+        """
+        return cls(boxes_to_array(items), cell_size)
+
+    @classmethod
+    def from_annotations(cls, annotations: List[Dict[str, Any]], cell_size: int = SPATIAL_CELL_SIZE) -> "SpatialIndex":
+        return cls.from_items((annotation["bbox"] for annotation in annotations), cell_size)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def query(self, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """
+        Índices das caixas que cruzam a região [x1, x2] x [y1, y2].
+        """
+        rows, columns = self.shape
+        if rows == 0:
+            return np.zeros(0, dtype=np.int64)
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+
+        origin_x, origin_y = int(self.origin[0]), int(self.origin[1])
+        first_x = max((x1 - origin_x) // self.cell_size, 0)
+        first_y = max((y1 - origin_y) // self.cell_size, 0)
+        last_x = min((x2 - origin_x) // self.cell_size, columns - 1)
+        last_y = min((y2 - origin_y) // self.cell_size, rows - 1)
+        if first_x > last_x or first_y > last_y:
+            return np.zeros(0, dtype=np.int64)
+
+        # Cada linha da grade é um intervalo contíguo de células no CSR
+        if first_y == last_y:
+            start = self.cell_starts[first_y * columns + first_x]
+            end = self.cell_starts[first_y * columns + last_x + 1]
+            candidates = self.cell_boxes[start:end]
+            if last_x > first_x:
+                candidates = np.unique(candidates)
+        else:
+            row_starts = np.arange(first_y, last_y + 1) * columns
+            starts = self.cell_starts[row_starts + first_x]
+            ends = self.cell_starts[row_starts + last_x + 1]
+            candidates = np.unique(np.concatenate([self.cell_boxes[start:end] for start, end in zip(starts, ends)]))
+
+        boxes = self.boxes[candidates]
+        hits = (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1) & (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+        return candidates[hits]
+
+    def query_point(self, x: int, y: int) -> np.ndarray:
+        return self.query(x, y, x, y)
@@ -0,0 +1,137 @@
+"""
+Extração da camada de texto de PDFs nativos.
+
+A maioria dos PDFs de fornecedores já traz o texto embutido. Em vez de ler
+esse texto por OCR a partir dos pixels, as palavras são extraídas com
+``pdftotext -bbox`` (poppler) junto com suas posições, convertidas para a
+escala das imagens renderizadas (``RENDER_DPI``) e gravadas por página.
+Depois, o texto de cada produto é montado a partir das palavras que caem
+dentro da sua bbox; o OCR fica só para as páginas sem camada de texto.
+"""
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional
+
+from .rendering import RENDER_DPI
+from .spatial import SpatialIndex
+
+# Páginas com menos palavras que isso são tratadas como sem camada de texto
+# (ex.: páginas escaneadas com apenas um número de página)
+TEXT_LAYER_MIN_WORDS = int(os.getenv("TEXT_LAYER_MIN_WORDS", "3"))
+
+# Fração mínima da área da palavra que precisa estar dentro da bbox
+TEXT_LAYER_MIN_OVERLAP = float(os.getenv("TEXT_LAYER_MIN_OVERLAP", "0.5"))
+
+# Tempo máximo (segundos) da execução do pdftotext
+TEXT_LAYER_TIMEOUT = int(os.getenv("TEXT_LAYER_TIMEOUT", "120"))
+
+XHTML_NAMESPACE = "{http://www.w3.org/1999/xhtml}"
+
+
+def parse_bbox_output(output: bytes, first_page: int = 1, dpi: int = RENDER_DPI) -> Dict[int, Dict[str, Any]]:
+    """
+    Converte a saída XHTML do ``pdftotext -bbox`` em palavras por página.
+
+    As coordenadas do pdftotext estão em pontos (1/72 pol.) com origem no
+    canto superior esquerdo; são convertidas para pixels da imagem
+    renderizada em ``dpi``.
+    """
+    scale = dpi / 72
+    pages = {}
+    page_number = first_page - 1
+    root = ET.fromstring(output)
+    for page in root.iter(f"{XHTML_NAMESPACE}page"):
+        page_number += 1
+        words = []
+        for word in page.iter(f"{XHTML_NAMESPACE}word"):
+            text = (word.text or "").strip()
+            if not text:
+                continue
+            words.append({
+                "text": text,
+                "x1": round(float(word.get("xMin")) * scale),
+                "y1": round(float(word.get("yMin")) * scale),
+                "x2": round(float(word.get("xMax")) * scale),
+                "y2": round(float(word.get("yMax")) * scale)
+            })
+        pages[page_number] = {
+            "width": round(float(page.get("width")) * scale),
+            "height": round(float(page.get("height")) * scale),
+            "has_text_layer": len(words) >= TEXT_LAYER_MIN_WORDS,
+            "words": words
+        }
+    return pages
+
+
+def extract_text_layer(
+    file_path: str,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+    dpi: int = RENDER_DPI
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Extrai as palavras posicionadas das páginas do PDF (todas, por padrão).
+    """
+    command = ["pdftotext", "-bbox", "-enc", "UTF-8"]
+    if first_page:
+        command += ["-f", str(first_page)]
+    if last_page:
+        command += ["-l", str(last_page)]
+    command += [file_path, "-"]
+
+    result = subprocess.run(command, capture_output=True, timeout=TEXT_LAYER_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftotext falhou ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    return parse_bbox_output(result.stdout, first_page=first_page or 1, dpi=dpi)
+
+
+def word_overlap(word: Dict[str, int], bbox: Dict[str, int]) -> float:
+    """
+    Fração da área da palavra que está dentro da bbox.
+    """
+    width = min(word["x2"], bbox["x2"]) - max(word["x1"], bbox["x1"])
+    height = min(word["y2"], bbox["y2"]) - max(word["y1"], bbox["y1"])
+    if width <= 0 or height <= 0:
+        return 0.0
+    area = max(1, (word["x2"] - word["x1"]) * (word["y2"] - word["y1"]))
+    return width * height / area
+
+
+def words_in_bbox(
+    words: List[Dict[str, Any]],
+    bbox: Dict[str, int],
+    margin: int = 0,
+    min_overlap: float = TEXT_LAYER_MIN_OVERLAP,
+    index: Optional[SpatialIndex] = None
+) -> List[Dict[str, Any]]:
+    """
+    Palavras da página que estão dentro da bbox (mais a margem), na ordem de leitura do PDF.
+
+    Com ``index`` (índice espacial sobre ``words``), só as palavras próximas
+    da bbox são testadas.
+    """
+    region = {
+        "x1": min(bbox["x1"], bbox["x2"]) - margin,
+        "y1": min(bbox["y1"], bbox["y2"]) - margin,
+        "x2": max(bbox["x1"], bbox["x2"]) + margin,
+        "y2": max(bbox["y1"], bbox["y2"]) + margin
+    }
+    if index is not None:
+        words = [words[i] for i in index.query(region["x1"], region["y1"], region["x2"], region["y2"])]
+    return [word for word in words if word_overlap(word, region) >= min_overlap]
+
+
+def join_words(words: List[Dict[str, Any]]) -> str:
+    """
+    Junta as palavras em texto, quebrando a linha quando a próxima palavra
+    começa abaixo da anterior.
+    """
+    lines: List[List[str]] = []
+    previous = None
+    for word in words:
+        if previous is None or word["y1"] >= previous["y2"] or word["y2"] <= previous["y1"]:
+            lines.append([])
+        lines[-1].append(word["text"])
+        previous = word
+    return "\n".join(" ".join(line) for line in lines)
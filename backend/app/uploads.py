@@ -0,0 +1,152 @@
+"""
+Gravação de uploads em disco por streaming.
+
+Em vez de carregar o arquivo inteiro na memória com ``await file.read()``,
+o conteúdo é copiado em blocos de tamanho fixo para um arquivo temporário,
+calculando o hash SHA-256 durante a cópia. Ao final, o arquivo temporário é
+movido de forma atômica para o destino definitivo.
+
+O limite de tamanho é aplicado antes disso, no ``UploadLimitMiddleware``: o
+FastAPI lê e grava em disco o corpo multipart inteiro antes de chamar a
+rota, então uma verificação dentro da rota só acontece depois de o upload
+excessivo já ter sido recebido.
+"""
+import hashlib
+import os
+import uuid
+from typing import Iterable, NamedTuple
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Tamanho de cada bloco lido do upload (1MB por padrão)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Folga para delimitadores e cabeçalhos do corpo multipart
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    size: int
+    content_hash: str
+
+
+def upload_too_large_detail(max_size: int, received: int) -> str:
+    return (
+        f"Arquivo muito grande. O tamanho máximo permitido é {max_size / (1024 * 1024):.0f}MB. "
+        f"Recebidos ao menos {received / (1024 * 1024):.2f}MB"
+    )
+
+
+def upload_too_large(max_size: int, received: int) -> HTTPException:
+    """
+    Cria o erro 413 padrão para uploads acima do limite.
+    """
+    return HTTPException(status_code=413, detail=upload_too_large_detail(max_size, received))
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que limita o tamanho do corpo das rotas de upload.
+
+    - Content-Length acima do limite: responde 413 sem ler o corpo;
+    - sem Content-Length (ou com valor falso): conta os bytes recebidos e,
+      ao passar do limite, responde 413 e informa à aplicação que o cliente
+      desconectou, interrompendo a leitura do multipart. A resposta que a
+      aplicação tentar enviar depois disso é descartada.
+
+    O limite inclui uma folga para os delimitadores do multipart; o tamanho
+    exato do arquivo continua sendo verificado em ``save_upload_stream``.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int, paths: Iterable[str], methods: Iterable[str] = ("POST",)):
+        self.app = app
+        self.max_size = max_size
+        self.max_body = max_size + MULTIPART_OVERHEAD
+        self.paths = set(paths)
+        self.methods = set(methods)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in self.methods or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length", b"").decode("latin-1")
+        if content_length.isdigit() and int(content_length) > self.max_body:
+            await self.reject(scope, receive, send, int(content_length))
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    rejected = True
+                    await self.reject(scope, receive, send, received)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message):
+            # A resposta 413 já foi enviada
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send, received: int):
+        response = JSONResponse(
+            {"detail": upload_too_large_detail(self.max_size, received)},
+            status_code=413,
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+
+async def save_upload_stream(file: UploadFile, dest_path: str, max_size: int) -> StoredUpload:
+    """
+    Copia o upload para ``dest_path`` em blocos, sem manter o arquivo inteiro em memória.
+
+    O arquivo temporário é criado no mesmo diretório do destino para que o
+    ``os.replace`` final seja atômico. Se o limite ``max_size`` for
+    ultrapassado, a cópia é interrompida imediatamente com erro 413.
+    """
+    dest_dir = os.path.dirname(dest_path)
+    os.makedirs(dest_dir, exist_ok=True)
+    temp_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.part")
+
+    hasher = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_size:
+                    raise upload_too_large(max_size, size)
+
+                hasher.update(chunk)
+                await buffer.write(chunk)
+
+        # Mover para o destino definitivo (operação atômica no mesmo sistema de arquivos)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        # Remover arquivo parcial em caso de erro ou cancelamento
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return StoredUpload(path=dest_path, size=size, content_hash=hasher.hexdigest())
@@ -0,0 +1,99 @@
+"""
+Benchmark de renderização de PDFs: páginas/segundo por número de processos.
+
+Gera um PDF sintético com várias páginas e mede a vazão do pool de
+renderização (app.rendering) para diferentes quantidades de workers.
+
+Uso (a partir da pasta backend, com poppler-utils instalado):
+    python benchmarks/bench_render.py --pages 60 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import rendering  # noqa: E402
+
+
+def generate_pdf(path: str, pages: int, width: int = 1240, height: int = 1754):
+    """
+    Cria um PDF com páginas A4 (150 DPI) preenchidas com "produtos" desenhados.
+    """
+    images = []
+    for page in range(pages):
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        for row in range(6):
+            for col in range(4):
+                x1 = 40 + col * 300
+                y1 = 60 + row * 280
+                color = ((page * 37 + row * 50) % 255, (col * 60) % 255, (row * col * 20) % 255)
+                draw.rectangle([x1, y1, x1 + 260, y1 + 200], fill=color, outline="black")
+                draw.text((x1 + 10, y1 + 210), f"Produto {page + 1}.{row}.{col} - R$ {row * col + 9},90", fill="black")
+        images.append(image)
+
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+    for image in images:
+        image.close()
+
+
+async def run_once(pdf_path: str, output_dir: str, workers: int, dpi: int, window_size: int) -> float:
+    """
+    Renderiza o PDF com ``workers`` processos e retorna o tempo gasto em segundos.
+    """
+    rendering.shutdown_render_pool()
+    rendering.RENDER_WORKERS = workers
+
+    # Aquecer o pool para não medir o custo de iniciar os processos
+    await asyncio.gather(*[rendering.run_in_render_pool(time.sleep, 0.05) for _ in range(workers)])
+
+    start = time.perf_counter()
+    await rendering.render_pdf(pdf_path, output_dir, dpi=dpi, window_size=window_size)
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pool de renderização de PDFs")
+    parser.add_argument("--pages", type=int, default=40, help="Número de páginas do PDF gerado")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Quantidades de processos a testar")
+    parser.add_argument("--dpi", type=int, default=rendering.RENDER_DPI, help="DPI de renderização")
+    parser.add_argument("--window", type=int, default=rendering.RENDER_WINDOW_SIZE, help="Páginas por janela")
+    parser.add_argument("--repeat", type=int, default=2, help="Repetições por configuração (usa a melhor)")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    workers_list = args.workers or sorted({1, 2, 4, cpu_count})
+
+    work_dir = tempfile.mkdtemp(prefix="bench_render_")
+    try:
+        pdf_path = os.path.join(work_dir, "catalogo.pdf")
+        generate_pdf(pdf_path, args.pages)
+        print(f"PDF gerado com {args.pages} páginas ({os.path.getsize(pdf_path) / 1024:.0f}KB), "
+              f"dpi={args.dpi}, janela={args.window}, CPUs={cpu_count}")
+        print(f"{'workers':>8} {'tempo (s)':>10} {'páginas/s':>10} {'speedup':>8}")
+
+        baseline = None
+        for workers in workers_list:
+            best = None
+            for attempt in range(args.repeat):
+                output_dir = os.path.join(work_dir, f"out_{workers}_{attempt}")
+                elapsed = await run_once(pdf_path, output_dir, workers, args.dpi, args.window)
+                shutil.rmtree(output_dir, ignore_errors=True)
+                best = elapsed if best is None else min(best, elapsed)
+
+            baseline = baseline or best
+            print(f"{workers:>8} {best:>10.2f} {args.pages / best:>10.2f} {baseline / best:>7.2f}x")
+    finally:
+        rendering.shutdown_render_pool()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
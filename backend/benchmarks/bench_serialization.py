@@ -0,0 +1,90 @@
+"""
+Benchmark de serialização de respostas: caminho antigo x MongoJSONResponse.
+
+O caminho antigo reproduz o que as rotas faziam antes: ``serialize_mongo``
+(json.dumps com encoder de ObjectId + json.loads), seguido do
+``jsonable_encoder`` do FastAPI e do ``json.dumps`` do JSONResponse.
+
+Uso (a partir da pasta backend):
+    python benchmarks/bench_serialization.py --annotations 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.responses import MongoJSONResponse  # noqa: E402
+
+
+class LegacyJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        return super().default(o)
+
+
+def legacy_serialize(payload) -> bytes:
+    """
+    serialize_mongo + jsonable_encoder + JSONResponse (caminho anterior).
+    """
+    serialized = json.loads(LegacyJSONEncoder().encode(payload))
+    return JSONResponse(jsonable_encoder(serialized)).body
+
+
+def orjson_serialize(payload) -> bytes:
+    return MongoJSONResponse(payload).body
+
+
+def build_payload(annotation_count: int, pages: int = 50):
+    """
+    Documento no formato de /catalogs/{id}/detection com ``annotation_count`` anotações.
+    """
+    rng = random.Random(42)
+    annotations = []
+    for index in range(annotation_count):
+        x1, y1 = rng.randint(0, 1500), rng.randint(0, 2200)
+        annotations.append({
+            "_id": ObjectId(),
+            "id": f"prod_{index:05d}",
+            "type": "produto",
+            "confidence": round(rng.uniform(0.5, 1.0), 4),
+            "bbox": {"x1": x1, "y1": y1, "x2": x1 + rng.randint(50, 400), "y2": y1 + rng.randint(50, 400)},
+            "page_number": index % pages + 1,
+            "image_url": f"/catalogs/abc/pages/{index % pages + 1}/image",
+            "metadata": {"ocr_text": f"Produto {index} - R$ {rng.randint(1, 999)},90", "source": "detector"}
+        })
+    return {"_id": ObjectId(), "catalog_id": "abc", "annotations": annotations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialização de respostas")
+    parser.add_argument("--annotations", type=int, default=5000, help="Número de anotações no payload")
+    parser.add_argument("--repeat", type=int, default=20, help="Execuções por medição")
+    args = parser.parse_args()
+
+    payload = build_payload(args.annotations)
+
+    # Os dois caminhos devem gerar o mesmo JSON
+    assert json.loads(legacy_serialize(payload)) == json.loads(orjson_serialize(payload))
+
+    results = {}
+    for name, func in (("legado (serialize_mongo)", legacy_serialize), ("MongoJSONResponse (orjson)", orjson_serialize)):
+        best = min(timeit.repeat(lambda: func(payload), number=args.repeat, repeat=5)) / args.repeat
+        results[name] = best
+        print(f"{name:<28} {best * 1000:>8.2f} ms/resposta")
+
+    legacy, fast = results.values()
+    print(f"{'speedup':<28} {legacy / fast:>8.1f}x ({args.annotations} anotações, "
+          f"{len(orjson_serialize(payload)) / 1024:.0f}KB)")
+
+
+if __name__ == "__main__":
+    main()
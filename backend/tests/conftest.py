@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Permite importar o pacote ``app`` ao rodar o pytest a partir de backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py cria os diretórios de dados ao ser importado
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="catalogo-tests-"))
+
+
+@pytest.fixture
+def backend():
+    """
+    Módulo ``app.main`` com o MongoDB substituído por um banco em memória.
+
+    Retorna (main, cliente de teste, banco); o cliente não dispara os
+    eventos de startup (fila de jobs, pools de processos).
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    db = mongomock_motor.AsyncMongoMockClient().catalogo_test
+    original_db, original_collection = main.db, main.job_queue.collection
+    main.db = db
+    main.job_queue.collection = db.processing_jobs
+    yield main, TestClient(main.app), db
+    main.db, main.job_queue.collection = original_db, original_collection
@@ -0,0 +1,117 @@
+import asyncio
+import os
+
+from PIL import Image
+
+CATALOG_ID = "catalogo-anotacoes"
+
+
+class YieldingCollection:
+    """
+    Cede o event loop antes de cada operação, como faria um MongoDB real,
+    para que requisições simultâneas se intercalem entre uma leitura e uma escrita.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await attribute(*args, **kwargs)
+        return call
+
+
+class YieldingDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return YieldingCollection(getattr(self.db, name))
+
+
+def create_catalog(main, db):
+    images_dir = f"{main.DATA_DIR}/images/{CATALOG_ID}"
+    os.makedirs(images_dir, exist_ok=True)
+    Image.new("RGB", (800, 1000), "white").save(f"{images_dir}/page_1.jpg")
+    asyncio.run(db.catalogs.insert_one({"catalog_id": CATALOG_ID, "status": "ready", "page_count": 1}))
+
+
+def page_payload(label):
+    return {
+        "catalog_id": CATALOG_ID,
+        "page_number": 1,
+        "annotations": [{"id": label, "type": "produto", "bbox": {"x1": 0, "y1": 0, "x2": 10, "y2": 10}}]
+    }
+
+
+def test_create_then_update_keeps_one_document_per_page(backend):
+    main, client, db = backend
+    create_catalog(main, db)
+
+    created = client.post("/annotations/", json=page_payload("a")).json()
+    updated = client.post("/annotations/", json=page_payload("b")).json()
+
+    assert created["updated"] is False
+    assert updated["updated"] is True
+    assert updated["id"] == created["id"]
+    documents = asyncio.run(db.annotations.find({"catalog_id": CATALOG_ID}).to_list(length=None))
+    assert len(documents) == 1
+    assert documents[0]["annotations"][0]["id"] == "b"
+
+
+def test_concurrent_creates_do_not_duplicate_the_page(backend, monkeypatch):
+    main, client, db = backend
+    monkeypatch.setattr(main, "db", YieldingDatabase(db))
+
+    create_catalog(main, db)
+
+    async def run():
+        await main.ensure_indexes(db)
+        schema = main.AnnotationSchema
+        responses = await asyncio.gather(*(
+            main.create_annotation(schema(**page_payload(str(index)))) for index in range(10)
+        ))
+        return responses, await db.annotations.count_documents({"catalog_id": CATALOG_ID})
+
+    responses, count = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert count == 1
+
+
+def test_bbox_is_clipped_to_the_page(backend):
+    main, client, db = backend
+    create_catalog(main, db)
+    payload = page_payload("a")
+    payload["annotations"][0]["bbox"] = {"x1": 700, "y1": -20, "x2": 200000, "y2": 100}
+
+    assert client.post("/annotations/", json=payload).status_code == 200
+
+    document = asyncio.run(db.annotations.find_one({"catalog_id": CATALOG_ID}))
+    assert document["annotations"][0]["bbox"] == {"x1": 700, "y1": 0, "x2": 800, "y2": 100}
+
+
+def test_bbox_outside_the_page_is_rejected(backend):
+    main, client, db = backend
+    create_catalog(main, db)
+    payload = page_payload("a")
+    payload["annotations"][0]["bbox"] = {"x1": 200000, "y1": 200000, "x2": 200010, "y2": 200010}
+
+    response = client.post("/annotations/", json=payload)
+
+    assert response.status_code == 400
+    assert asyncio.run(db.annotations.count_documents({})) == 0
+
+
+def test_annotation_for_missing_page_is_rejected(backend):
+    main, client, db = backend
+    create_catalog(main, db)
+    payload = page_payload("a")
+    payload["page_number"] = 2
+
+    assert client.post("/annotations/", json=payload).status_code == 404
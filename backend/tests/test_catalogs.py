@@ -0,0 +1,40 @@
+import asyncio
+
+
+def seed_catalogs(db, count):
+    async def insert():
+        await db.catalogs.insert_many([
+            {
+                "catalog_id": f"catalogo-{index}",
+                "filename": f"catalogo-{index}.pdf",
+                "upload_date": f"2024-01-{index + 1:02d}T00:00:00",
+                "status": "ready",
+                "page_count": index + 1
+            }
+            for index in range(count)
+        ])
+    asyncio.run(insert())
+
+
+def test_list_catalogs_reports_totals_of_all_pages(backend):
+    main, client, db = backend
+    seed_catalogs(db, 7)
+
+    response = client.get("/catalogs/", params={"limit": 5})
+
+    assert [catalog["catalog_id"] for catalog in response.json()] == [f"catalogo-{index}" for index in range(6, 1, -1)]
+    assert response.headers["X-Total-Count"] == "7"
+    assert response.headers["X-Total-Pages"] == str(sum(range(1, 8)))
+    assert "X-Next-Cursor" in response.headers
+
+
+def test_list_catalogs_follows_cursor_to_last_page(backend):
+    main, client, db = backend
+    seed_catalogs(db, 7)
+
+    first = client.get("/catalogs/", params={"limit": 5})
+    last = client.get("/catalogs/", params={"limit": 5, "cursor": first.headers["X-Next-Cursor"]})
+
+    assert [catalog["catalog_id"] for catalog in last.json()] == ["catalogo-1", "catalogo-0"]
+    assert "X-Next-Cursor" not in last.headers
+    assert last.headers["X-Total-Count"] == "7"
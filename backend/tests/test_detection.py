@@ -0,0 +1,158 @@
+import asyncio
+
+import httpx
+import pytest
+
+CATALOG_ID = "catalogo-1"
+MANUAL_ANNOTATION = {"id": "manual-1", "type": "produto", "bbox": {"x1": 10, "y1": 10, "x2": 50, "y2": 50}}
+DETECTED_ANNOTATION = {"id": "det-1", "type": "produto", "bbox": {"x1": 1, "y1": 1, "x2": 5, "y2": 5}, "confidence": 0.9}
+
+
+def seed(db):
+    async def insert():
+        await db.catalogs.insert_one({"catalog_id": CATALOG_ID, "status": "completed"})
+        await db.detection_jobs.insert_one({"catalog_id": CATALOG_ID, "job_id": "job-1", "created_at": "2024-01-01T00:00:00"})
+        await db.annotations.insert_one({"catalog_id": CATALOG_ID, "page_number": 1, "annotations": [MANUAL_ANNOTATION]})
+    asyncio.run(insert())
+
+
+def fake_results(monkeypatch, main, payload):
+    async def get(path, **kwargs):
+        assert path == "/results/job-1"
+        return httpx.Response(200, json=payload)
+    monkeypatch.setattr(main.ml_client, "get", get)
+
+
+@pytest.mark.parametrize("payload", [
+    {"job_id": "job-1", "status": "pending", "message": "Detecção ainda não concluída"},
+    {"job_id": "job-1", "status": "processing", "message": "Detecção ainda não concluída"},
+    {"job_id": "job-1", "status": "failed", "message": "Detecção ainda não concluída"},
+])
+def test_unfinished_job_falls_back_to_manual_annotations(backend, monkeypatch, payload):
+    main, client, db = backend
+    seed(db)
+    fake_results(monkeypatch, main, payload)
+
+    response = client.get(f"/catalogs/{CATALOG_ID}/detection")
+
+    assert response.status_code == 200
+    assert [annotation["id"] for annotation in response.json()["annotations"]] == ["manual-1"]
+
+
+def test_completed_job_without_results_falls_back_to_manual_annotations(backend, monkeypatch):
+    main, client, db = backend
+    seed(db)
+    fake_results(monkeypatch, main, {"job_id": "job-1", "status": "completed"})
+
+    response = client.get(f"/catalogs/{CATALOG_ID}/detection")
+
+    assert [annotation["id"] for annotation in response.json()["annotations"]] == ["manual-1"]
+
+
+def test_completed_job_returns_detections(backend, monkeypatch):
+    main, client, db = backend
+    seed(db)
+    fake_results(monkeypatch, main, {
+        "job_id": "job-1",
+        "status": "completed",
+        "results": [{"page_number": 2, "image_url": "/img/2", "annotations": [dict(DETECTED_ANNOTATION)]}]
+    })
+
+    response = client.get(f"/catalogs/{CATALOG_ID}/detection")
+
+    annotations = response.json()["annotations"]
+    assert [annotation["id"] for annotation in annotations] == ["det-1"]
+    assert annotations[0]["page_number"] == 2
+
+
+def test_completed_results_survive_ml_eviction(backend, monkeypatch):
+    main, client, db = backend
+    seed(db)
+    fake_results(monkeypatch, main, {
+        "job_id": "job-1",
+        "status": "completed",
+        "results": [{"page_number": 2, "image_url": "/img/2", "annotations": [dict(DETECTED_ANNOTATION)]}]
+    })
+    client.get(f"/catalogs/{CATALOG_ID}/detection")
+
+    # O job expirou no serviço ML
+    async def get(path, **kwargs):
+        return httpx.Response(404, json={"detail": "Job de detecção job-1 não encontrado"})
+    monkeypatch.setattr(main.ml_client, "get", get)
+
+    annotations = client.get(f"/catalogs/{CATALOG_ID}/detection").json()["annotations"]
+    assert [annotation["id"] for annotation in annotations] == ["det-1"]
+    assert client.get("/results/job-1").json()["results"][0]["page_number"] == 2
+    assert client.get("/detect/status/job-1").json()["status"] == "completed"
+
+
+def test_sync_job_polls_until_detection_finishes(backend, monkeypatch):
+    main, client, db = backend
+    seed(db)
+    fake_results(monkeypatch, main, {"job_id": "job-1", "status": "processing"})
+
+    asyncio.run(main.run_sync_detection_job({"job_id": "job-1"}))
+
+    queued = asyncio.run(db.processing_jobs.find_one({"type": "sync_detection_results"}))
+    assert queued["payload"] == {"job_id": "job-1", "polls": 1}
+    assert queued["run_at"] > queued["created_at"]
+
+    fake_results(monkeypatch, main, {
+        "job_id": "job-1",
+        "status": "completed",
+        "results": [{"page_number": 1, "annotations": [dict(DETECTED_ANNOTATION)]}]
+    })
+    asyncio.run(main.run_sync_detection_job(queued["payload"]))
+
+    stored = asyncio.run(db.detection_jobs.find_one({"job_id": "job-1"}))
+    assert stored["status"] == "completed"
+    assert stored["results"][0]["annotations"][0]["id"] == "det-1"
+    assert asyncio.run(db.processing_jobs.count_documents({"type": "sync_detection_results"})) == 1
+
+
+def test_sync_job_stops_when_ml_job_is_gone(backend, monkeypatch):
+    main, client, db = backend
+    seed(db)
+
+    async def get(path, **kwargs):
+        return httpx.Response(404, json={"detail": "Job de detecção job-1 não encontrado"})
+    monkeypatch.setattr(main.ml_client, "get", get)
+
+    asyncio.run(main.run_sync_detection_job({"job_id": "job-1"}))
+
+    assert asyncio.run(db.processing_jobs.count_documents({})) == 0
+
+
+@pytest.mark.parametrize("body", [
+    {"tile_size": 0},
+    {"tile_size": 512, "tile_overlap": -1},
+    {"tile_size": 512, "tile_overlap": 300},
+    {"detect_classes": ["inexistente"]},
+])
+def test_detect_rejects_invalid_options(backend, monkeypatch, body):
+    main, client, db = backend
+
+    async def post(path, **kwargs):
+        raise AssertionError("o serviço ML não deve ser chamado")
+    monkeypatch.setattr(main.ml_client, "post", post)
+
+    response = client.post(f"/detect/{CATALOG_ID}", json=body)
+
+    assert response.status_code == 422
+
+
+def test_detect_forwards_tile_options(backend, monkeypatch):
+    main, client, db = backend
+    sent = {}
+
+    async def post(path, json=None, **kwargs):
+        sent.update(json)
+        return httpx.Response(202, json={"job_id": "job-2", "status": "pending"})
+    monkeypatch.setattr(main.ml_client, "post", post)
+
+    response = client.post(f"/detect/{CATALOG_ID}", json={"tile_size": 512, "tile_overlap": 64})
+
+    assert response.status_code == 202
+    assert sent == {"min_confidence": 0.5, "detect_classes": ["produto"], "tile_size": 512, "tile_overlap": 64}
+    stored = asyncio.run(db.detection_jobs.find_one({"job_id": "job-2"}))
+    assert (stored["tile_size"], stored["tile_overlap"]) == (512, 64)
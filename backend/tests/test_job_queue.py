@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import job_queue as job_queue_module
+from app.job_queue import JobQueue
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def make_queue(monkeypatch, workers=1):
+    monkeypatch.setattr(job_queue_module, "QUEUE_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(job_queue_module, "QUEUE_HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(job_queue_module, "QUEUE_RETRY_BASE_DELAY", 0)
+    db = mongomock_motor.AsyncMongoMockClient().queue_test
+    return JobQueue(db, workers=workers)
+
+
+async def wait_for_status(queue, job_id, status, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.collection.find_one({"job_id": job_id})
+        if job["status"] == status:
+            return job
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError(f"job {job_id} ficou em {job['status']}, esperado {status}")
+        await asyncio.sleep(0.01)
+
+
+def test_claim_next_hands_each_job_to_one_worker(monkeypatch):
+    queue = make_queue(monkeypatch)
+
+    async def noop(payload):
+        pass
+
+    async def run():
+        queue.register("tarefa", noop)
+        job_id = await queue.enqueue("tarefa", {})
+        claims = await asyncio.gather(*(queue.claim_next() for _ in range(5)))
+        return job_id, [claim for claim in claims if claim is not None]
+
+    job_id, claims = asyncio.run(run())
+
+    assert [claim["job_id"] for claim in claims] == [job_id]
+    assert claims[0]["status"] == "processing"
+    assert claims[0]["attempts"] == 1
+    assert claims[0]["lock_id"]
+
+
+def test_stale_jobs_are_requeued_by_heartbeat_age_regardless_of_owner(monkeypatch):
+    queue = make_queue(monkeypatch)
+    old = datetime.utcnow() - timedelta(hours=1)
+
+    async def run():
+        await queue.collection.insert_many([
+            # Réplica que caiu e nunca voltou
+            {"job_id": "orfao", "status": "processing", "locked_by": "outro-host:1", "heartbeat_at": old},
+            # Processo anterior deste host (pid muda a cada reload)
+            {"job_id": "reload", "status": "processing", "locked_by": "host:123", "heartbeat_at": old},
+            # Em execução, com heartbeat recente, mesmo sendo deste processo
+            {"job_id": "ativo", "status": "processing", "locked_by": queue.worker_id, "heartbeat_at": datetime.utcnow()},
+        ])
+        requeued = await queue.requeue_stale_jobs()
+        statuses = {job["job_id"]: job["status"] async for job in queue.collection.find({})}
+        return requeued, statuses
+
+    requeued, statuses = asyncio.run(run())
+
+    assert requeued == 2
+    assert statuses == {"orfao": "queued", "reload": "queued", "ativo": "processing"}
+
+
+def test_running_workers_recover_stale_jobs_periodically(monkeypatch):
+    queue = make_queue(monkeypatch)
+    executed = []
+
+    async def handler(payload):
+        executed.append(payload["n"])
+
+    async def run():
+        queue.register("tarefa", handler)
+        await queue.start()
+        try:
+            # Job que fica órfão depois que os workers já iniciaram
+            await queue.collection.insert_one({
+                "job_id": "orfao", "type": "tarefa", "payload": {"n": 1}, "status": "processing",
+                "attempts": 1, "max_attempts": 3, "run_at": datetime.utcnow(),
+                "locked_by": "outro-host:1", "lock_id": "antigo", "heartbeat_at": datetime.utcnow()
+            })
+            await asyncio.sleep(0.2)
+            await wait_for_status(queue, "orfao", "completed")
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert executed == [1]
+
+
+def test_heartbeat_keeps_long_jobs_from_being_requeued(monkeypatch):
+    queue = make_queue(monkeypatch)
+    executed = []
+
+    async def slow(payload):
+        executed.append(payload)
+        await asyncio.sleep(0.5)
+
+    async def run():
+        queue.register("tarefa", slow)
+        await queue.start()
+        try:
+            job_id = await queue.enqueue("tarefa", {})
+            await wait_for_status(queue, job_id, "completed")
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert len(executed) == 1
+
+
+def test_failures_are_retried_then_marked_failed(monkeypatch):
+    queue = make_queue(monkeypatch)
+    failures = []
+
+    async def broken(payload):
+        raise RuntimeError("falhou")
+
+    async def on_failure(payload, error):
+        failures.append(error)
+
+    async def run():
+        queue.register("tarefa", broken, on_failure=on_failure)
+        await queue.start()
+        try:
+            job_id = await queue.enqueue("tarefa", {}, max_attempts=2)
+            return await wait_for_status(queue, job_id, "failed")
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(run())
+    assert job["attempts"] == 2
+    assert job["last_error"] == "falhou"
+    assert failures == ["falhou"]
+
+
+def test_worker_survives_errors_while_recording_results(monkeypatch):
+    queue = make_queue(monkeypatch)
+    executed = []
+
+    async def handler(payload):
+        executed.append(payload["n"])
+
+    original_update_one = queue.collection.update_one
+    calls = {"count": 0}
+
+    async def flaky_update_one(filter, update, *args, **kwargs):
+        if update.get("$set", {}).get("status") == "completed":
+            calls["count"] += 1
+            if calls["count"] == 1:
+                raise RuntimeError("MongoDB indisponível")
+        return await original_update_one(filter, update, *args, **kwargs)
+
+    monkeypatch.setattr(queue.collection, "update_one", flaky_update_one)
+
+    async def run():
+        queue.register("tarefa", handler)
+        await queue.start()
+        try:
+            first = await queue.enqueue("tarefa", {"n": 1})
+            second = await queue.enqueue("tarefa", {"n": 2})
+            await wait_for_status(queue, second, "completed")
+            # O primeiro ficou em "processing" e é recuperado pela varredura de órfãos
+            return await wait_for_status(queue, first, "completed")
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert executed[:2] == [1, 2]
+    assert executed.count(1) == 2
@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+
+CATALOG_ID = "catalogo-ocr"
+DETECTION = {"id": "det-1", "type": "produto", "bbox": {"x1": 0, "y1": 0, "x2": 40, "y2": 40}, "confidence": 0.9}
+
+
+def test_ocr_of_detections_does_not_create_annotations(backend, monkeypatch):
+    main, client, db = backend
+
+    async def seed():
+        await db.catalogs.insert_one({"catalog_id": CATALOG_ID, "status": "ready"})
+        await db.detection_jobs.insert_one({"catalog_id": CATALOG_ID, "job_id": "job-1", "created_at": "2024-01-01T00:00:00"})
+    asyncio.run(seed())
+
+    async def get(path, **kwargs):
+        return httpx.Response(200, json={
+            "job_id": "job-1",
+            "status": "completed",
+            "results": [{"page_number": 1, "annotations": [dict(DETECTION)]}]
+        })
+
+    async def fake_ocr_pages(pages, cache_dir, on_page):
+        for page_number, _, crops in pages:
+            await on_page(page_number, {
+                index: {"text": "Café 500g R$ 12,90", "confidence": 0.8, "price": 12.9, "cached": False, "source": "ocr"}
+                for index, _ in crops
+            })
+
+    monkeypatch.setattr(main.ml_client, "get", get)
+    monkeypatch.setattr(main, "ocr_pages", fake_ocr_pages)
+
+    asyncio.run(main.ocr_catalog(CATALOG_ID))
+
+    assert asyncio.run(db.annotations.count_documents({})) == 0
+    assert client.get(f"/catalogs/{CATALOG_ID}/annotations").json() == []
+    assert client.get(f"/annotations/{CATALOG_ID}/1").json()["annotations"] == []
+
+    ocr = client.get(f"/catalogs/{CATALOG_ID}/ocr").json()
+    assert ocr["ocr_status"]["status"] == "completed"
+    assert [page["page_number"] for page in ocr["pages"]] == [1]
+    metadata = ocr["pages"][0]["annotations"][0]["metadata"]
+    assert metadata["ocr_price"] == 12.9
+    assert metadata["text_source"] == "ocr"
@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+from PIL import Image
+
+CATALOG_ID = "catalogo-imagens"
+
+
+def write_page(main, color):
+    images_dir = f"{main.DATA_DIR}/images/{CATALOG_ID}"
+    os.makedirs(images_dir, exist_ok=True)
+    path = f"{images_dir}/page_1.jpg"
+    Image.new("RGB", (64 if color == "white" else 96, 64), color).save(path)
+    return path
+
+
+def test_cached_page_image_is_rechecked_on_disk(backend):
+    main, client, db = backend
+    asyncio.run(db.catalogs.insert_one({"catalog_id": CATALOG_ID, "status": "ready", "page_count": 1}))
+    path = write_page(main, "white")
+    url = f"/catalogs/{CATALOG_ID}/pages/1/image"
+
+    first = client.get(url)
+    assert first.status_code == 200
+
+    # Página renderizada de novo: a entrada em cache não pode servir a versão antiga
+    write_page(main, "black")
+    second = client.get(url)
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+    assert second.content != first.content
+
+    # Arquivo removido (ex.: catálogo excluído por outro worker)
+    os.remove(path)
+    assert client.get(url).status_code == 404
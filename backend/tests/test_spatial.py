@@ -0,0 +1,66 @@
+import numpy as np
+
+from app.spatial import SpatialIndex, clip_bbox
+
+
+def brute_force(boxes, x1, y1, x2, y2):
+    return [
+        index for index, (bx1, by1, bx2, by2) in enumerate(boxes)
+        if bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1
+    ]
+
+
+def random_boxes(rng, count, width=1700, height=2300):
+    corners = rng.integers(0, [width, height], size=(count, 2))
+    sizes = rng.integers(1, 400, size=(count, 2))
+    return np.concatenate([corners, corners + sizes], axis=1)
+
+
+def test_queries_match_a_linear_scan():
+    rng = np.random.default_rng(0)
+    boxes = random_boxes(rng, 300)
+    index = SpatialIndex(boxes, cell_size=128)
+
+    for _ in range(200):
+        x, y = rng.integers(-100, 2000, size=2)
+        w, h = rng.integers(0, 600, size=2)
+        assert index.query(x, y, x + w, y + h).tolist() == brute_force(boxes, x, y, x + w, y + h)
+
+
+def test_point_query_on_a_box_border_finds_the_box():
+    index = SpatialIndex.from_items([{"x1": 10, "y1": 10, "x2": 50, "y2": 50}, {"x1": 60, "y1": 10, "x2": 90, "y2": 50}])
+
+    assert index.query_point(50, 30).tolist() == [0]
+    assert index.query_point(55, 30).tolist() == []
+    # Coordenadas invertidas são normalizadas
+    assert index.query(90, 50, 10, 10).tolist() == [0, 1]
+
+
+def test_empty_index():
+    index = SpatialIndex.from_items([])
+
+    assert len(index) == 0
+    assert index.query(0, 0, 100, 100).tolist() == []
+
+
+def test_grid_size_is_bounded_for_far_away_coordinates():
+    boxes = np.array([[0, 0, 10, 10], [2_000_000, 2_000_000, 2_000_010, 2_000_010]])
+    index = SpatialIndex(boxes, cell_size=128, max_cells=4096)
+
+    rows, columns = index.shape
+    assert rows * columns <= 4096
+    assert len(index.cell_starts) <= 4097
+    assert index.query_point(5, 5).tolist() == [0]
+    assert index.query_point(2_000_005, 2_000_005).tolist() == [1]
+    assert index.query(0, 0, 3_000_000, 3_000_000).tolist() == [0, 1]
+
+
+def test_normal_page_keeps_the_configured_cell_size():
+    index = SpatialIndex(np.array([[0, 0, 1700, 2300]]), cell_size=128)
+
+    assert index.cell_size == 128
+
+
+def test_clip_bbox():
+    assert clip_bbox({"x1": 50, "y1": -5, "x2": -10, "y2": 30}, 100, 100) == {"x1": 0, "y1": 0, "x2": 50, "y2": 30}
+    assert clip_bbox({"x1": 150, "y1": 10, "x2": 200, "y2": 30}, 100, 100) is None
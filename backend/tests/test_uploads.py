@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, File, UploadFile
+
+from app.uploads import MULTIPART_OVERHEAD, UploadLimitMiddleware
+
+MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+BOUNDARY = "limite"
+
+
+def make_app(calls):
+    app = FastAPI()
+
+    @app.post("/upload/")
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"ok": True}
+
+    return UploadLimitMiddleware(app, max_size=MAX_SIZE, paths=("/upload/",))
+
+
+def multipart_chunks(file_size):
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="catalogo.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    body = head + b"x" * file_size + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return [body[start:start + CHUNK_SIZE] for start in range(0, len(body), CHUNK_SIZE)]
+
+
+def send_request(app, chunks, content_length=None):
+    """
+    Envia o corpo em partes e retorna (status, corpo da resposta, partes lidas pela aplicação).
+    """
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/upload/", "raw_path": b"/upload/",
+        "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80)
+    }
+    consumed = 0
+    messages = []
+
+    async def receive():
+        nonlocal consumed
+        if consumed < len(chunks):
+            consumed += 1
+            return {"type": "http.request", "body": chunks[consumed - 1], "more_body": consumed < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = next(message for message in messages if message["type"] == "http.response.start")
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+    return start["status"], body, consumed
+
+
+def test_upload_within_limit_reaches_route():
+    calls = []
+    chunks = multipart_chunks(MAX_SIZE // 2)
+
+    status, _, consumed = send_request(make_app(calls), chunks)
+
+    assert status == 200
+    assert calls == ["catalogo.pdf"]
+    assert consumed == len(chunks)
+
+
+def test_upload_without_content_length_is_aborted_while_streaming():
+    calls = []
+    chunks = multipart_chunks(MAX_SIZE * 4)
+
+    status, body, consumed = send_request(make_app(calls), chunks)
+
+    assert status == 413
+    assert "Arquivo muito grande" in json.loads(body)["detail"]
+    assert calls == []
+    # A leitura para logo depois de passar do limite, sem consumir o resto do corpo
+    assert consumed * CHUNK_SIZE <= MAX_SIZE + MULTIPART_OVERHEAD + CHUNK_SIZE
+    assert consumed < len(chunks)
+
+
+def test_upload_with_large_content_length_is_rejected_before_reading():
+    calls = []
+    chunks = multipart_chunks(MAX_SIZE * 4)
+
+    status, _, consumed = send_request(make_app(calls), chunks, content_length=sum(map(len, chunks)))
+
+    assert status == 413
+    assert calls == []
+    assert consumed == 0
+
+
+def test_other_paths_are_not_limited():
+    calls = []
+    chunks = multipart_chunks(MAX_SIZE * 2)
+    app = make_app(calls)
+    app.paths = {"/outro/"}
+
+    status, _, consumed = send_request(app, chunks)
+
+    assert status == 200
+    assert consumed == len(chunks)
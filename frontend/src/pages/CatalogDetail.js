@@ -99,9 +99,9 @@ const CatalogDetail = () => {
     setCurrentPage(value);
   };
   
-  // URL da imagem da página atual
+  // URL da imagem da página atual (versão reduzida, suficiente para a visualização)
   let imagePath = pages.length > 0 && currentPage <= pages.length 
-    ? `/catalogs/${catalogId}/pages/${currentPage}/image` 
+    ? `/catalogs/${catalogId}/pages/${currentPage}/image?size=preview` 
     : null;
   
   // Construir URL correta para a imagem
@@ -42,13 +42,13 @@ const Dashboard = () => {
       try {
         setLoading(true);
         
-        // Buscar catálogos
-        const catalogsResponse = await api.get('/catalogs/');
+        // Buscar os catálogos mais recentes
+        const catalogsResponse = await api.get('/catalogs/', { params: { limit: 5 } });
         const catalogs = catalogsResponse.data;
         
-        // Calcular estatísticas
-        const totalCatalogs = catalogs.length;
-        const totalPages = catalogs.reduce((acc, catalog) => acc + catalog.page_count, 0);
+        // Estatísticas (a listagem é paginada; os totais vêm nos cabeçalhos)
+        const totalCatalogs = Number(catalogsResponse.headers['x-total-count']) || 0;
+        const totalPages = Number(catalogsResponse.headers['x-total-pages']) || 0;
         
         // Buscar modelos treinados (simulado por enquanto)
         const totalModels = 0; // Será implementado quando a API estiver pronta
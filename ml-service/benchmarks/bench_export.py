@@ -0,0 +1,184 @@
+"""
+Benchmark do modelo fp32 x artefato otimizado (TorchScript quantizado).
+
+Mede a latência por página e o mAP@IoU dos dois modelos em um conjunto fixo
+de páginas. A referência do mAP são as anotações informadas em
+``--annotations`` (JSON no formato dos resultados de detecção: lista de
+``{"page_number", "annotations": [{"type", "bbox"}]}``); sem elas, as
+detecções do modelo fp32 com confiança >= ``--reference-confidence`` são
+usadas como referência, o que mede a concordância do modelo otimizado.
+
+Uso (a partir da pasta ml-service, com o modelo já exportado):
+    MODELS_DIR=/models python benchmarks/bench_export.py --model-id <id> --pages /data/images/<catalog_id>
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection_worker import list_catalog_pages  # noqa: E402
+from inference import DetectionEngine  # noqa: E402
+
+# Detecções de uma página: lista de (classe, confiança, [x1, y1, x2, y2])
+Detections = List[Tuple[str, float, List[float]]]
+
+
+def box_iou(box: List[float], boxes: np.ndarray) -> np.ndarray:
+    """
+    IoU de uma caixa contra um conjunto de caixas (M, 4).
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def average_precision(
+    predictions: Dict[int, Detections],
+    references: Dict[int, Detections],
+    class_name: str,
+    iou_threshold: float
+) -> float:
+    """
+    AP de uma classe (interpolação em todos os pontos, como no VOC).
+    """
+    gt_boxes = {
+        page: np.array([box for name, _, box in detections if name == class_name], dtype=np.float64).reshape(-1, 4)
+        for page, detections in references.items()
+    }
+    matched = {page: np.zeros(len(boxes), dtype=bool) for page, boxes in gt_boxes.items()}
+    total_gt = sum(len(boxes) for boxes in gt_boxes.values())
+    if total_gt == 0:
+        return float("nan")
+
+    ranked = sorted(
+        ((score, page, box) for page, detections in predictions.items()
+         for name, score, box in detections if name == class_name),
+        key=lambda item: -item[0]
+    )
+    true_positives = np.zeros(len(ranked))
+    for index, (_, page, box) in enumerate(ranked):
+        boxes = gt_boxes.get(page)
+        if boxes is None or len(boxes) == 0:
+            continue
+        ious = box_iou(box, boxes)
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold and not matched[page][best]:
+            matched[page][best] = True
+            true_positives[index] = 1
+
+    if not ranked:
+        return 0.0
+    cumulative_tp = np.cumsum(true_positives)
+    recall = cumulative_tp / total_gt
+    precision = cumulative_tp / np.arange(1, len(ranked) + 1)
+
+    # Envelope da curva precisão x recall
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([0.0], precision, [0.0]))
+    for i in range(len(precision) - 2, -1, -1):
+        precision[i] = max(precision[i], precision[i + 1])
+    steps = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+
+def mean_average_precision(predictions, references, iou_threshold: float) -> float:
+    classes = {name for detections in references.values() for name, _, _ in detections}
+    values = [average_precision(predictions, references, name, iou_threshold) for name in sorted(classes)]
+    values = [value for value in values if not np.isnan(value)]
+    return float(np.mean(values)) if values else float("nan")
+
+
+def to_detections(annotations) -> Detections:
+    return [
+        (a["type"], float(a.get("confidence", 1.0)),
+         [a["bbox"]["x1"], a["bbox"]["y1"], a["bbox"]["x2"], a["bbox"]["y2"]])
+        for a in annotations
+    ]
+
+
+def run_engine(engine: DetectionEngine, pages, min_confidence: float):
+    """
+    Executa o modelo página a página, retornando latências (s) e detecções.
+    """
+    # Aquecimento (a primeira execução de um modelo TorchScript é mais lenta)
+    engine.detect_pages(pages[:1], min_confidence)
+
+    latencies = []
+    predictions = {}
+    for page in pages:
+        started_at = time.perf_counter()
+        annotations = engine.detect_pages([page], min_confidence)[0]
+        latencies.append(time.perf_counter() - started_at)
+        predictions[page[0]] = to_detections(annotations)
+    return latencies, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fp32 x modelo exportado")
+    parser.add_argument("--model-id", required=True, help="ID do modelo no registro")
+    parser.add_argument("--pages", required=True, help="Pasta com as páginas (page_N.jpg)")
+    parser.add_argument("--limit", type=int, default=10, help="Número de páginas usadas")
+    parser.add_argument("--annotations", help="JSON com as anotações de referência")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU mínimo para um acerto")
+    parser.add_argument("--min-confidence", type=float, default=0.05, help="Confiança mínima das detecções")
+    parser.add_argument("--reference-confidence", type=float, default=0.5,
+                        help="Confiança mínima das detecções fp32 usadas como referência")
+    args = parser.parse_args()
+
+    models_dir = os.environ.get("MODELS_DIR", "/models")
+    with open(os.path.join(models_dir, "models_metadata.json")) as f:
+        models = json.load(f)
+    model_info = next((model for model in models if model.get("model_id") == args.model_id), None)
+    if model_info is None:
+        sys.exit(f"Modelo {args.model_id} não encontrado em {models_dir}")
+
+    pages = list_catalog_pages(args.pages)[:args.limit]
+    if not pages:
+        sys.exit(f"Nenhuma página encontrada em {args.pages}")
+
+    fp32 = DetectionEngine.load(model_info, models_dir, prefer_artifact=False)
+    optimized = DetectionEngine.load(model_info, models_dir, prefer_artifact=True)
+    if optimized.artifact is None:
+        sys.exit(f"Modelo {args.model_id} não tem artefato TorchScript; exporte-o antes (POST /models/<id>/export)")
+
+    results = {}
+    for name, engine in (("fp32", fp32), ("otimizado", optimized)):
+        latencies, predictions = run_engine(engine, pages, args.min_confidence)
+        results[name] = (latencies, predictions, engine.memory_bytes())
+
+    if args.annotations:
+        with open(args.annotations) as f:
+            references = {page["page_number"]: to_detections(page["annotations"]) for page in json.load(f)}
+        reference_name = "anotações"
+    else:
+        references = {
+            page: [detection for detection in detections if detection[1] >= args.reference_confidence]
+            for page, detections in results["fp32"][1].items()
+        }
+        reference_name = f"fp32 (conf >= {args.reference_confidence})"
+
+    print(f"{len(pages)} páginas, referência do mAP: {reference_name}, IoU {args.iou}")
+    print(f"{'modelo':<10} {'mediana':>10} {'p95':>10} {'páginas/s':>10} {'tamanho':>10} {'mAP':>8}")
+    for name, (latencies, predictions, size) in results.items():
+        latencies_ms = np.array(latencies) * 1000
+        mean_ap = mean_average_precision(predictions, references, args.iou)
+        print(f"{name:<10} {np.median(latencies_ms):>8.0f}ms {np.percentile(latencies_ms, 95):>8.0f}ms "
+              f"{len(latencies) / sum(latencies):>10.2f} {size / (1024 * 1024):>8.0f}MB {mean_ap:>8.3f}")
+
+    speedup = np.median(results["fp32"][0]) / np.median(results["otimizado"][0])
+    print(f"speedup (mediana): {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark do pós-processamento das detecções (filtro de confiança + NMS por classe).
+
+Gera páginas sintéticas com ``--candidates`` caixas brutas cada (grupos de
+caixas ruidosas em volta de cada produto, mais caixas aleatórias de baixa
+confiança, como na saída do detector antes do NMS) e compara:
+
+- ``dicts``: implementação em Python puro sobre listas de dicionários;
+- ``numpy``: ``postprocess.postprocess`` sobre o array (N, 6);
+- ``torchvision``: ``torchvision.ops.batched_nms``, usado como referência
+  do resultado (as caixas mantidas devem ser as mesmas).
+
+Uso (a partir da pasta ml-service):
+    python benchmarks/bench_postprocess.py --pages 20 --candidates 2000
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postprocess import NMS_IOU_THRESHOLD, SCORE, postprocess  # noqa: E402
+
+# Página renderizada a 200 DPI (A4)
+PAGE_WIDTH, PAGE_HEIGHT = 1654, 2339
+
+
+def synthetic_page(rng: np.random.Generator, candidates: int, classes: int) -> np.ndarray:
+    """
+    Caixas brutas de uma página: ~80% em grupos em volta dos produtos, o resto aleatório.
+    """
+    products = max(1, candidates // 20)
+    centers = rng.uniform([100, 100], [PAGE_WIDTH - 100, PAGE_HEIGHT - 100], size=(products, 2))
+    sizes = rng.uniform(60, 250, size=(products, 2))
+    product_classes = rng.integers(1, classes + 1, size=products)
+
+    grouped = int(candidates * 0.8)
+    owners = rng.integers(0, products, size=grouped)
+    jitter = rng.normal(0, 0.08, size=(grouped, 4)) * np.tile(sizes[owners], 2)
+    half = sizes[owners] / 2
+    boxes = np.concatenate([centers[owners] - half, centers[owners] + half], axis=1) + jitter
+    scores = rng.uniform(0.3, 1.0, size=grouped)
+    labels = product_classes[owners]
+
+    noise = candidates - grouped
+    corners = rng.uniform([0, 0], [PAGE_WIDTH - 300, PAGE_HEIGHT - 300], size=(noise, 2))
+    noise_boxes = np.concatenate([corners, corners + rng.uniform(20, 300, size=(noise, 2))], axis=1)
+
+    detections = np.column_stack([
+        np.concatenate([boxes, noise_boxes]),
+        np.concatenate([scores, rng.uniform(0.0, 0.5, size=noise)]),
+        np.concatenate([labels, rng.integers(1, classes + 1, size=noise)])
+    ]).astype(np.float32)
+    # Caixas com x1 <= x2 e y1 <= y2
+    detections[:, :4] = np.concatenate(
+        [np.minimum(detections[:, :2], detections[:, 2:4]), np.maximum(detections[:, :2], detections[:, 2:4])],
+        axis=1
+    )
+    return detections
+
+
+def to_dicts(detections: np.ndarray) -> List[Dict[str, Any]]:
+    return [
+        {"bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}, "confidence": score, "label": int(label)}
+        for x1, y1, x2, y2, score, label in detections.tolist()
+    ]
+
+
+def dict_iou(a: Dict[str, float], b: Dict[str, float]) -> float:
+    width = min(a["x2"], b["x2"]) - max(a["x1"], b["x1"])
+    height = min(a["y2"], b["y2"]) - max(a["y1"], b["y1"])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area_a = (a["x2"] - a["x1"]) * (a["y2"] - a["y1"])
+    area_b = (b["x2"] - b["x1"]) * (b["y2"] - b["y1"])
+    return intersection / (area_a + area_b - intersection)
+
+
+def postprocess_dicts(detections: List[Dict[str, Any]], min_confidence: float, iou_threshold: float):
+    """
+    Filtro + NMS por classe em Python puro, como seria feito sobre a lista de anotações.
+    """
+    candidates = sorted(
+        (detection for detection in detections if detection["confidence"] >= min_confidence),
+        key=lambda detection: -detection["confidence"]
+    )
+    kept = []
+    for detection in candidates:
+        if all(
+            other["label"] != detection["label"] or dict_iou(other["bbox"], detection["bbox"]) <= iou_threshold
+            for other in kept
+        ):
+            kept.append(detection)
+    return kept
+
+
+def postprocess_torchvision(detections: np.ndarray, min_confidence: float, iou_threshold: float) -> np.ndarray:
+    import torch
+    from torchvision.ops import batched_nms
+
+    detections = detections[detections[:, SCORE] >= min_confidence]
+    tensor = torch.from_numpy(detections)
+    keep = batched_nms(tensor[:, :4], tensor[:, 4], tensor[:, 5].long(), iou_threshold)
+    return detections[keep.numpy()]
+
+
+def measure(function, pages, repeats: int):
+    latencies = []
+    results = []
+    for page in pages:
+        best = float("inf")
+        for _ in range(repeats):
+            started_at = time.perf_counter()
+            result = function(page)
+            best = min(best, time.perf_counter() - started_at)
+        latencies.append(best)
+        results.append(result)
+    return np.array(latencies) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pós-processamento das detecções")
+    parser.add_argument("--pages", type=int, default=20, help="Número de páginas sintéticas")
+    parser.add_argument("--candidates", type=int, default=2000, help="Caixas brutas por página")
+    parser.add_argument("--classes", type=int, default=4, help="Número de classes")
+    parser.add_argument("--min-confidence", type=float, default=0.3, help="Confiança mínima")
+    parser.add_argument("--iou", type=float, default=NMS_IOU_THRESHOLD, help="IoU do NMS")
+    parser.add_argument("--repeats", type=int, default=3, help="Execuções por página (vale a melhor)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    pages = [synthetic_page(rng, args.candidates, args.classes) for _ in range(args.pages)]
+    dict_pages = [to_dicts(page) for page in pages]
+
+    runs = {
+        "dicts": measure(lambda page: postprocess_dicts(page, args.min_confidence, args.iou), dict_pages, args.repeats),
+        "numpy": measure(lambda page: postprocess(page, args.min_confidence, iou_threshold=args.iou), pages, args.repeats),
+    }
+    try:
+        runs["torchvision"] = measure(
+            lambda page: postprocess_torchvision(page, args.min_confidence, args.iou), pages, args.repeats
+        )
+    except ImportError:
+        print("torchvision não disponível; referência ignorada")
+
+    print(f"{args.pages} páginas, {args.candidates} caixas brutas por página, {args.classes} classes, IoU {args.iou}")
+    print(f"{'implementação':<14} {'mediana':>10} {'p95':>10} {'mantidas':>10}")
+    for name, (latencies, results) in runs.items():
+        kept = np.mean([len(result) for result in results])
+        print(f"{name:<14} {np.median(latencies):>8.2f}ms {np.percentile(latencies, 95):>8.2f}ms {kept:>10.1f}")
+
+    speedup = np.median(runs["dicts"][0]) / np.median(runs["numpy"][0])
+    print(f"speedup numpy x dicts (mediana): {speedup:.1f}x")
+
+    if "torchvision" in runs:
+        # Mesmas caixas mantidas (a ordem pode diferir em empates de confiança)
+        matches = all(
+            len(ours) == len(reference)
+            and np.allclose(np.sort(ours[:, :4], axis=0), np.sort(reference[:, :4], axis=0))
+            for ours, reference in zip(runs["numpy"][1], runs["torchvision"][1])
+        )
+        print(f"resultado igual ao torchvision: {'sim' if matches else 'não'}")
+
+
+if __name__ == "__main__":
+    main()
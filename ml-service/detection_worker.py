@@ -0,0 +1,215 @@
+"""
+Pool de workers para a detecção de catálogos completos.
+
+``POST /detect/<catalog_id>`` apenas registra o job e o coloca em uma fila
+limitada; threads em background retiram os jobs da fila, dividem as páginas
+do catálogo em lotes e os processam, atualizando o progresso no job store a
+cada lote concluído.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from job_store import WORKER_NAME, JobStore
+
+# Número de jobs (catálogos) processados simultaneamente
+DETECTION_WORKERS = int(os.environ.get("DETECTION_WORKERS", "2"))
+
+# Número de lotes de páginas processados simultaneamente (somando todos os jobs).
+# Cada lote já usa INFERENCE_THREADS núcleos na inferência, então o padrão é 1;
+# ao aumentar, reduza INFERENCE_THREADS para cerca de núcleos / DETECTION_PAGE_WORKERS
+DETECTION_PAGE_WORKERS = int(os.environ.get("DETECTION_PAGE_WORKERS", "1"))
+
+# Número de páginas por lote
+DETECTION_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", "4"))
+
+# Tamanho máximo da fila; acima disso novos jobs são recusados (503)
+DETECTION_QUEUE_SIZE = int(os.environ.get("DETECTION_QUEUE_SIZE", "32"))
+
+# Arquivos de página gerados pelo backend (tamanho original)
+PAGE_FILE_PATTERN = re.compile(r"^page_(\d+)\.jpg$")
+
+# Função que detecta objetos em um lote de páginas:
+# (job, [(número da página, caminho)]) -> anotações de cada página, na mesma ordem
+PageDetector = Callable[[Dict[str, Any], List[Tuple[int, str]]], List[List[Dict[str, Any]]]]
+
+
+def list_catalog_pages(images_dir: str) -> List[Tuple[int, str]]:
+    """
+    Lista as páginas renderizadas de um catálogo, em ordem.
+    """
+    if not os.path.isdir(images_dir):
+        return []
+
+    pages = []
+    for filename in os.listdir(images_dir):
+        match = PAGE_FILE_PATTERN.match(filename)
+        if match:
+            pages.append((int(match.group(1)), os.path.join(images_dir, filename)))
+    return sorted(pages)
+
+
+class DetectionWorkerPool:
+    """
+    Fila limitada de jobs de detecção de catálogo e as threads que a consomem.
+    """
+
+    def __init__(
+        self,
+        jobs: JobStore,
+        detect_pages: PageDetector,
+        images_root: str,
+        workers: int = DETECTION_WORKERS,
+        page_workers: int = DETECTION_PAGE_WORKERS,
+        queue_size: int = DETECTION_QUEUE_SIZE,
+        batch_size: int = DETECTION_BATCH_SIZE
+    ):
+        self.jobs = jobs
+        self.detect_pages = detect_pages
+        self.images_root = images_root
+        self.workers = workers
+        self.page_workers = page_workers
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._page_executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        """
+        Inicia as threads (idempotente) e reenfileira os jobs desta réplica
+        que não terminaram antes de um restart.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._page_executor = ThreadPoolExecutor(
+                max_workers=self.page_workers,
+                thread_name_prefix="detection-page"
+            )
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"detection-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        for job in self.jobs.list(statuses=["pending", "processing"]):
+            if job.get("worker") == WORKER_NAME and not self._enqueue(job["id"]):
+                self.jobs.update(job["id"], {"status": "failed", "error": "Fila de detecção cheia após reinício"})
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Sinaliza o fim das threads e aguarda o término dos jobs em andamento.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+        if self._page_executor is not None:
+            self._page_executor.shutdown(wait=False)
+            self._page_executor = None
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """
+        Registra o job no store e o coloca na fila.
+
+        Retorna False (e não registra o job) se a fila estiver cheia.
+        """
+        self.start()
+        job["worker"] = WORKER_NAME
+        self.jobs.put(job)
+        if not self._enqueue(job["id"]):
+            self.jobs.delete(job["id"])
+            return False
+        return True
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def _enqueue(self, job_id: str) -> bool:
+        try:
+            self._queue.put_nowait(job_id)
+            return True
+        except queue.Full:
+            return False
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                if job_id is None:
+                    return
+                self._process_job(job_id)
+            except Exception as e:
+                error_msg = f"Erro durante a detecção: {str(e)}"
+                print(error_msg)
+                self.jobs.update(job_id, {"status": "failed", "error": error_msg}, log=error_msg)
+            finally:
+                self._queue.task_done()
+
+    def _process_job(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] not in ("pending", "processing"):
+            return
+
+        catalog_id = job["catalog_id"]
+        pages = list_catalog_pages(os.path.join(self.images_root, catalog_id))
+        if not pages:
+            error_msg = f"Nenhuma página encontrada para o catálogo {catalog_id}"
+            self.jobs.update(job_id, {"status": "failed", "error": error_msg}, log=error_msg)
+            return
+
+        total_pages = len(pages)
+        started_at = time.time()
+        self.jobs.update(job_id, {
+            "status": "processing",
+            "progress": {"percentage": 0, "processed_pages": 0, "total_pages": total_pages}
+        }, log=f"Processando {total_pages} páginas")
+
+        batches = [pages[start:start + self.batch_size] for start in range(0, total_pages, self.batch_size)]
+        futures = {self._page_executor.submit(self.detect_pages, job, batch): batch for batch in batches}
+
+        results = []
+        detections_count = 0
+        try:
+            for future in as_completed(futures):
+                batch = futures[future]
+                for (page_number, _), annotations in zip(batch, future.result()):
+                    detections_count += len(annotations)
+                    results.append({
+                        "page_number": page_number,
+                        "image_path": f"/api/catalogs/{catalog_id}/pages/{page_number}/image",
+                        "annotations": annotations
+                    })
+                processed = len(results)
+                self.jobs.update(job_id, {
+                    "progress": {
+                        "processed_pages": processed,
+                        "percentage": round(processed * 100 / total_pages, 1)
+                    },
+                    "detections_count": detections_count
+                })
+        except BaseException:
+            # O job falhou: cancelar os lotes que ainda não começaram, que
+            # ocupariam o pool de páginas à toa (compartilhado com outros jobs)
+            for future in futures:
+                future.cancel()
+            raise
+
+        results.sort(key=lambda page: page["page_number"])
+        elapsed = time.time() - started_at
+        self.jobs.update(job_id, {
+            "status": "completed",
+            "progress": {"percentage": 100, "processed_pages": total_pages},
+            "detections_count": detections_count,
+            "results": results
+        }, log=f"Processamento concluído: {detections_count} detecções em {elapsed:.1f}s")
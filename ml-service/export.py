@@ -0,0 +1,109 @@
+"""
+Exportação de modelos treinados para artefatos otimizados para CPU.
+
+- ``torchscript``: modelo com as camadas lineares quantizadas dinamicamente
+  (int8) e compilado com ``torch.jit.script``; é o artefato usado pelo motor
+  de inferência quando presente.
+- ``onnx``: modelo fp32 em ONNX (opset 11), para uso em outros runtimes.
+
+Os artefatos ficam em ``MODELS_DIR/<model_id>/`` e seus metadados são
+gravados no registro de modelos (``artifacts`` em models_metadata.json).
+"""
+import inspect
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+import torch
+
+from inference import INFERENCE_MIN_SIZE, load_eager_model
+
+EXPORT_FORMATS = ("torchscript", "onnx")
+
+TORCHSCRIPT_FILENAME = "model_quantized.ts.pt"
+ONNX_FILENAME = "model.onnx"
+ONNX_OPSET = 11
+
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantização dinâmica (int8) das camadas lineares.
+
+    No Faster R-CNN isso cobre a cabeça de classificação das caixas, que
+    concentra a maior parte dos pesos; as convoluções continuam em fp32.
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_torchscript(model: torch.nn.Module, path: str, quantize: bool = True):
+    if quantize:
+        model = quantize_model(model)
+    scripted = torch.jit.script(model)
+    scripted.save(path)
+
+
+def export_onnx(model: torch.nn.Module, path: str):
+    # Entrada de exemplo no formato de uma página (retrato)
+    example = [torch.rand(3, INFERENCE_MIN_SIZE, int(INFERENCE_MIN_SIZE * 0.75))]
+    kwargs = {}
+    # Versões novas do PyTorch usam outro exportador por padrão
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    torch.onnx.export(
+        model,
+        (example,),
+        path,
+        opset_version=ONNX_OPSET,
+        input_names=["images"],
+        output_names=["boxes", "labels", "scores"],
+        dynamic_axes={"images": [1, 2], "boxes": [0], "labels": [0], "scores": [0]},
+        **kwargs
+    )
+
+
+def export_model(
+    model_info: Dict[str, Any],
+    models_dir: str,
+    formats: List[str],
+    quantize: bool = True
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Gera os artefatos pedidos para um modelo do registro.
+
+    Retorna os metadados de cada formato; um formato que falhar é
+    registrado com ``error`` sem impedir os demais.
+    """
+    model_id = model_info["model_id"]
+    output_dir = os.path.join(models_dir, model_id)
+    os.makedirs(output_dir, exist_ok=True)
+
+    artifacts = {}
+    for export_format in formats:
+        model, classes, class_agnostic = load_eager_model(model_info, models_dir)
+        if export_format == "torchscript":
+            path = os.path.join(output_dir, TORCHSCRIPT_FILENAME)
+            metadata = {"path": path, "quantized": quantize}
+        else:
+            path = os.path.join(output_dir, ONNX_FILENAME)
+            metadata = {"path": path, "opset": ONNX_OPSET}
+        metadata.update({"classes": classes, "class_agnostic": class_agnostic})
+
+        # Grava em arquivo temporário para não deixar um artefato incompleto
+        temp_path = f"{path}.part"
+        try:
+            if export_format == "torchscript":
+                export_torchscript(model, temp_path, quantize=quantize)
+            else:
+                export_onnx(model, temp_path)
+            os.replace(temp_path, path)
+            metadata["size_mb"] = round(os.path.getsize(path) / (1024 * 1024), 1)
+            metadata["created_at"] = datetime.now().isoformat()
+            print(f"Artefato {export_format} do modelo {model_id} salvo em {path}")
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            print(f"Erro ao exportar o modelo {model_id} para {export_format}: {str(e)}")
+            metadata = {"error": str(e)}
+
+        artifacts[export_format] = metadata
+    return artifacts
@@ -0,0 +1,331 @@
+"""
+Motor de inferência em CPU para detecção de produtos nas páginas.
+
+Usa o Faster R-CNN (ResNet-50 + FPN) do torchvision. Os pesos de um modelo
+treinado ficam em ``MODELS_DIR/<model_id>/model_final.pth``; modelos sem
+pesos em disco (como os modelos padrão do registro) usam os pesos
+pré-treinados no COCO, com todas as classes tratadas como "produto".
+Quando o modelo tem um artefato TorchScript otimizado (ver export.py), ele
+é usado no lugar dos pesos originais.
+
+As páginas são processadas em lotes de ``INFERENCE_BATCH_SIZE`` imagens,
+sob ``torch.no_grad()``, com o número de threads do PyTorch ajustado aos
+núcleos disponíveis. As detecções passam pelo pós-processamento vetorizado
+(``postprocess``): filtro de confiança e de classes e NMS por classe.
+
+Com ``tile_size``, cada página é dividida em tiles sobrepostos que passam
+pelo modelo em lotes; produtos pequenos em páginas grandes (A3) não somem
+na redução da página inteira para ``INFERENCE_MIN_SIZE``, e a memória fica
+limitada ao tamanho do tile. As detecções voltam para coordenadas da página
+e os pedaços de um mesmo produto são fundidos.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.models.detection import fasterrcnn_resnet50_fpn
+from torchvision.transforms import functional as F
+
+from postprocess import filter_detections, merge_tile_detections, postprocess, to_detections
+
+# Número de páginas por lote de inferência
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", "4"))
+
+# Threads usadas pelo PyTorch em cada operação
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", str(os.cpu_count() or 1)))
+
+# Menor lado da imagem na entrada do modelo (páginas são reduzidas para este tamanho)
+INFERENCE_MIN_SIZE = int(os.environ.get("INFERENCE_MIN_SIZE", "800"))
+INFERENCE_MAX_SIZE = int(os.environ.get("INFERENCE_MAX_SIZE", "1333"))
+
+# Confiança mínima aplicada já dentro do modelo (o filtro do job é aplicado depois)
+INFERENCE_SCORE_THRESHOLD = float(os.environ.get("INFERENCE_SCORE_THRESHOLD", "0.05"))
+
+# Limites do tamanho de tile (pixels) aceito por requisição
+TILE_MIN_SIZE = int(os.environ.get("TILE_MIN_SIZE", "256"))
+TILE_MAX_SIZE = int(os.environ.get("TILE_MAX_SIZE", "4096"))
+
+# Sobreposição (pixels) entre tiles vizinhos quando a requisição não informa
+TILE_DEFAULT_OVERLAP = int(os.environ.get("TILE_DEFAULT_OVERLAP", "128"))
+
+# Nome do arquivo de pesos de um modelo treinado
+WEIGHTS_FILENAME = "model_final.pth"
+
+torch.set_num_threads(INFERENCE_THREADS)
+
+
+def split_tiles(width: int, height: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Divide a página em tiles ``(x, y, largura, altura)`` de até ``tile_size``
+    pixels, com ``overlap`` pixels de sobreposição entre vizinhos.
+
+    O último tile de cada linha/coluna é alinhado à borda da página, para
+    que todos tenham o tamanho cheio (exceto em páginas menores que o tile).
+    """
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        step = tile_size - overlap
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(tile_size, width), min(tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def model_weights_path(models_dir: str, model_id: str) -> str:
+    return os.path.join(models_dir, model_id, WEIGHTS_FILENAME)
+
+
+def build_detector(num_classes: int, pretrained: bool = False) -> torch.nn.Module:
+    """
+    Cria o Faster R-CNN com ``num_classes`` classes (incluindo o fundo).
+    """
+    if pretrained:
+        model = fasterrcnn_resnet50_fpn(
+            pretrained=True,
+            min_size=INFERENCE_MIN_SIZE,
+            max_size=INFERENCE_MAX_SIZE,
+            box_score_thresh=INFERENCE_SCORE_THRESHOLD
+        )
+    else:
+        model = fasterrcnn_resnet50_fpn(
+            pretrained=False,
+            pretrained_backbone=False,
+            num_classes=num_classes,
+            min_size=INFERENCE_MIN_SIZE,
+            max_size=INFERENCE_MAX_SIZE,
+            box_score_thresh=INFERENCE_SCORE_THRESHOLD
+        )
+    return model
+
+
+def load_eager_model(model_info: Dict[str, Any], models_dir: str) -> Tuple[torch.nn.Module, List[str], bool]:
+    """
+    Carrega o modelo PyTorch (fp32) de um item do registro.
+
+    Retorna o modelo, as classes e se ele é agnóstico a classes (pesos do COCO).
+    """
+    model_id = model_info["model_id"]
+    classes = model_info.get("classes") or ["produto"]
+    weights_path = model_weights_path(models_dir, model_id)
+
+    if os.path.exists(weights_path):
+        checkpoint = torch.load(weights_path, map_location="cpu")
+        # Checkpoints de treinamento guardam os pesos em "model" junto com as classes
+        if isinstance(checkpoint, dict) and "model" in checkpoint:
+            classes = checkpoint.get("classes", classes)
+            checkpoint = checkpoint["model"]
+        model = build_detector(len(classes) + 1)
+        model.load_state_dict(checkpoint)
+        print(f"Modelo {model_id} carregado de {weights_path}")
+        return model.eval(), list(classes), False
+
+    print(f"Pesos do modelo {model_id} não encontrados, usando Faster R-CNN pré-treinado no COCO")
+    torch.hub.set_dir(os.path.join(models_dir, "torch_hub"))
+    return build_detector(0, pretrained=True).eval(), list(classes[:1]), True
+
+
+class DetectionEngine:
+    """
+    Detector carregado em memória, pronto para inferência em lotes.
+
+    ``classes`` são os nomes das classes do modelo, na ordem dos rótulos
+    (o rótulo 0 é o fundo). Com ``class_agnostic``, qualquer rótulo é
+    reportado como a primeira classe (usado com os pesos do COCO).
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        model: torch.nn.Module,
+        classes: Sequence[str],
+        class_agnostic: bool = False,
+        artifact: Optional[str] = None,
+        size_bytes: Optional[int] = None
+    ):
+        self.model_id = model_id
+        self.model = model.eval()
+        self.classes = list(classes)
+        self.class_agnostic = class_agnostic
+        # Caminho do artefato TorchScript, quando o motor usa um
+        self.artifact = artifact
+        self._size_bytes = size_bytes
+
+    @classmethod
+    def load(cls, model_info: Dict[str, Any], models_dir: str, prefer_artifact: bool = True) -> "DetectionEngine":
+        """
+        Carrega o modelo de um item do registro (models_db).
+
+        Com ``prefer_artifact``, usa o artefato TorchScript registrado em
+        ``artifacts`` quando ele existe em disco.
+        """
+        model_id = model_info["model_id"]
+        torchscript = (model_info.get("artifacts") or {}).get("torchscript") or {}
+        artifact_path = torchscript.get("path")
+
+        if prefer_artifact and artifact_path and os.path.exists(artifact_path):
+            model = torch.jit.load(artifact_path, map_location="cpu")
+            print(f"Modelo {model_id} carregado do artefato {artifact_path}")
+            return cls(
+                model_id,
+                model,
+                torchscript.get("classes") or model_info.get("classes") or ["produto"],
+                class_agnostic=torchscript.get("class_agnostic", False),
+                artifact=artifact_path,
+                # Pesos quantizados não aparecem em parameters(); usa o tamanho do arquivo
+                size_bytes=os.path.getsize(artifact_path)
+            )
+
+        model, classes, class_agnostic = load_eager_model(model_info, models_dir)
+        return cls(model_id, model, classes, class_agnostic=class_agnostic)
+
+    def predict(self, images: List[Image.Image]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Executa o detector em um lote de imagens.
+
+        Retorna, para cada imagem, as caixas (N, 4) em pixels da imagem
+        original, as confianças (N,) e os rótulos (N,).
+
+        Pode ser chamado por várias threads ao mesmo tempo: em modo eval e
+        sob ``no_grad`` o forward não altera o estado do modelo, então lotes
+        de jobs diferentes (ou de ``DETECTION_PAGE_WORKERS`` > 1) rodam em
+        paralelo sobre a mesma instância.
+        """
+        tensors = [F.to_tensor(image.convert("RGB")) for image in images]
+        with torch.no_grad():
+            outputs = self.model(tensors)
+        # Modelos TorchScript retornam a tupla (perdas, detecções)
+        if isinstance(outputs, tuple):
+            outputs = outputs[1]
+        return [
+            (output["boxes"].numpy(), output["scores"].numpy(), output["labels"].numpy())
+            for output in outputs
+        ]
+
+    def memory_bytes(self) -> int:
+        """
+        Memória ocupada pelos pesos e buffers do modelo.
+        """
+        if self._size_bytes is not None:
+            return self._size_bytes
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    def label_name(self, label: int) -> str:
+        if self.class_agnostic:
+            return self.classes[0]
+        return self.classes[label - 1] if 0 < label <= len(self.classes) else str(label)
+
+    def class_ids(self, detect_classes: Optional[Sequence[str]]) -> Optional[List[int]]:
+        """
+        Rótulos do modelo correspondentes às classes pedidas (None = todas).
+        """
+        if not detect_classes:
+            return None
+        if self.class_agnostic:
+            return [1] if self.classes[0] in detect_classes else []
+        return [index + 1 for index, name in enumerate(self.classes) if name in detect_classes]
+
+    def to_detections(self, boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """
+        Saída do detector como array (N, 6); em modelos sem classes próprias
+        todos os rótulos viram a primeira classe, para que o NMS trate as
+        caixas como do mesmo tipo.
+        """
+        if self.class_agnostic:
+            labels = np.ones_like(labels)
+        return to_detections(boxes, scores, labels)
+
+    def to_annotations(self, page_number: int, detections: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Converte as detecções (N, 6) já filtradas para o formato de anotações da API.
+        """
+        annotations = []
+        for index, (x1, y1, x2, y2, score, label) in enumerate(detections.tolist()):
+            annotations.append({
+                "id": f"prod_{page_number:03d}_{index + 1:03d}",
+                "type": self.label_name(int(label)),
+                "confidence": round(score, 4),
+                "bbox": {"x1": int(round(x1)), "y1": int(round(y1)), "x2": int(round(x2)), "y2": int(round(y2))}
+            })
+        return annotations
+
+    def detect_pages(
+        self,
+        pages: List[Tuple[int, str]],
+        min_confidence: float,
+        detect_classes: Optional[Sequence[str]] = None,
+        tile_size: Optional[int] = None,
+        tile_overlap: int = TILE_DEFAULT_OVERLAP
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Detecta objetos em um lote de páginas ``(número, caminho da imagem)``.
+
+        Com ``tile_size``, as páginas são processadas em tiles (ver ``detect_tiled_page``).
+        """
+        class_ids = self.class_ids(detect_classes)
+        if tile_size:
+            return [
+                self.to_annotations(
+                    page_number,
+                    self.detect_tiled_page(image_path, min_confidence, class_ids, tile_size, tile_overlap)
+                )
+                for page_number, image_path in pages
+            ]
+
+        images = []
+        for _, image_path in pages:
+            with Image.open(image_path) as image:
+                image.load()
+                images.append(image)
+
+        predictions = self.predict(images)
+        return [
+            self.to_annotations(
+                page_number,
+                postprocess(self.to_detections(boxes, scores, labels), min_confidence, class_ids)
+            )
+            for (page_number, _), (boxes, scores, labels) in zip(pages, predictions)
+        ]
+
+    def detect_tiled_page(
+        self,
+        image_path: str,
+        min_confidence: float,
+        class_ids: Optional[Sequence[int]],
+        tile_size: int,
+        tile_overlap: int
+    ) -> np.ndarray:
+        """
+        Detecta objetos em uma página dividida em tiles, em lotes de
+        ``INFERENCE_BATCH_SIZE`` tiles, e retorna as detecções (N, 6) em
+        coordenadas da página, já fundidas entre tiles e com NMS.
+
+        Só a página e um lote de tiles ficam em memória por vez.
+        """
+        with Image.open(image_path) as image:
+            page = image.convert("RGB")
+
+        tiles = []
+        try:
+            regions = split_tiles(page.width, page.height, tile_size, tile_overlap)
+            for start in range(0, len(regions), INFERENCE_BATCH_SIZE):
+                batch = regions[start:start + INFERENCE_BATCH_SIZE]
+                crops = [page.crop((x, y, x + width, y + height)) for x, y, width, height in batch]
+                predictions = self.predict(crops)
+                for crop in crops:
+                    crop.close()
+
+                for region, (boxes, scores, labels) in zip(batch, predictions):
+                    detections = filter_detections(self.to_detections(boxes, scores, labels), min_confidence, class_ids)
+                    tiles.append((*region, detections))
+            return merge_tile_detections(tiles, page.width, page.height)
+        finally:
+            page.close()
@@ -0,0 +1,301 @@
+"""
+Armazenamento de jobs (detecção, catálogos e treinamento) do serviço de ML.
+
+Substitui os dicionários globais em memória por uma interface comum com duas
+implementações:
+
+- ``InMemoryJobStore``: dicionário protegido por lock (padrão, um processo);
+- ``SQLiteJobStore``: arquivo SQLite em modo WAL, que sobrevive a restarts e
+  pode ser compartilhado por várias réplicas do serviço no mesmo host. O
+  arquivo precisa estar em um volume local: o WAL usa memória compartilhada
+  (arquivo ``-shm``) e locks que não funcionam em sistemas de arquivos de
+  rede (NFS, SMB, EFS).
+
+Em ambas, jobs finalizados são removidos após ``JOB_TTL_SECONDS``, de forma
+que o uso de memória/disco fica estável sob carga contínua. A varredura é
+feita no máximo uma vez a cada ``JOB_EVICTION_INTERVAL`` segundos, durante
+leituras e gravações, então também acontece quando só há consultas.
+"""
+import abc
+import copy
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Implementação usada: "memory" ou "sqlite"
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+
+# Arquivo do banco SQLite (quando JOB_STORE=sqlite)
+JOB_STORE_PATH = os.environ.get(
+    "JOB_STORE_PATH",
+    os.path.join(os.environ.get("DATA_DIR", "/data"), "ml_jobs.sqlite3")
+)
+
+# Tempo (segundos) que um job finalizado permanece disponível para consulta
+JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", str(24 * 3600)))
+
+# Intervalo mínimo (segundos) entre duas varreduras de expiração
+JOB_EVICTION_INTERVAL = float(os.environ.get("JOB_EVICTION_INTERVAL", "60"))
+
+# Identifica a réplica dona do job (usado para retomá-lo após restart)
+WORKER_NAME = os.environ.get("WORKER_NAME", socket.gethostname())
+
+# Status que indicam que o job terminou (e pode expirar)
+FINISHED_STATUSES = {"completed", "failed", "cancelado"}
+
+
+def merge_job_fields(job: Dict[str, Any], fields: Dict[str, Any], log: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Aplica uma atualização parcial ao job.
+
+    Campos com dicionário (como ``progress``) são mesclados em vez de
+    substituídos. ``log`` é adicionado ao final da lista de logs.
+    """
+    for key, value in fields.items():
+        if isinstance(value, dict) and isinstance(job.get(key), dict):
+            job[key].update(value)
+        else:
+            job[key] = value
+
+    if log is not None:
+        job.setdefault("log", []).append(log)
+
+    job["updated_at"] = datetime.now().isoformat()
+    if job.get("status") in FINISHED_STATUSES and not job.get("finished_at"):
+        job["finished_at"] = time.time()
+    return job
+
+
+class JobStore(abc.ABC):
+    """
+    Interface comum dos armazenamentos de jobs.
+
+    Os métodos sempre trabalham com cópias: alterar o dicionário retornado
+    por ``get`` não altera o job armazenado; use ``update``.
+    """
+
+    def __init__(self, ttl: float = JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._last_eviction = time.monotonic()
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna uma cópia do job, ou None se ele não existir.
+        """
+
+    @abc.abstractmethod
+    def put(self, job: Dict[str, Any]):
+        """
+        Grava (ou substitui) um job. O dicionário precisa ter o campo ``id``.
+        """
+
+    @abc.abstractmethod
+    def update(
+        self,
+        job_id: str,
+        fields: Dict[str, Any],
+        log: Optional[str] = None,
+        expected_status: Optional[Iterable[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Atualiza atomicamente parte dos campos do job e retorna o job atualizado.
+
+        Com ``expected_status``, a atualização só é aplicada se o status atual
+        do job for um desses (compare-and-set); caso contrário retorna None,
+        como para um job inexistente.
+        """
+
+    @abc.abstractmethod
+    def delete(self, job_id: str):
+        """
+        Remove o job, se existir.
+        """
+
+    @abc.abstractmethod
+    def list(self, statuses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Lista cópias dos jobs, opcionalmente filtrando pelos status.
+        """
+
+    @abc.abstractmethod
+    def evict_expired(self) -> int:
+        """
+        Remove jobs finalizados há mais de ``ttl`` segundos. Retorna quantos foram removidos.
+        """
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def _maybe_evict(self):
+        # Varredura preguiçosa, feita no máximo uma vez por intervalo
+        now = time.monotonic()
+        if now - self._last_eviction >= JOB_EVICTION_INTERVAL:
+            self._last_eviction = now
+            self.evict_expired()
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Jobs em um dicionário na memória do processo.
+    """
+
+    def __init__(self, ttl: float = JOB_TTL_SECONDS):
+        super().__init__(ttl)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        self._maybe_evict()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def put(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = copy.deepcopy(job)
+        self._maybe_evict()
+
+    def update(self, job_id, fields, log=None, expected_status=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (expected_status is not None and job.get("status") not in expected_status):
+                return None
+            merge_job_fields(job, copy.deepcopy(fields), log)
+            return copy.deepcopy(job)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def list(self, statuses=None):
+        self._maybe_evict()
+        with self._lock:
+            return [
+                copy.deepcopy(job) for job in self._jobs.values()
+                if statuses is None or job.get("status") in statuses
+            ]
+
+    def evict_expired(self):
+        expire_before = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.get("finished_at") and job["finished_at"] < expire_before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Jobs em um arquivo SQLite, compartilhável entre processos e réplicas.
+
+    Cada tipo de job (``kind``) usa as mesmas tabelas, separado por coluna.
+    Cada thread usa sua própria conexão.
+    """
+
+    def __init__(self, path: str, kind: str, ttl: float = JOB_TTL_SECONDS):
+        super().__init__(ttl)
+        self.path = path
+        self.kind = kind
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " kind TEXT NOT NULL,"
+            " job_id TEXT NOT NULL,"
+            " status TEXT,"
+            " finished_at REAL,"
+            " doc TEXT NOT NULL,"
+            " PRIMARY KEY (kind, job_id))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (kind, finished_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # isolation_level=None: transações controladas explicitamente
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, connection: sqlite3.Connection, job: Dict[str, Any]):
+        connection.execute(
+            "INSERT OR REPLACE INTO jobs (kind, job_id, status, finished_at, doc) VALUES (?, ?, ?, ?, ?)",
+            (self.kind, job["id"], job.get("status"), job.get("finished_at"), json.dumps(job))
+        )
+
+    def get(self, job_id):
+        self._maybe_evict()
+        row = self._connection().execute(
+            "SELECT doc FROM jobs WHERE kind = ? AND job_id = ?", (self.kind, job_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, job):
+        self._write(self._connection(), job)
+        self._maybe_evict()
+
+    def update(self, job_id, fields, log=None, expected_status=None):
+        connection = self._connection()
+        # BEGIN IMMEDIATE garante leitura e escrita atômicas entre processos
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT doc FROM jobs WHERE kind = ? AND job_id = ?", (self.kind, job_id)
+            ).fetchone()
+            job = json.loads(row[0]) if row else None
+            if job is None or (expected_status is not None and job.get("status") not in expected_status):
+                connection.execute("COMMIT")
+                return None
+            job = merge_job_fields(job, fields, log)
+            self._write(connection, job)
+            connection.execute("COMMIT")
+            return job
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id):
+        self._connection().execute("DELETE FROM jobs WHERE kind = ? AND job_id = ?", (self.kind, job_id))
+
+    def list(self, statuses=None):
+        self._maybe_evict()
+        if statuses is None:
+            rows = self._connection().execute("SELECT doc FROM jobs WHERE kind = ?", (self.kind,)).fetchall()
+        else:
+            placeholders = ", ".join("?" for _ in statuses)
+            rows = self._connection().execute(
+                f"SELECT doc FROM jobs WHERE kind = ? AND status IN ({placeholders})",
+                (self.kind, *statuses)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def evict_expired(self):
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE kind = ? AND finished_at IS NOT NULL AND finished_at < ?",
+            (self.kind, time.time() - self.ttl)
+        )
+        return cursor.rowcount
+
+
+def create_job_store(kind: str) -> JobStore:
+    """
+    Cria o armazenamento configurado em JOB_STORE para um tipo de job.
+    """
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH, kind)
+    if JOB_STORE != "memory":
+        print(f"JOB_STORE desconhecido '{JOB_STORE}', usando armazenamento em memória")
+    return InMemoryJobStore()
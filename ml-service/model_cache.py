@@ -0,0 +1,118 @@
+"""
+Cache LRU dos detectores carregados em memória.
+
+Carregar os pesos de um modelo leva segundos; o cache mantém os motores de
+inferência já carregados por ``model_id`` e descarta os usados há mais tempo
+quando a soma do tamanho dos modelos passa de ``MODEL_CACHE_MAX_MB``.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+# Memória máxima (MB) ocupada pelos modelos carregados
+MODEL_CACHE_MAX_MB = float(os.environ.get("MODEL_CACHE_MAX_MB", "1024"))
+
+
+class ModelCache:
+    """
+    Cache LRU de motores de inferência limitado por memória.
+
+    ``loader`` recebe o item do registro e retorna o motor carregado; o
+    motor deve expor ``memory_bytes()``. Cargas simultâneas do mesmo modelo
+    são feitas uma única vez.
+    """
+
+    def __init__(self, loader: Callable[[Dict[str, Any]], Any], max_bytes: float = MODEL_CACHE_MAX_MB * 1024 * 1024):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def get(self, model_info: Dict[str, Any]) -> Any:
+        """
+        Retorna o motor do modelo, carregando-o se não estiver no cache.
+        """
+        model_id = model_info["model_id"]
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None:
+                self._entries.move_to_end(model_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            loading_lock = self._loading.setdefault(model_id, threading.Lock())
+
+        with loading_lock:
+            try:
+                # Outra thread pode ter terminado a carga enquanto esperávamos
+                with self._lock:
+                    entry = self._entries.get(model_id)
+                    if entry is not None:
+                        self._entries.move_to_end(model_id)
+                        return entry[0]
+
+                started_at = time.time()
+                engine = self.loader(model_info)
+                size = engine.memory_bytes()
+
+                with self._lock:
+                    self.load_seconds += time.time() - started_at
+                    self._entries[model_id] = (engine, size)
+                    self._evict(keep=model_id)
+                return engine
+            finally:
+                # Também em caso de erro na carga: o lock não pode ficar para sempre em _loading
+                with self._lock:
+                    if self._loading.get(model_id) is loading_lock:
+                        del self._loading[model_id]
+
+    def _evict(self, keep: str):
+        # Remove os modelos menos usados até caber no orçamento (o recém-carregado fica)
+        while self.used_bytes > self.max_bytes and len(self._entries) > 1:
+            model_id = next(iter(self._entries))
+            if model_id == keep:
+                self._entries.move_to_end(model_id)
+                continue
+            del self._entries[model_id]
+            self.evictions += 1
+            print(f"Modelo {model_id} removido do cache de modelos")
+
+    def invalidate(self, model_id: str):
+        """
+        Remove um modelo do cache (por exemplo, quando ele é excluído).
+        """
+        with self._lock:
+            self._entries.pop(model_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, model_id: str) -> bool:
+        with self._lock:
+            return model_id in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "models": list(self._entries.keys()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+                "used_mb": round(self.used_bytes / (1024 * 1024), 1),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            }
@@ -0,0 +1,343 @@
+"""
+Pós-processamento vetorizado das detecções.
+
+As detecções de uma página são um array (N, 6) com as colunas
+``x1, y1, x2, y2, score, class`` (ver ``DETECTION_COLUMNS``), em vez de
+listas de dicionários; filtros e supressões trabalham sobre o array inteiro.
+
+- ``filter_detections``: confiança mínima e classes pedidas no job;
+- ``nms``: supressão de não-máximos por classe;
+- ``merge_tile_detections``: junta as detecções de tiles sobrepostos de uma
+  página (um produto cortado na borda de um tile aparece em pedaços nos
+  tiles vizinhos); só detecções de tiles diferentes, sobrepostas dentro da
+  faixa comum aos dois tiles, são fundidas.
+"""
+import os
+from typing import Iterable, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+DETECTION_COLUMNS = ("x1", "y1", "x2", "y2", "score", "class")
+SCORE, CLASS = 4, 5
+
+# Bordas de uma caixa, na ordem das colunas de ``StitchedTiles.cut``
+LEFT, TOP, RIGHT, BOTTOM = range(4)
+
+# IoU acima do qual a caixa de menor confiança (da mesma classe) é suprimida
+NMS_IOU_THRESHOLD = float(os.environ.get("NMS_IOU_THRESHOLD", "0.5"))
+
+# Fração da caixa menor coberta pela maior (ou, para pedaços cortados na
+# borda do tile, sobreposição da extensão no outro eixo) para que duas
+# detecções de tiles vizinhos sejam consideradas o mesmo objeto
+TILE_MERGE_THRESHOLD = float(os.environ.get("TILE_MERGE_THRESHOLD", "0.7"))
+
+# Distância (pixels) da borda interna do tile a partir da qual uma caixa é
+# considerada cortada pelo tile
+TILE_EDGE_TOLERANCE = float(os.environ.get("TILE_EDGE_TOLERANCE", "4"))
+
+# Tile de uma página: (x, y, largura, altura, detecções em coordenadas do tile)
+Tile = Tuple[int, int, int, int, np.ndarray]
+
+
+def empty_detections() -> np.ndarray:
+    return np.zeros((0, len(DETECTION_COLUMNS)), dtype=np.float32)
+
+
+def to_detections(boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Monta o array (N, 6) a partir da saída do detector.
+    """
+    if len(boxes) == 0:
+        return empty_detections()
+    return np.column_stack([
+        np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+        np.asarray(scores, dtype=np.float32),
+        np.asarray(labels, dtype=np.float32)
+    ])
+
+
+def filter_detections(
+    detections: np.ndarray,
+    min_confidence: float,
+    class_ids: Optional[Sequence[int]] = None
+) -> np.ndarray:
+    """
+    Mantém as detecções com confiança >= ``min_confidence`` e, se informado,
+    das classes em ``class_ids``.
+    """
+    keep = detections[:, SCORE] >= min_confidence
+    if class_ids is not None:
+        keep &= np.isin(detections[:, CLASS], np.asarray(class_ids, dtype=np.float32))
+    return detections[keep]
+
+
+class BoxColumns:
+    """
+    Coordenadas das caixas em arrays contíguos (um por coluna) e suas áreas.
+
+    Os laços gulosos do NMS e da fusão calculam, a cada passo, a interseção
+    de uma caixa com todas as restantes; com colunas separadas cada passo
+    faz poucas operações sobre arrays 1-D, sem cópias intermediárias.
+    """
+
+    def __init__(self, boxes: np.ndarray):
+        self.x1, self.y1, self.x2, self.y2 = (np.ascontiguousarray(boxes[:, k]) for k in range(4))
+        self.areas = (self.x2 - self.x1) * (self.y2 - self.y1)
+
+    def box(self, index: int) -> np.ndarray:
+        return np.array([self.x1[index], self.y1[index], self.x2[index], self.y2[index]])
+
+    def overlaps(self, box: np.ndarray, others: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Largura e altura da interseção de ``box`` com cada caixa em ``others``.
+        """
+        width = np.minimum(box[2], self.x2[others]) - np.maximum(box[0], self.x1[others])
+        height = np.minimum(box[3], self.y2[others]) - np.maximum(box[1], self.y1[others])
+        np.maximum(width, 0, out=width)
+        np.maximum(height, 0, out=height)
+        return width, height
+
+    def intersections(self, index: int, others: np.ndarray) -> np.ndarray:
+        """
+        Área da interseção da caixa ``index`` com cada caixa em ``others``.
+        """
+        width = np.minimum(self.x2[index], self.x2[others]) - np.maximum(self.x1[index], self.x1[others])
+        height = np.minimum(self.y2[index], self.y2[others]) - np.maximum(self.y1[index], self.y1[others])
+        np.maximum(width, 0, out=width)
+        np.maximum(height, 0, out=height)
+        return width * height
+
+
+def offset_by_class(detections: np.ndarray) -> np.ndarray:
+    """
+    Desloca as caixas de cada classe para uma região própria do plano, de
+    forma que caixas de classes diferentes nunca se sobreponham.
+
+    Permite fazer a supressão de todas as classes de uma vez, em vez de um
+    laço por classe.
+    """
+    boxes = detections[:, :4].astype(np.float64)
+    if len(boxes) == 0:
+        return boxes
+    span = boxes.max() - min(boxes.min(), 0) + 1
+    return boxes + (detections[:, CLASS].astype(np.float64) * span)[:, None]
+
+
+def nms(detections: np.ndarray, iou_threshold: float = NMS_IOU_THRESHOLD, class_aware: bool = True) -> np.ndarray:
+    """
+    Supressão de não-máximos; retorna as detecções mantidas, da maior para a
+    menor confiança.
+
+    A cada passo, a caixa de maior confiança restante é mantida e o IoU dela
+    contra todas as restantes é calculado de uma vez; as suprimidas saem do
+    conjunto, que encolhe a cada iteração. (Calcular a matriz de IoU N x N
+    de uma vez foi mais lento a partir de algumas centenas de caixas.)
+    """
+    if len(detections) == 0:
+        return detections
+
+    columns = BoxColumns(offset_by_class(detections) if class_aware else detections[:, :4].astype(np.float64))
+    areas = columns.areas
+    order = np.argsort(-detections[:, SCORE], kind="stable")
+
+    keep = []
+    while order.size > 0:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        intersection = columns.intersections(best, rest)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return detections[keep]
+
+
+class StitchedTiles(NamedTuple):
+    """
+    Detecções dos tiles de uma página, em coordenadas da página.
+    """
+    # (N, 6) detecções
+    detections: np.ndarray
+    # (N,) índice do tile de origem de cada detecção
+    tile_ids: np.ndarray
+    # (N, 4) bordas da caixa (``LEFT``, ``TOP``, ``RIGHT``, ``BOTTOM``) que
+    # encostam em uma borda do tile que não é borda da página: o objeto
+    # provavelmente continua no tile vizinho
+    cut: np.ndarray
+    # (T, 4) tiles como caixas (x1, y1, x2, y2) da página
+    tile_boxes: np.ndarray
+
+
+def stitch_tiles(tiles: Iterable[Tile], page_width: int, page_height: int) -> StitchedTiles:
+    """
+    Converte as detecções de cada tile para coordenadas da página e as concatena.
+    """
+    stitched = []
+    tile_ids = []
+    cuts = []
+    tile_boxes = []
+    for tile_id, (offset_x, offset_y, width, height, detections) in enumerate(tiles):
+        tile_boxes.append((offset_x, offset_y, offset_x + width, offset_y + height))
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, len(DETECTION_COLUMNS))
+        if len(detections) == 0:
+            continue
+        inner_edges = np.array(
+            [offset_x > 0, offset_y > 0, offset_x + width < page_width, offset_y + height < page_height]
+        )
+        cut = np.column_stack([
+            detections[:, 0] <= TILE_EDGE_TOLERANCE,
+            detections[:, 1] <= TILE_EDGE_TOLERANCE,
+            detections[:, 2] >= width - TILE_EDGE_TOLERANCE,
+            detections[:, 3] >= height - TILE_EDGE_TOLERANCE
+        ]) & inner_edges
+
+        shifted = detections.copy()
+        shifted[:, [0, 2]] += offset_x
+        shifted[:, [1, 3]] += offset_y
+        stitched.append(shifted)
+        tile_ids.append(np.full(len(detections), tile_id))
+        cuts.append(cut)
+
+    if not stitched:
+        return StitchedTiles(
+            empty_detections(), np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=bool),
+            np.asarray(tile_boxes, dtype=np.float64).reshape(-1, 4)
+        )
+    return StitchedTiles(
+        np.concatenate(stitched), np.concatenate(tile_ids), np.concatenate(cuts),
+        np.asarray(tile_boxes, dtype=np.float64)
+    )
+
+
+def same_object_pieces(
+    stitched: StitchedTiles,
+    columns: BoxColumns,
+    index: int,
+    others: np.ndarray,
+    threshold: float = TILE_MERGE_THRESHOLD
+) -> np.ndarray:
+    """
+    Indica, para cada caixa em ``others`` (de outros tiles), se ela e a caixa
+    ``index`` são o mesmo objeto visto por dois tiles.
+
+    A interseção das duas precisa estar dentro da faixa de sobreposição dos
+    tiles; além disso, ou a menor está contida na maior (objeto inteiro na
+    faixa, visto pelos dois tiles), ou uma delas foi cortada pela borda do
+    tile, a outra continua além desse corte e as duas têm quase a mesma
+    extensão no outro eixo (objeto maior que a faixa, em pedaços).
+    """
+    x1, y1, x2, y2 = columns.x1, columns.y1, columns.x2, columns.y2
+    tile = stitched.tile_boxes[stitched.tile_ids[index]]
+    other_tiles = stitched.tile_boxes[stitched.tile_ids[others]]
+
+    # Interseção das caixas e faixa de sobreposição dos tiles
+    inter_x1 = np.maximum(x1[index], x1[others])
+    inter_y1 = np.maximum(y1[index], y1[others])
+    inter_x2 = np.minimum(x2[index], x2[others])
+    inter_y2 = np.minimum(y2[index], y2[others])
+    width = inter_x2 - inter_x1
+    height = inter_y2 - inter_y1
+    in_band = (
+        (inter_x1 >= np.maximum(tile[0], other_tiles[:, 0]) - TILE_EDGE_TOLERANCE)
+        & (inter_y1 >= np.maximum(tile[1], other_tiles[:, 1]) - TILE_EDGE_TOLERANCE)
+        & (inter_x2 <= np.minimum(tile[2], other_tiles[:, 2]) + TILE_EDGE_TOLERANCE)
+        & (inter_y2 <= np.minimum(tile[3], other_tiles[:, 3]) + TILE_EDGE_TOLERANCE)
+    )
+    overlapping = (width > 0) & (height > 0) & in_band
+
+    intersection = np.maximum(width, 0) * np.maximum(height, 0)
+    contained = intersection >= threshold * np.maximum(np.minimum(columns.areas[index], columns.areas[others]), 1e-9)
+
+    cut, other_cut = stitched.cut[index], stitched.cut[others]
+    crosses_x = (
+        (cut[LEFT] & (x1[others] < x1[index])) | (cut[RIGHT] & (x2[others] > x2[index]))
+        | (other_cut[:, LEFT] & (x1[index] < x1[others])) | (other_cut[:, RIGHT] & (x2[index] > x2[others]))
+    )
+    crosses_y = (
+        (cut[TOP] & (y1[others] < y1[index])) | (cut[BOTTOM] & (y2[others] > y2[index]))
+        | (other_cut[:, TOP] & (y1[index] < y1[others])) | (other_cut[:, BOTTOM] & (y2[index] > y2[others]))
+    )
+    span_x = width / np.maximum(np.maximum(x2[index], x2[others]) - np.minimum(x1[index], x1[others]), 1e-9)
+    span_y = height / np.maximum(np.maximum(y2[index], y2[others]) - np.minimum(y1[index], y1[others]), 1e-9)
+    split = (crosses_x & (span_y >= threshold)) | (crosses_y & (span_x >= threshold))
+
+    return overlapping & (contained | split)
+
+
+def merge_overlapping(
+    stitched: StitchedTiles,
+    threshold: float = TILE_MERGE_THRESHOLD,
+    class_aware: bool = True
+) -> np.ndarray:
+    """
+    Funde em uma única caixa as detecções de tiles diferentes que são o
+    mesmo objeto (ver ``same_object_pieces``).
+
+    Caixas do mesmo tile nunca são fundidas (produtos aninhados ou vizinhos
+    ficam para o NMS). O grupo começa na caixa de maior confiança e cresce
+    com pedaços de outros tiles, no máximo um por tile, até não haver mais
+    pedaços (um objeto pode atravessar vários tiles). A caixa resultante é a
+    união do grupo, com a confiança e a classe da melhor caixa.
+    """
+    detections = stitched.detections
+    if len(detections) == 0:
+        return detections
+
+    columns = BoxColumns(detections[:, :4].astype(np.float64))
+    order = np.argsort(-detections[:, SCORE], kind="stable")
+
+    merged = []
+    while order.size > 0:
+        best, rest = order[0], order[1:]
+        members = [best]
+        frontier = [best]
+        while frontier and rest.size > 0:
+            eligible = ~np.isin(stitched.tile_ids[rest], stitched.tile_ids[members])
+            if class_aware:
+                eligible &= detections[rest, CLASS] == detections[best, CLASS]
+            grouped = np.zeros(rest.size, dtype=bool)
+            if eligible.any():
+                for member in frontier:
+                    grouped |= eligible & same_object_pieces(stitched, columns, member, rest, threshold)
+            if not grouped.any():
+                break
+
+            # Um pedaço por tile: o de maior confiança (``rest`` está ordenado)
+            joined = rest[grouped]
+            _, first = np.unique(stitched.tile_ids[joined], return_index=True)
+            joined = joined[np.sort(first)]
+            members.extend(joined.tolist())
+            frontier = joined.tolist()
+            rest = rest[~np.isin(rest, joined)]
+
+        group = detections[members]
+        merged_box = detections[best].copy()
+        merged_box[:2] = group[:, :2].min(axis=0)
+        merged_box[2:4] = group[:, 2:4].max(axis=0)
+        merged.append(merged_box)
+        order = rest
+    return np.stack(merged)
+
+
+def merge_tile_detections(
+    tiles: Iterable[Tile],
+    page_width: int,
+    page_height: int,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    merge_threshold: float = TILE_MERGE_THRESHOLD
+) -> np.ndarray:
+    """
+    Junta as detecções dos tiles de uma página: converte para coordenadas da
+    página, funde os pedaços de um mesmo objeto e aplica NMS no resultado.
+    """
+    return nms(merge_overlapping(stitch_tiles(tiles, page_width, page_height), merge_threshold), iou_threshold)
+
+
+def postprocess(
+    detections: np.ndarray,
+    min_confidence: float,
+    class_ids: Optional[Sequence[int]] = None,
+    iou_threshold: float = NMS_IOU_THRESHOLD
+) -> np.ndarray:
+    """
+    Filtro de confiança e de classes seguido de NMS por classe.
+    """
+    return nms(filter_detections(detections, min_confidence, class_ids), iou_threshold)
@@ -1,13 +1,21 @@
 from flask import Flask, jsonify, request
 import os
-import time
 import uuid
 import json
-import requests
 import threading
-import random
 from datetime import datetime
 
+from detection_worker import DetectionWorkerPool
+from export import EXPORT_FORMATS, export_model
+from inference import TILE_DEFAULT_OVERLAP, TILE_MAX_SIZE, TILE_MIN_SIZE, DetectionEngine, model_weights_path
+from model_cache import ModelCache
+from training import (
+    INCREMENTAL_LEARNING_RATE, INCREMENTAL_MAX_ITER, TrainingCancelled, annotation_snapshot,
+    build_dataset_cache, fetch_annotations, load_dataset_meta, resolve_classes, split_pages, train_model
+)
+from training_scheduler import TrainingScheduler
+from job_store import create_job_store
+
 print("=== ML SERVICE INICIALIZADO ===")
 print(f"Variáveis de ambiente:")
 print(f"BACKEND_URL: {os.environ.get('BACKEND_URL', 'não definido')}")
@@ -16,9 +24,9 @@ print(f"MODELS_DIR: {os.environ.get('MODELS_DIR', 'não definido')}")
 
 app = Flask(__name__)
 
-# Armazenamento em memória para jobs de detecção e treinamento
-detection_jobs = {}
-training_jobs = {}
+# Armazenamento de jobs de detecção e treinamento (memória ou SQLite, ver job_store.py)
+detection_jobs = create_job_store("detection")
+training_jobs = create_job_store("training")
 
 # Função para salvar modelos em disco
 def save_models_to_disk():
@@ -88,7 +96,7 @@ def load_models_from_disk():
 
 # Inicializa a lista de modelos carregando do disco
 models_db = load_models_from_disk()
-catalog_jobs = {}  # Jobs para processamento de catálogos completos
+catalog_jobs = create_job_store("catalog")  # Jobs para processamento de catálogos completos
 
 # Configurações globais
 backend_url = os.environ.get("BACKEND_URL", "http://backend:8000")
@@ -105,7 +113,20 @@ def health_check():
     """
     Endpoint para verificar se o serviço está funcionando.
     """
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "detection_queue": detection_pool.queue_size()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métricas do serviço: cache de modelos e fila de detecção.
+    """
+    return jsonify({
+        "model_cache": model_cache.stats(),
+        "detection_queue": detection_pool.queue_size()
+    })
 
 @app.route('/detect', methods=['POST'])
 def detect_image():
@@ -131,7 +152,7 @@ def detect_image():
     job_id = str(uuid.uuid4())
     
     # Registrar o job
-    detection_jobs[job_id] = {
+    detection_jobs.put({
         "id": job_id,
         "image_url": image_url,
         "model_id": model_id,
@@ -141,16 +162,18 @@ def detect_image():
         "updated_at": datetime.now().isoformat(),
         "results": None,
         "error": None
-    }
+    })
     
     # Simulação de detecção bem-sucedida (para demonstração)
-    detection_jobs[job_id]["status"] = "completed"
-    detection_jobs[job_id]["results"] = {
-        "objects": [
-            {"class": "produto", "box": [10, 10, 100, 100], "score": 0.95}
-        ],
-        "processing_time": 0.5
-    }
+    detection_jobs.update(job_id, {
+        "status": "completed",
+        "results": {
+            "objects": [
+                {"class": "produto", "box": [10, 10, 100, 100], "score": 0.95}
+            ],
+            "processing_time": 0.5
+        }
+    })
     
     return jsonify({
         "job_id": job_id,
@@ -158,91 +181,131 @@ def detect_image():
         "message": "Detecção iniciada com sucesso"
     })
 
+def get_default_model_id():
+    """
+    Retorna o primeiro modelo pronto, usado quando a requisição não informa um modelo.
+    """
+    for model in models_db:
+        if model.get("status") == "ready":
+            return model.get("model_id")
+    return None
+
+def find_model(model_id):
+    """
+    Busca um modelo no registro pelo ID.
+    """
+    for model in models_db:
+        if model.get("model_id") == model_id:
+            return model
+    return None
+
+def detect_pages(job, pages):
+    """
+    Detecta produtos em um lote de páginas do catálogo.
+    """
+    model_info = find_model(job["model_id"])
+    if model_info is None:
+        raise ValueError(f"Modelo {job['model_id']} não encontrado")
+
+    engine = model_cache.get(model_info)
+    return engine.detect_pages(
+        pages,
+        job["min_confidence"],
+        job.get("detect_classes"),
+        tile_size=job.get("tile_size"),
+        tile_overlap=job.get("tile_overlap", TILE_DEFAULT_OVERLAP)
+    )
+
+# Detectores carregados em memória (LRU limitado por MODEL_CACHE_MAX_MB)
+model_cache = ModelCache(lambda model_info: DetectionEngine.load(model_info, models_dir))
+
+def preload_default_model():
+    """
+    Carrega o modelo padrão no cache, para que a primeira detecção não pague a carga.
+    """
+    model_info = find_model(get_default_model_id())
+    if model_info is None:
+        return
+    try:
+        model_cache.get(model_info)
+    except Exception as e:
+        print(f"Erro ao pré-carregar o modelo {model_info['model_id']}: {str(e)}")
+
+# Pool de workers que processa os jobs de detecção de catálogos em background
+detection_pool = DetectionWorkerPool(catalog_jobs, detect_pages, os.path.join(data_dir, "images"))
+
 @app.route('/detect/<catalog_id>', methods=['POST'])
 def start_detection(catalog_id):
     """
     Inicia a detecção em um catálogo completo.
+
+    O job é apenas enfileirado (202); o processamento acontece no pool de
+    workers e o progresso pode ser consultado em /detect/status/<job_id>.
     """
-    data = request.json
+    data = request.get_json(silent=True)
     
-    if not data:
+    if data is None:
         return jsonify({"detail": "Dados inválidos"}), 400
         
     # Extrair parâmetros da requisição
-    model_id = data.get("model_id")
+    model_id = data.get("model_id") or get_default_model_id()
     min_confidence = data.get("min_confidence", 0.7)
+    detect_classes = data.get("detect_classes", ["produto"])
+    tile_size = data.get("tile_size")
+    tile_overlap = data.get("tile_overlap", TILE_DEFAULT_OVERLAP)
     
     if not model_id:
         return jsonify({"detail": "ID do modelo é obrigatório"}), 400
+    
+    # Inferência em tiles (opcional): tamanho e sobreposição em pixels da página
+    if tile_size is not None:
+        if not isinstance(tile_size, int) or not TILE_MIN_SIZE <= tile_size <= TILE_MAX_SIZE:
+            return jsonify({"detail": f"tile_size deve ser um inteiro entre {TILE_MIN_SIZE} e {TILE_MAX_SIZE}"}), 400
+        if not isinstance(tile_overlap, int) or not 0 <= tile_overlap <= tile_size // 2:
+            return jsonify({"detail": "tile_overlap deve ser um inteiro entre 0 e metade do tile_size"}), 400
         
     # Criar ID único para o job
     job_id = str(uuid.uuid4())
     
-    # Registrar o job
-    catalog_jobs[job_id] = {
+    # Registrar e enfileirar o job
+    accepted = detection_pool.submit({
         "id": job_id,
         "catalog_id": catalog_id,
         "model_id": model_id,
         "min_confidence": min_confidence,
+        "detect_classes": detect_classes,
+        "tile_size": tile_size,
+        "tile_overlap": tile_overlap if tile_size else None,
         "status": "pending",
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat(),
         "progress": {
             "percentage": 0,
             "processed_pages": 0,
-            "total_pages": 10  # Valor fictício para demonstração
+            "total_pages": 0
         },
         "detections_count": 0,
-        "log": ["Iniciando processamento do catálogo"],
+        "log": ["Job de detecção enfileirado"],
         "error": None,
         "results": None
-    }
-    
-    # Simulação de processamento em background
-    # Em uma implementação real, isso seria feito em uma thread ou processo separado
-    catalog_jobs[job_id]["status"] = "processing"
-    catalog_jobs[job_id]["progress"]["percentage"] = 10
+    })
     
-    # Após um tempo, marcamos como concluído (simulação)
-    catalog_jobs[job_id]["status"] = "completed"
-    catalog_jobs[job_id]["progress"]["percentage"] = 100
-    catalog_jobs[job_id]["progress"]["processed_pages"] = 10
-    catalog_jobs[job_id]["detections_count"] = 25
-    catalog_jobs[job_id]["log"].append("Processamento concluído")
-    
-    # Adicionar resultados simulados
-    catalog_jobs[job_id]["results"] = [
-        {
-            "page_number": 1,
-            "image_path": f"/api/catalogs/{catalog_id}/pages/1/image",
-            "annotations": [
-                {"type": "produto", "confidence": 0.95, "bbox": {"x1": 100, "y1": 100, "x2": 400, "y2": 500}, "id": "prod_001"},
-                {"type": "produto", "confidence": 0.88, "bbox": {"x1": 450, "y1": 150, "x2": 750, "y2": 550}, "id": "prod_002"}
-            ]
-        },
-        {
-            "page_number": 2,
-            "image_path": f"/api/catalogs/{catalog_id}/pages/2/image",
-            "annotations": [
-                {"type": "produto", "confidence": 0.92, "bbox": {"x1": 200, "y1": 200, "x2": 500, "y2": 600}, "id": "prod_003"}
-            ]
-        }
-    ]
+    if not accepted:
+        return jsonify({"detail": "Fila de detecção cheia, tente novamente mais tarde"}), 503
     
     return jsonify({
         "job_id": job_id,
         "status": "pending",
         "message": f"Processamento do catálogo {catalog_id} iniciado com sucesso"
-    })
+    }), 202
 
 @app.route('/detect/status/<job_id>', methods=['GET'])
 def get_detection_status(job_id):
     """
     Consulta o status de um job de detecção.
     """
-    if job_id in detection_jobs:
-        job_info = detection_jobs[job_id]
-        
+    job_info = detection_jobs.get(job_id)
+    if job_info is not None:
         return jsonify({
             "job_id": job_id,
             "status": job_info["status"],
@@ -250,9 +313,9 @@ def get_detection_status(job_id):
             "updated_at": job_info["updated_at"],
             "error": job_info.get("error")
         })
-    elif job_id in catalog_jobs:
-        job_info = catalog_jobs[job_id]
-        
+
+    job_info = catalog_jobs.get(job_id)
+    if job_info is not None:
         return jsonify({
             "job_id": job_id,
             "catalog_id": job_info["catalog_id"],
@@ -264,17 +327,16 @@ def get_detection_status(job_id):
             "log": job_info["log"],
             "error": job_info.get("error")
         })
-    else:
-        return jsonify({"detail": f"Job de detecção {job_id} não encontrado"}), 404
+
+    return jsonify({"detail": f"Job de detecção {job_id} não encontrado"}), 404
 
 @app.route('/detect/result/<job_id>', methods=['GET'])
 def get_detection_result(job_id):
     """
     Retorna o resultado de um job de detecção concluído.
     """
-    if job_id in detection_jobs:
-        job_info = detection_jobs[job_id]
-        
+    job_info = detection_jobs.get(job_id)
+    if job_info is not None:
         if job_info["status"] != "completed":
             return jsonify({
                 "job_id": job_id,
@@ -289,9 +351,9 @@ def get_detection_result(job_id):
             "completed_at": job_info["updated_at"],
             "results": job_info["results"]
         })
-    elif job_id in catalog_jobs:
-        job_info = catalog_jobs[job_id]
-        
+
+    job_info = catalog_jobs.get(job_id)
+    if job_info is not None:
         if job_info["status"] != "completed":
             return jsonify({
                 "job_id": job_id,
@@ -313,8 +375,8 @@ def get_detection_result(job_id):
             },
             "results": job_info["results"] if "results" in job_info else []
         })
-    else:
-        return jsonify({"detail": f"Job de detecção {job_id} não encontrado"}), 404
+
+    return jsonify({"detail": f"Job de detecção {job_id} não encontrado"}), 404
 
 # Adiciona uma rota alternativa para compatibilidade com o backend
 @app.route('/results/<job_id>', methods=['GET'])
@@ -326,68 +388,118 @@ def get_results(job_id):
     print(f"Requisição para obter resultados de detecção via rota '/results/{job_id}'")
     return get_detection_result(job_id)
 
+def update_model_entry(model_id, fields):
+    """
+    Atualiza um modelo do registro e salva o registro em disco.
+    """
+    model = find_model(model_id)
+    if model is not None:
+        model.update(fields)
+        save_models_to_disk()
+
 def run_training(job_id, model_name, catalog_ids, config):
     """
     Executa o treinamento em background.
     """
+    job_info = training_jobs.get(job_id) or {}
+    model_id = job_info.get("model_id")
+    base_model = find_model(job_info.get("base_model_id"))
+
+    def log(message):
+        training_jobs.update(job_id, {}, log=message)
+
+    def on_progress(iteration, total_iters, loss):
+        # Atualiza o job a cada 1% e registra no log a cada 10%
+        step = max(1, total_iters // 100)
+        if iteration % step != 0 and iteration != total_iters:
+            return
+        progresso = round(iteration * 100 / total_iters, 1)
+        message = None
+        if iteration % max(1, total_iters // 10) == 0 or iteration == total_iters:
+            message = f"Iteração {iteration}/{total_iters} - Progresso: {progresso}% - Loss: {loss:.4f}"
+        training_jobs.update(
+            job_id,
+            {"progress": {"percentage": progresso, "current_iteration": iteration}},
+            log=message
+        )
+
+    def should_stop():
+        current = training_jobs.get(job_id)
+        return current is None or current["status"] == "cancelado"
+
+    # Só inicia se o job ainda estiver pendente: um cancelamento feito entre
+    # a saída da fila e este ponto não pode ser sobrescrito
+    started = training_jobs.update(
+        job_id, {"status": "em_andamento", "progress": {"percentage": 0}}, expected_status=("pending",)
+    )
+    if started is None:
+        print(f"Treinamento {job_id} não iniciado: job cancelado ou removido antes do início")
+        return
+
     try:
-        training_jobs[job_id]["status"] = "em_andamento"
-        training_jobs[job_id]["progresso"] = 0
-        
-        # Simular progresso de treinamento
         total_iters = config.get("max_iter", 1000)
+        log(f"Iniciando treinamento para modelo '{model_name}'")
+        log(f"Usando catálogos: {', '.join(catalog_ids)}")
+        log(f"Configuração: max_iter={total_iters}")
         
-        # Log inicial
-        training_jobs[job_id]["log"].append(f"Iniciando treinamento para modelo '{model_name}'")
-        training_jobs[job_id]["log"].append(f"Usando catálogos: {', '.join(catalog_ids)}")
-        training_jobs[job_id]["log"].append(f"Configuração: max_iter={total_iters}")
+        # Anotações salvas no backend para os catálogos; no modo incremental,
+        # dos catálogos já vistos pelo modelo base vêm apenas as posteriores ao snapshot dele
+        since = base_model.get("annotation_snapshot") if base_model else None
+        if base_model:
+            log(f"Ajuste fino a partir do modelo {base_model['model_id']} (anotações após {since or 'o início'})")
+            known = set(base_model.get("catalog_ids", []))
+            pages = fetch_annotations(backend_url, [c for c in catalog_ids if c in known], since=since)
+            pages += fetch_annotations(backend_url, [c for c in catalog_ids if c not in known])
+        else:
+            pages = fetch_annotations(backend_url, catalog_ids)
+        if not pages:
+            if base_model:
+                raise ValueError(f"Nenhuma anotação nova desde {since} para os catálogos informados")
+            raise ValueError("Nenhuma anotação encontrada para os catálogos informados")
+        # O ajuste fino mantém as classes do modelo base
+        classes = resolve_classes(pages, base_model.get("classes") if base_model else config.get("classes"))
+        log(f"{len(pages)} páginas anotadas, classes: {', '.join(classes)}")
         
-        # Simular o treinamento (em uma implementação real, isso usaria PyTorch e OpenCV)
-        for i in range(1, total_iters + 1):
-            # Atualizar progresso a cada 10%
-            if i % (total_iters // 10) == 0 or i == total_iters:
-                progresso = int((i / total_iters) * 100)
-                training_jobs[job_id]["progresso"] = progresso
-                
-                # Log a cada 10%
-                loss = random.uniform(0.1, 0.5) / (i / 100 + 1)  # Simular redução de loss
-                training_jobs[job_id]["log"].append(f"Iteração {i}/{total_iters} - Progresso: {progresso}% - Loss: {loss:.4f}")
-                
-                # Simular desempenho em validação a cada 25%
-                if i % (total_iters // 4) == 0 or i == total_iters:
-                    precision = min(0.95, 0.5 + (i / total_iters) * 0.4)
-                    recall = min(0.9, 0.4 + (i / total_iters) * 0.45)
-                    training_jobs[job_id]["log"].append(f"Validação: Precision={precision:.4f}, Recall={recall:.4f}")
-            
-            # Simular tempo de treinamento
-            time.sleep(0.01)  # Em um ambiente real, isso não seria necessário
-            
-            # Verificar se o treinamento foi cancelado
-            if training_jobs[job_id]["status"] == "cancelado":
-                training_jobs[job_id]["log"].append("Treinamento cancelado pelo usuário")
-                return
+        # Dataset pré-processado (reaproveitado se as anotações não mudaram)
+        dataset_dir = build_dataset_cache(
+            pages, os.path.join(data_dir, "images"), os.path.join(models_dir, "datasets"), classes, log=log
+        )
+        train_indices, val_indices = split_pages(load_dataset_meta(dataset_dir))
+        # O snapshot do modelo incremental continua o do modelo base se não houver datas novas
+        snapshot = annotation_snapshot(pages) or since
+        update_model_entry(model_id, {
+            "classes": classes,
+            "train_size": len(train_indices),
+            "val_size": len(val_indices),
+            "annotation_snapshot": snapshot
+        })
+        
+        result = train_model(
+            dataset_dir, model_id, models_dir, config,
+            on_progress=on_progress, should_stop=should_stop, log=log,
+            init_weights=model_weights_path(models_dir, base_model["model_id"]) if base_model else None
+        )
+        if result["metrics"]:
+            log(f"Validação: {', '.join(f'{name}={value}' for name, value in result['metrics'].items())}")
 
         # Treinamento concluído
-        training_jobs[job_id]["status"] = "completed"
-        training_jobs[job_id]["progress"]["percentage"] = 100.0
-        training_jobs[job_id]["progress"]["current_iteration"] = total_iters
-        training_jobs[job_id]["updated_at"] = datetime.now().isoformat()
-        training_jobs[job_id]["log"].append("Treinamento concluído com sucesso!")
+        training_jobs.update(job_id, {
+            "status": "completed",
+            "progress": {"percentage": 100.0, "current_iteration": result["iterations"]}
+        }, log="Treinamento concluído com sucesso!")
         
         # Atualizar status do modelo
-        for model in models_db:
-            if model.get("model_id") == model_id:
-                model["status"] = "ready"
-                model["completed_at"] = datetime.now().isoformat()
-                # Adicionar métricas calculadas
-                model["metrics"] = {
-                    "accuracy": 0.85 + random.random() * 0.1,
-                    "precision": 0.80 + random.random() * 0.15,
-                    "recall": 0.82 + random.random() * 0.12
-                }
-                # Salvar modelos em disco após atualização
-                save_models_to_disk()
-                break
+        update_model_entry(model_id, {
+            "status": "ready",
+            "completed_at": datetime.now().isoformat(),
+            "base_model": "faster_rcnn_R_50_FPN_3x",
+            "iterations": result["iterations"],
+            "metrics": result["metrics"]
+        })
+    
+    except TrainingCancelled:
+        log("Treinamento cancelado pelo usuário")
+        update_model_entry(model_id, {"status": "cancelado"})
     
     except Exception as e:
         # Registrar erro
@@ -395,19 +507,19 @@ def run_training(job_id, model_name, catalog_ids, config):
         print(error_msg)
         
         # Atualizar job
-        if job_id in training_jobs:
-            training_jobs[job_id]["status"] = "failed"
-            training_jobs[job_id]["error"] = error_msg
-            training_jobs[job_id]["log"].append(error_msg)
+        training_jobs.update(job_id, {"status": "failed", "error": error_msg}, log=error_msg)
         
         # Atualizar modelo
-        for model in models_db:
-            if model.get("model_id") == model_id:
-                model["status"] = "failed"
-                model["error"] = error_msg
-                # Salvar modelos em disco após atualização
-                save_models_to_disk()
-                break
+        update_model_entry(model_id, {"status": "failed", "error": error_msg})
+
+def run_training_job(job):
+    """
+    Executa um job retirado da fila do agendador de treinamentos.
+    """
+    run_training(job["id"], job["name"], job["catalog_ids"], job["config"])
+
+# Fila de prioridade dos treinamentos (no máximo TRAINING_CONCURRENCY simultâneos)
+training_scheduler = TrainingScheduler(training_jobs, run_training_job)
 
 @app.route('/train', methods=['POST'])
 def start_training():
@@ -423,22 +535,42 @@ def start_training():
     model_name = data.get("name", f"Modelo {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     catalog_ids = data.get("catalog_ids", [])
     config = data.get("config", {})
+    base_model_id = data.get("base_model_id")
+    priority = data.get("priority", 0)
     
-    # Não exigimos catálogos para permitir simulação
-    # if not catalog_ids:
-    #    return jsonify({"detail": "IDs de catálogo são obrigatórios para treinamento"}), 400
+    if not isinstance(priority, int):
+        return jsonify({"detail": "Prioridade deve ser um número inteiro"}), 400
+    
+    # Treinamento incremental: ajuste fino a partir de um modelo treinado
+    base_model = None
+    if base_model_id:
+        base_model = find_model(base_model_id)
+        if base_model is None:
+            return jsonify({"detail": f"Modelo base {base_model_id} não encontrado"}), 404
+        if base_model.get("status") != "ready" or not os.path.exists(model_weights_path(models_dir, base_model_id)):
+            return jsonify({"detail": f"Modelo base {base_model_id} não tem pesos treinados"}), 400
+        # O modelo novo cobre os catálogos do modelo base mais os informados
+        base_catalog_ids = base_model.get("catalog_ids", [])
+        catalog_ids = base_catalog_ids + [c for c in catalog_ids if c not in base_catalog_ids]
+        config.setdefault("max_iter", INCREMENTAL_MAX_ITER)
+        config.setdefault("learning_rate", INCREMENTAL_LEARNING_RATE)
+    
+    if not catalog_ids:
+        return jsonify({"detail": "IDs de catálogo são obrigatórios para treinamento"}), 400
         
     # Criar ID único para o job e modelo
     job_id = str(uuid.uuid4())
     model_id = str(uuid.uuid4())
     
-    # Registrar o job
-    training_jobs[job_id] = {
+    # Registrar o job e colocá-lo na fila de treinamentos
+    job = {
         "id": job_id,
         "model_id": model_id,
         "name": model_name,
         "catalog_ids": catalog_ids,
+        "base_model_id": base_model_id,
         "config": config,
+        "priority": priority,
         "status": "pending",
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat(),
@@ -459,6 +591,8 @@ def start_training():
         "created_at": datetime.now().isoformat(),
         "status": "pending",
         "config": config,
+        "catalog_ids": catalog_ids,
+        "parent_model_id": base_model_id,
         "train_size": 0,  # Será atualizado durante o treinamento
         "val_size": 0     # Será atualizado durante o treinamento
     })
@@ -466,27 +600,48 @@ def start_training():
     # Salvar modelos em disco
     save_models_to_disk()
     
-    # Iniciar treinamento em um thread separado
-    training_thread = threading.Thread(target=run_training, args=(job_id, model_name, catalog_ids, config))
-    training_thread.daemon = True
-    training_thread.start()
+    # O agendador inicia o treinamento quando houver vaga
+    training_scheduler.submit(job)
+    queued = training_scheduler.queued()
     
     return jsonify({
         "job_id": job_id,
         "model_id": model_id,
         "status": "pending",
+        "queue_position": queued.index(job_id) + 1 if job_id in queued else 0,
         "message": "Treinamento iniciado com sucesso"
     })
 
+@app.route('/train/cancel/<job_id>', methods=['POST'])
+def cancel_training(job_id):
+    """
+    Cancela um treinamento na fila ou em andamento.
+    """
+    job_info = training_jobs.get(job_id)
+    if job_info is None:
+        return jsonify({"detail": f"Job de treinamento {job_id} não encontrado"}), 404
+    
+    job_info = training_scheduler.cancel(job_id)
+    if job_info is None:
+        return jsonify({"detail": f"Job de treinamento {job_id} já foi finalizado"}), 409
+    
+    update_model_entry(job_info["model_id"], {"status": "cancelado"})
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": job_info["status"],
+        "message": "Treinamento cancelado"
+    })
+
 @app.route('/train/status/<job_id>', methods=['GET'])
 def get_training_status(job_id):
     """
     Consulta o status de um job de treinamento.
     """
-    if job_id not in training_jobs:
+    job_info = training_jobs.get(job_id)
+    if job_info is None:
         return jsonify({"detail": f"Job de treinamento {job_id} não encontrado"}), 404
         
-    job_info = training_jobs[job_id]
     model_id = job_info.get("model_id")
     
     # Buscar informações adicionais do modelo
@@ -504,6 +659,10 @@ def get_training_status(job_id):
     if val_size is None or not isinstance(val_size, (int, float)):
         val_size = 0
     
+    # Posição na fila de treinamentos (0 se não estiver aguardando)
+    queued = training_scheduler.queued()
+    queue_position = queued.index(job_id) + 1 if job_id in queued else 0
+    
     print(f"DEBUG - Status do job {job_id}: {job_info['status']}, train_size: {train_size}, val_size: {val_size}")
     
     return jsonify({
@@ -516,6 +675,8 @@ def get_training_status(job_id):
         "created_at": job_info["created_at"],
         "updated_at": job_info["updated_at"],
         "progress": job_info["progress"],
+        "priority": job_info.get("priority", 0),
+        "queue_position": queue_position,
         "log": job_info.get("log", []),
         "error": job_info.get("error")
     })
@@ -546,10 +707,79 @@ def delete_model(model_id):
     # Salvar modelos em disco após remover
     save_models_to_disk()
     
+    # Descartar o detector carregado em memória
+    model_cache.invalidate(model_id)
+    
     # Remover arquivos do modelo (apenas simulação)
     print(f"Modelo {model_id} removido com sucesso")
     
     return jsonify({"detail": f"Modelo {model_id} excluído com sucesso"})
 
+def run_export(model_id, formats, quantize):
+    """
+    Gera os artefatos otimizados de um modelo em background.
+    """
+    model_info = find_model(model_id)
+    if model_info is None:
+        return
+
+    try:
+        artifacts = export_model(model_info, models_dir, formats, quantize)
+        model_info.setdefault("artifacts", {}).update(artifacts)
+        failed = all("error" in artifact for artifact in artifacts.values())
+        model_info["export_status"] = "failed" if failed else "completed"
+    except Exception as e:
+        print(f"Erro ao exportar o modelo {model_id}: {str(e)}")
+        model_info["export_status"] = "failed"
+        model_info["export_error"] = str(e)
+
+    save_models_to_disk()
+    # A próxima detecção recarrega o modelo usando o artefato otimizado
+    model_cache.invalidate(model_id)
+
+@app.route('/models/<model_id>/export', methods=['POST'])
+def start_export(model_id):
+    """
+    Exporta um modelo para TorchScript quantizado e/ou ONNX.
+    """
+    model_info = find_model(model_id)
+    if model_info is None:
+        return jsonify({"detail": f"Modelo {model_id} não encontrado"}), 404
+    if model_info.get("status") != "ready":
+        return jsonify({"detail": f"Modelo {model_id} ainda não está pronto"}), 400
+    if model_info.get("export_status") == "processing":
+        return jsonify({"detail": f"Exportação do modelo {model_id} já está em andamento"}), 409
+
+    data = request.get_json(silent=True) or {}
+    formats = data.get("formats", ["torchscript"])
+    quantize = data.get("quantize", True)
+    invalid = [export_format for export_format in formats if export_format not in EXPORT_FORMATS]
+    if not formats or invalid:
+        return jsonify({"detail": f"Formatos de exportação inválidos: {invalid}"}), 400
+
+    model_info["export_status"] = "processing"
+    model_info.pop("export_error", None)
+    save_models_to_disk()
+
+    export_thread = threading.Thread(target=run_export, args=(model_id, formats, quantize))
+    export_thread.daemon = True
+    export_thread.start()
+
+    return jsonify({
+        "model_id": model_id,
+        "formats": formats,
+        "status": "processing",
+        "message": "Exportação iniciada com sucesso"
+    }), 202
+
 if __name__ == '__main__':
+    # HTTP/1.1 permite que o backend reaproveite conexões (keep-alive)
+    from werkzeug.serving import WSGIRequestHandler
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    # Com o reloader do modo debug, quem atende as requisições é o processo filho;
+    # os workers iniciam nele (ou, sem reloader, no primeiro job enfileirado)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        detection_pool.start()
+        threading.Thread(target=preload_default_model, daemon=True).start()
+        training_scheduler.start()
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Permite importar os módulos do serviço ao rodar o pytest a partir de ml-service/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# service.py cria os diretórios de dados e modelos ao ser importado
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="ml-service-data-"))
+os.environ.setdefault("MODELS_DIR", tempfile.mkdtemp(prefix="ml-service-models-"))
@@ -0,0 +1,41 @@
+from concurrent.futures import Future
+
+import pytest
+
+from detection_worker import DetectionWorkerPool
+from job_store import InMemoryJobStore
+
+
+class ManualExecutor:
+    """
+    Executor que não roda os lotes: o primeiro falha assim que todos são
+    enviados e os demais ficam pendentes.
+    """
+
+    def __init__(self, batches: int):
+        self.batches = batches
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        if len(self.futures) == self.batches:
+            self.futures[0].set_exception(RuntimeError("falha na inferência"))
+        return future
+
+
+def test_failed_batch_cancels_pending_batches(tmp_path):
+    pages_dir = tmp_path / "catalogo-1"
+    pages_dir.mkdir()
+    for page_number in range(1, 5):
+        (pages_dir / f"page_{page_number}.jpg").write_bytes(b"")
+
+    jobs = InMemoryJobStore()
+    jobs.put({"id": "job-1", "catalog_id": "catalogo-1", "status": "pending", "progress": {}})
+    pool = DetectionWorkerPool(jobs, detect_pages=None, images_root=str(tmp_path), batch_size=1)
+    pool._page_executor = ManualExecutor(batches=4)
+
+    with pytest.raises(RuntimeError):
+        pool._process_job("job-1")
+
+    assert [future.cancelled() for future in pool._page_executor.futures] == [False, True, True, True]
@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+from PIL import Image  # noqa: E402
+
+from inference import DetectionEngine  # noqa: E402
+
+
+class BarrierModel(torch.nn.Module):
+    """
+    Modelo falso que só retorna quando duas chamadas estão em andamento ao mesmo tempo.
+    """
+
+    def __init__(self, parties):
+        super().__init__()
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def forward(self, images):
+        self.barrier.wait()
+        return [
+            {"boxes": torch.zeros((0, 4)), "scores": torch.zeros(0), "labels": torch.zeros(0, dtype=torch.int64)}
+            for _ in images
+        ]
+
+
+def test_predict_runs_batches_concurrently():
+    engine = DetectionEngine("modelo", BarrierModel(parties=2), ["produto"])
+    image = Image.new("RGB", (32, 32))
+    errors = []
+
+    def run():
+        try:
+            engine.predict([image])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    # Com a inferência serializada, a segunda chamada esperaria a primeira e a barreira estouraria
+    assert errors == []
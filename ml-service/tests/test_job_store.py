@@ -0,0 +1,30 @@
+import time
+
+import pytest
+
+import job_store
+from job_store import InMemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_EVICTION_INTERVAL", 0)
+    if request.param == "memory":
+        return InMemoryJobStore(ttl=60)
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), "detection", ttl=60)
+
+
+def test_finished_jobs_expire_without_new_writes(store):
+    store.put({"id": "antigo", "status": "completed", "finished_at": time.time() - 120})
+    store.put({"id": "ativo", "status": "processing"})
+    # A última gravação não fez a varredura (job expirado inserido depois dela)
+    store.update("antigo", {"finished_at": time.time() - 120})
+
+    assert [job["id"] for job in store.list()] == ["ativo"]
+
+
+def test_get_evicts_expired_jobs(store):
+    store.put({"id": "ativo", "status": "processing"})
+    store.update("ativo", {"status": "failed", "finished_at": time.time() - 120})
+
+    assert store.get("ativo") is None
@@ -0,0 +1,31 @@
+import pytest
+
+from model_cache import ModelCache
+
+
+class FakeEngine:
+    def memory_bytes(self):
+        return 1024
+
+
+def test_failed_load_is_not_left_in_loading_and_can_be_retried():
+    attempts = []
+
+    def loader(model_info):
+        attempts.append(model_info["model_id"])
+        if len(attempts) == 1:
+            raise RuntimeError("pesos corrompidos")
+        return FakeEngine()
+
+    cache = ModelCache(loader)
+
+    with pytest.raises(RuntimeError):
+        cache.get({"model_id": "modelo-1"})
+    assert cache._loading == {}
+    assert "modelo-1" not in cache
+
+    engine = cache.get({"model_id": "modelo-1"})
+    assert isinstance(engine, FakeEngine)
+    assert cache._loading == {}
+    assert attempts == ["modelo-1", "modelo-1"]
+    assert cache.get({"model_id": "modelo-1"}) is engine
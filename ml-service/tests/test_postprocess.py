@@ -0,0 +1,97 @@
+import numpy as np
+
+from postprocess import merge_tile_detections, nms, stitch_tiles
+
+# Página de 2000 x 1024 px em dois tiles de 1024 px com 48 px de sobreposição (x 976..1024)
+PAGE_WIDTH, PAGE_HEIGHT = 2000, 1024
+LEFT_TILE = (0, 0, 1024, 1024)
+RIGHT_TILE = (976, 0, 1024, 1024)
+
+
+def tile(region, page_boxes):
+    """
+    Detecções de um tile a partir de caixas em coordenadas da página, recortadas pelo tile.
+    """
+    x, y, width, height = region
+    detections = []
+    for x1, y1, x2, y2, score, label in page_boxes:
+        local = [max(x1 - x, 0), max(y1 - y, 0), min(x2 - x, width), min(y2 - y, height)]
+        if local[2] > local[0] and local[3] > local[1]:
+            detections.append(local + [score, label])
+    return (*region, np.array(detections, dtype=np.float32).reshape(-1, 6))
+
+
+def boxes(detections):
+    return sorted(detections[:, :4].round().astype(int).tolist())
+
+
+def test_adjacent_products_in_one_tile_are_not_merged():
+    result = merge_tile_detections(
+        [(0, 0, 1024, 1024, [[0, 100, 510, 400, .9, 1], [505, 100, 1024, 400, .8, 1]])], PAGE_WIDTH, PAGE_HEIGHT
+    )
+
+    assert boxes(result) == [[0, 100, 510, 400], [505, 100, 1024, 400]]
+
+
+def test_nested_products_in_one_tile_are_kept():
+    outer = [100, 100, 600, 600, .9, 1]
+    inner = [200, 200, 300, 300, .8, 1]
+
+    result = merge_tile_detections([tile(LEFT_TILE, [outer, inner]), tile(RIGHT_TILE, [])], PAGE_WIDTH, PAGE_HEIGHT)
+
+    assert boxes(result) == boxes(nms(np.array([outer, inner], dtype=np.float32)))
+    assert len(result) == 2
+
+
+def test_product_split_across_tiles_is_merged():
+    product = [900, 100, 1300, 400, .9, 1]
+
+    result = merge_tile_detections(
+        [tile(LEFT_TILE, [product]), tile(RIGHT_TILE, [product])], PAGE_WIDTH, PAGE_HEIGHT
+    )
+
+    assert boxes(result) == [[900, 100, 1300, 400]]
+
+
+def test_product_inside_overlap_band_is_merged():
+    product = [980, 500, 1020, 560, .9, 1]
+
+    result = merge_tile_detections(
+        [tile(LEFT_TILE, [product]), tile(RIGHT_TILE, [product])], PAGE_WIDTH, PAGE_HEIGHT
+    )
+
+    assert boxes(result) == [[980, 500, 1020, 560]]
+
+
+def test_neighbours_on_a_tile_border_stay_separate():
+    # Dois produtos que se tocam dentro da faixa de sobreposição
+    left_product = [800, 100, 1002, 400, .9, 1]
+    right_product = [1000, 100, 1300, 400, .85, 1]
+    detections = [left_product, right_product]
+
+    result = merge_tile_detections(
+        [tile(LEFT_TILE, detections), tile(RIGHT_TILE, detections)], PAGE_WIDTH, PAGE_HEIGHT
+    )
+
+    assert boxes(result) == [[800, 100, 1002, 400], [1000, 100, 1300, 400]]
+
+
+def test_product_across_three_tiles_is_merged():
+    regions = [(0, 0, 1024, 1024), (976, 0, 1024, 1024), (1952, 0, 1024, 1024)]
+    product = [700, 100, 2300, 300, .9, 1]
+
+    result = merge_tile_detections([tile(region, [product]) for region in regions], 2976, 1024)
+
+    assert boxes(result) == [[700, 100, 2300, 300]]
+
+
+def test_stitch_marks_edges_cut_by_inner_tile_borders():
+    stitched = stitch_tiles(
+        [tile(LEFT_TILE, [[900, 100, 1300, 400, .9, 1], [0, 0, 50, 50, .9, 1]]), tile(RIGHT_TILE, [])],
+        PAGE_WIDTH, PAGE_HEIGHT
+    )
+
+    # Só a borda direita da primeira caixa é interna; a borda da página não conta
+    assert stitched.cut.tolist() == [[False, False, True, False], [False, False, False, False]]
+    assert stitched.tile_ids.tolist() == [0, 0]
+    assert stitched.tile_boxes.tolist() == [[0, 0, 1024, 1024], [976, 0, 2000, 1024]]
@@ -0,0 +1,55 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from job_store import InMemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), "training")
+
+
+def test_update_with_expected_status_is_compare_and_set(store):
+    store.put({"id": "job-1", "status": "cancelado"})
+
+    assert store.update("job-1", {"status": "em_andamento"}, expected_status=("pending",)) is None
+    assert store.get("job-1")["status"] == "cancelado"
+
+    store.update("job-1", {"status": "pending"})
+    assert store.update("job-1", {"status": "em_andamento"}, expected_status=("pending",))["status"] == "em_andamento"
+    assert store.update("missing", {"status": "em_andamento"}, expected_status=("pending",)) is None
+
+
+def test_training_cancelled_before_start_does_not_run(monkeypatch):
+    service = pytest.importorskip("service")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("o treinamento não deveria ter iniciado")
+
+    monkeypatch.setattr(service, "fetch_annotations", fail)
+    monkeypatch.setattr(service, "train_model", fail)
+
+    job_id = str(uuid.uuid4())
+    service.training_jobs.put({
+        "id": job_id,
+        "name": "teste",
+        "model_id": str(uuid.uuid4()),
+        "catalog_ids": ["catalogo-1"],
+        "config": {"max_iter": 10},
+        "status": "pending",
+        "created_at": datetime.now().isoformat(),
+        "log": []
+    })
+    # Job já retirado da fila pelo worker, cancelado antes de run_training começar
+    job = service.training_jobs.get(job_id)
+    assert service.training_scheduler.cancel(job_id)["status"] == "cancelado"
+
+    service.run_training_job(job)
+
+    final = service.training_jobs.get(job_id)
+    assert final["status"] == "cancelado"
+    assert "error" not in final
@@ -0,0 +1,458 @@
+"""
+Treinamento do detector de produtos a partir das anotações do backend.
+
+As páginas anotadas são decodificadas, redimensionadas e gravadas uma única
+vez em um dataset em cache (``MODELS_DIR/datasets/<chave>``), com as imagens
+em um único array ``uint8`` mapeável em memória. A chave depende das páginas,
+das datas das anotações, das classes e do tamanho das imagens; treinar de
+novo sobre os mesmos catálogos sem anotações novas reaproveita o cache sem
+decodificar nenhuma imagem.
+
+O treinamento usa um DataLoader com vários workers lendo do memmap e grava
+checkpoints periódicos em ``MODELS_DIR/<model_id>/checkpoint.pth``; os pesos
+finais ficam em ``model_final.pth`` (o arquivo lido pelo motor de inferência).
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision.models.detection import fasterrcnn_resnet50_fpn
+from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+
+from inference import WEIGHTS_FILENAME, model_weights_path
+
+# Tamanho (altura, largura) das páginas no dataset; as páginas são
+# redimensionadas mantendo a proporção e completadas com preto à direita/abaixo
+TRAIN_IMAGE_HEIGHT = int(os.environ.get("TRAIN_IMAGE_HEIGHT", "1024"))
+TRAIN_IMAGE_WIDTH = int(os.environ.get("TRAIN_IMAGE_WIDTH", "768"))
+
+# Workers do DataLoader
+TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", "2"))
+
+# Intervalo (iterações) entre checkpoints
+TRAIN_CHECKPOINT_INTERVAL = int(os.environ.get("TRAIN_CHECKPOINT_INTERVAL", "100"))
+
+# Fração das páginas usada para validação
+TRAIN_VAL_FRACTION = float(os.environ.get("TRAIN_VAL_FRACTION", "0.1"))
+
+# Timeout (segundos) das chamadas ao backend
+BACKEND_TIMEOUT = float(os.environ.get("BACKEND_TIMEOUT", "30"))
+
+# Padrões do treinamento incremental (ajuste fino a partir de um modelo existente)
+INCREMENTAL_MAX_ITER = int(os.environ.get("INCREMENTAL_MAX_ITER", "200"))
+INCREMENTAL_LEARNING_RATE = float(os.environ.get("INCREMENTAL_LEARNING_RATE", "0.001"))
+
+CHECKPOINT_FILENAME = "checkpoint.pth"
+
+
+class TrainingCancelled(Exception):
+    """
+    Levantada quando o job de treinamento é cancelado durante o loop.
+    """
+
+
+def fetch_annotations(backend_url: str, catalog_ids: Sequence[str], since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Busca no backend as páginas anotadas dos catálogos.
+
+    Com ``since``, retorna apenas as páginas anotadas depois dessa data.
+    """
+    params = {"since": since} if since else None
+    pages = []
+    with requests.Session() as session:
+        for catalog_id in catalog_ids:
+            response = session.get(
+                f"{backend_url}/catalogs/{catalog_id}/annotations",
+                params=params,
+                timeout=BACKEND_TIMEOUT
+            )
+            response.raise_for_status()
+            pages.extend(response.json())
+    return pages
+
+
+def resolve_classes(pages: List[Dict[str, Any]], classes: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Classes do modelo: as informadas ou, sem elas, os tipos presentes nas anotações.
+    """
+    if classes:
+        return list(classes)
+    found = {annotation["type"] for page in pages for annotation in page.get("annotations", [])}
+    # "produto" sempre primeiro, para que seja o rótulo 1
+    return sorted(found or {"produto"}, key=lambda name: (name != "produto", name))
+
+
+def annotation_snapshot(pages: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Data da anotação mais recente entre as páginas (o "snapshot" coberto pelo modelo).
+    """
+    timestamps = [page["timestamp"] for page in pages if page.get("timestamp")]
+    return max(timestamps) if timestamps else None
+
+
+def dataset_key(pages: List[Dict[str, Any]], classes: Sequence[str], image_size: Tuple[int, int]) -> str:
+    """
+    Chave do dataset em cache: muda quando páginas, anotações, classes ou tamanho mudam.
+    """
+    fingerprint = {
+        "pages": sorted(
+            [page["catalog_id"], page["page_number"], page.get("timestamp") or ""] for page in pages
+        ),
+        "classes": list(classes),
+        "image_size": list(image_size),
+    }
+    return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()[:16]
+
+
+def build_dataset_cache(
+    pages: List[Dict[str, Any]],
+    images_root: str,
+    cache_root: str,
+    classes: Sequence[str],
+    image_size: Tuple[int, int] = (TRAIN_IMAGE_HEIGHT, TRAIN_IMAGE_WIDTH),
+    log: Callable[[str], Any] = print
+) -> str:
+    """
+    Cria (ou reaproveita) o dataset em cache e retorna a pasta dele.
+
+    A pasta contém ``images.npy`` (N, H, W, 3) uint8, ``boxes.npy`` (M, 4),
+    ``labels.npy`` (M,), ``offsets.npy`` (N + 1,), com as caixas da página i
+    em ``offsets[i]:offsets[i + 1]``, e ``meta.json``.
+    """
+    available = [
+        page for page in pages
+        if os.path.exists(os.path.join(images_root, page["catalog_id"], f"page_{page['page_number']}.jpg"))
+    ]
+    if len(available) < len(pages):
+        log(f"{len(pages) - len(available)} páginas anotadas sem imagem foram ignoradas")
+    if not available:
+        raise ValueError("Nenhuma página anotada com imagem disponível para o treinamento")
+
+    key = dataset_key(available, classes, image_size)
+    dataset_dir = os.path.join(cache_root, key)
+    if os.path.exists(os.path.join(dataset_dir, "meta.json")):
+        log(f"Usando dataset em cache {key} ({len(available)} páginas)")
+        return dataset_dir
+
+    log(f"Criando dataset {key} com {len(available)} páginas")
+    os.makedirs(cache_root, exist_ok=True)
+    temp_dir = os.path.join(cache_root, f".{key}.{uuid.uuid4().hex}.part")
+    os.makedirs(temp_dir)
+
+    try:
+        height, width = image_size
+        images = np.lib.format.open_memmap(
+            os.path.join(temp_dir, "images.npy"), mode="w+", dtype=np.uint8,
+            shape=(len(available), height, width, 3)
+        )
+        boxes, labels, offsets, page_meta = [], [], [0], []
+
+        for index, page in enumerate(available):
+            image_path = os.path.join(images_root, page["catalog_id"], f"page_{page['page_number']}.jpg")
+            with Image.open(image_path) as image:
+                image = image.convert("RGB")
+                scale = min(width / image.width, height / image.height)
+                resized = image.resize(
+                    (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                    Image.BILINEAR
+                )
+            images[index, :resized.height, :resized.width] = np.asarray(resized)
+
+            for annotation in page.get("annotations", []):
+                if annotation["type"] not in classes:
+                    continue
+                bbox = annotation["bbox"]
+                x1, x2 = sorted((bbox["x1"] * scale, bbox["x2"] * scale))
+                y1, y2 = sorted((bbox["y1"] * scale, bbox["y2"] * scale))
+                x1, x2 = np.clip([x1, x2], 0, resized.width)
+                y1, y2 = np.clip([y1, y2], 0, resized.height)
+                # Caixas degeneradas quebram o treinamento do Faster R-CNN
+                if x2 - x1 < 1 or y2 - y1 < 1:
+                    continue
+                boxes.append([x1, y1, x2, y2])
+                labels.append(classes.index(annotation["type"]) + 1)
+
+            offsets.append(len(boxes))
+            page_meta.append({
+                "catalog_id": page["catalog_id"],
+                "page_number": page["page_number"],
+                "timestamp": page.get("timestamp"),
+                "scale": scale
+            })
+
+        images.flush()
+        del images
+        np.save(os.path.join(temp_dir, "boxes.npy"), np.array(boxes, dtype=np.float32).reshape(-1, 4))
+        np.save(os.path.join(temp_dir, "labels.npy"), np.array(labels, dtype=np.int64))
+        np.save(os.path.join(temp_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump({
+                "key": key,
+                "classes": list(classes),
+                "image_size": [height, width],
+                "pages": page_meta,
+                "created_at": datetime.now().isoformat()
+            }, f, indent=2)
+
+        try:
+            os.rename(temp_dir, dataset_dir)
+        except OSError:
+            # Outro treinamento criou o mesmo dataset ao mesmo tempo
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    return dataset_dir
+
+
+def load_dataset_meta(dataset_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(dataset_dir, "meta.json")) as f:
+        return json.load(f)
+
+
+def split_pages(meta: Dict[str, Any], val_fraction: float = TRAIN_VAL_FRACTION) -> Tuple[List[int], List[int]]:
+    """
+    Divide as páginas do dataset em treino e validação.
+
+    A divisão é determinística por página, para que uma página não troque de
+    conjunto entre treinamentos.
+    """
+    train, val = [], []
+    for index, page in enumerate(meta["pages"]):
+        bucket = zlib.crc32(f"{page['catalog_id']}:{page['page_number']}".encode()) % 1000
+        (val if bucket < val_fraction * 1000 else train).append(index)
+    if not train:
+        train, val = val, []
+    return train, val
+
+
+class CachedPageDataset(Dataset):
+    """
+    Páginas do dataset em cache, lidas do memmap sem decodificar imagens.
+    """
+
+    def __init__(self, dataset_dir: str, indices: Sequence[int]):
+        self.dataset_dir = dataset_dir
+        self.indices = list(indices)
+        self._arrays = None
+
+    def _load(self):
+        # Abre os arrays apenas no processo que vai ler (cada worker do DataLoader)
+        if self._arrays is None:
+            self._arrays = tuple(
+                np.load(os.path.join(self.dataset_dir, f"{name}.npy"), mmap_mode="r")
+                for name in ("images", "boxes", "labels", "offsets")
+            )
+        return self._arrays
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        images, boxes, labels, offsets = self._load()
+        index = self.indices[position]
+        start, end = offsets[index], offsets[index + 1]
+        image = torch.from_numpy(np.array(images[index])).permute(2, 0, 1).float().div_(255)
+        target = {
+            "boxes": torch.from_numpy(np.array(boxes[start:end])).reshape(-1, 4),
+            "labels": torch.from_numpy(np.array(labels[start:end]))
+        }
+        return image, target
+
+
+def collate_batch(batch):
+    return tuple(zip(*batch))
+
+
+def build_training_model(num_classes: int, image_size: Tuple[int, int], pretrained: bool = True, models_dir: str = "/models"):
+    """
+    Faster R-CNN para ``num_classes`` classes (mais o fundo).
+
+    Com ``pretrained``, parte dos pesos do COCO e troca apenas o preditor de
+    caixas. O transform interno usa o tamanho das páginas do dataset, para
+    que elas não sejam redimensionadas de novo.
+    """
+    height, width = image_size
+    sizes = {"min_size": min(height, width), "max_size": max(height, width)}
+    if pretrained:
+        torch.hub.set_dir(os.path.join(models_dir, "torch_hub"))
+        model = fasterrcnn_resnet50_fpn(pretrained=True, **sizes)
+        in_features = model.roi_heads.box_predictor.cls_score.in_features
+        model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes + 1)
+        return model
+    return fasterrcnn_resnet50_fpn(pretrained=False, pretrained_backbone=False, num_classes=num_classes + 1, **sizes)
+
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def evaluate(model, dataset: Dataset, score_threshold: float = 0.5, iou_threshold: float = 0.5) -> Dict[str, float]:
+    """
+    Precisão e recall (IoU >= ``iou_threshold``) no conjunto de validação.
+    """
+    loader = DataLoader(dataset, batch_size=2, num_workers=0, collate_fn=collate_batch)
+    true_positives = predicted = expected = 0
+
+    model.eval()
+    with torch.no_grad():
+        for images, targets in loader:
+            for output, target in zip(model(list(images)), targets):
+                keep = output["scores"] >= score_threshold
+                pred_boxes = output["boxes"][keep].numpy()
+                pred_labels = output["labels"][keep].numpy()
+                gt_boxes = target["boxes"].numpy()
+                gt_labels = target["labels"].numpy()
+                predicted += len(pred_boxes)
+                expected += len(gt_boxes)
+                if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+                    continue
+
+                ious = box_iou_matrix(pred_boxes, gt_boxes)
+                ious[pred_labels[:, None] != gt_labels[None, :]] = 0
+                matched = np.zeros(len(gt_boxes), dtype=bool)
+                # Predições já vêm ordenadas por confiança
+                for row in ious:
+                    row = np.where(matched, 0, row)
+                    best = int(np.argmax(row))
+                    if row[best] >= iou_threshold:
+                        matched[best] = True
+                        true_positives += 1
+
+    precision = true_positives / predicted if predicted else 0.0
+    recall = true_positives / expected if expected else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+
+def checkpoint_path(models_dir: str, model_id: str) -> str:
+    return os.path.join(models_dir, model_id, CHECKPOINT_FILENAME)
+
+
+def save_checkpoint(path: str, model, optimizer, iteration: int, classes: Sequence[str]):
+    temp_path = f"{path}.part"
+    torch.save({
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "iteration": iteration,
+        "classes": list(classes)
+    }, temp_path)
+    os.replace(temp_path, path)
+
+
+def train_model(
+    dataset_dir: str,
+    model_id: str,
+    models_dir: str,
+    config: Dict[str, Any],
+    on_progress: Optional[Callable[[int, int, float], Any]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    log: Callable[[str], Any] = print,
+    init_weights: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Treina o detector sobre o dataset em cache.
+
+    ``on_progress(iteração, total, loss)`` é chamado a cada iteração e
+    ``should_stop()`` é consultado antes de cada iteração (levanta
+    ``TrainingCancelled``). Se existir um checkpoint do modelo, o treinamento
+    continua dele; senão, com ``init_weights`` (pesos de outro modelo), o
+    treinamento é um ajuste fino a partir desses pesos.
+    """
+    meta = load_dataset_meta(dataset_dir)
+    classes = meta["classes"]
+    image_size = tuple(meta["image_size"])
+    train_indices, val_indices = split_pages(meta)
+
+    max_iter = int(config.get("max_iter", 1000))
+    batch_size = int(config.get("batch_size", 2))
+    torch.manual_seed(int(config.get("seed", 42)))
+
+    pretrained = config.get("pretrained", True) and init_weights is None
+    model = build_training_model(len(classes), image_size, pretrained, models_dir)
+    params = [param for param in model.parameters() if param.requires_grad]
+    optimizer = torch.optim.SGD(
+        params,
+        lr=float(config.get("learning_rate", 0.005)),
+        momentum=0.9,
+        weight_decay=0.0005
+    )
+
+    os.makedirs(os.path.join(models_dir, model_id), exist_ok=True)
+    checkpoint_file = checkpoint_path(models_dir, model_id)
+    iteration = 0
+    if os.path.exists(checkpoint_file):
+        checkpoint = torch.load(checkpoint_file, map_location="cpu")
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        iteration = checkpoint["iteration"]
+        log(f"Retomando do checkpoint na iteração {iteration}")
+    elif init_weights is not None:
+        model.load_state_dict(torch.load(init_weights, map_location="cpu")["model"])
+        log("Pesos iniciais carregados do modelo base")
+
+    train_loader = DataLoader(
+        CachedPageDataset(dataset_dir, train_indices),
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=TRAIN_WORKERS,
+        collate_fn=collate_batch,
+        persistent_workers=TRAIN_WORKERS > 0
+    )
+
+    model.train()
+    loss_value = float("nan")
+    while iteration < max_iter:
+        for images, targets in train_loader:
+            if should_stop is not None and should_stop():
+                raise TrainingCancelled()
+
+            loss_dict = model(list(images), list(targets))
+            loss = sum(loss_dict.values())
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+            iteration += 1
+            loss_value = loss.item()
+            if on_progress is not None:
+                on_progress(iteration, max_iter, loss_value)
+            if iteration % TRAIN_CHECKPOINT_INTERVAL == 0 and iteration < max_iter:
+                save_checkpoint(checkpoint_file, model, optimizer, iteration, classes)
+            if iteration >= max_iter:
+                break
+
+    weights_file = model_weights_path(models_dir, model_id)
+    torch.save({"model": model.state_dict(), "classes": classes}, f"{weights_file}.part")
+    os.replace(f"{weights_file}.part", weights_file)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    log(f"Pesos salvos em {WEIGHTS_FILENAME}")
+
+    metrics = evaluate(model, CachedPageDataset(dataset_dir, val_indices)) if val_indices else {}
+    metrics["loss"] = round(loss_value, 4)
+    return {
+        "classes": classes,
+        "train_size": len(train_indices),
+        "val_size": len(val_indices),
+        "iterations": iteration,
+        "metrics": metrics
+    }
@@ -0,0 +1,145 @@
+"""
+Agendador dos jobs de treinamento.
+
+Os treinamentos disputam a mesma CPU; em vez de uma thread por requisição,
+os jobs entram em uma fila de prioridade e no máximo ``TRAINING_CONCURRENCY``
+rodam ao mesmo tempo. Jobs na fila ou em andamento podem ser cancelados
+(status ``cancelado``): os da fila não chegam a rodar e os em andamento param
+na próxima iteração.
+
+Na inicialização, os jobs desta réplica que ficaram pendentes ou em
+andamento são reenfileirados; o treinamento continua do último checkpoint.
+"""
+import heapq
+import itertools
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from job_store import WORKER_NAME, JobStore
+
+# Treinamentos executados simultaneamente
+TRAINING_CONCURRENCY = max(1, int(os.environ.get("TRAINING_CONCURRENCY", "1")))
+
+# Status de um job que ainda não terminou
+ACTIVE_STATUSES = ("pending", "em_andamento")
+
+
+class TrainingScheduler:
+    """
+    Fila de prioridade de jobs de treinamento e as threads que os executam.
+
+    ``runner(job)`` executa o treinamento e é responsável por atualizar o
+    status do job. Jobs com ``priority`` maior rodam primeiro; na mesma
+    prioridade, a ordem de chegada é mantida.
+    """
+
+    def __init__(self, jobs: JobStore, runner: Callable[[Dict[str, Any]], Any], concurrency: int = TRAINING_CONCURRENCY):
+        self.jobs = jobs
+        self.runner = runner
+        self.concurrency = max(1, concurrency)
+        self._heap: List[Tuple[int, int, str]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, threading.Thread] = {}
+        self._stopping = False
+
+    def start(self):
+        """
+        Inicia as threads (idempotente) e reenfileira os jobs desta réplica
+        interrompidos por um restart.
+        """
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            for index in range(self.concurrency):
+                thread = threading.Thread(target=self._worker_loop, name=f"training-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        interrupted = [
+            job for job in self.jobs.list(statuses=list(ACTIVE_STATUSES))
+            if job.get("worker") == WORKER_NAME
+        ]
+        for job in sorted(interrupted, key=lambda job: job["created_at"]):
+            self.jobs.update(job["id"], {"status": "pending"}, log="Job reenfileirado após reinício do serviço")
+            self._push(job["id"], job.get("priority", 0))
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+            self._condition.notify_all()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    def submit(self, job: Dict[str, Any]):
+        """
+        Registra o job no store e o coloca na fila.
+        """
+        self.start()
+        job["worker"] = WORKER_NAME
+        job.setdefault("priority", 0)
+        self.jobs.put(job)
+        self._push(job["id"], job["priority"])
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancela um job pendente ou em andamento e retorna o job atualizado.
+
+        Retorna None se o job não existe ou já terminou.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return None
+
+        with self._condition:
+            queued = any(entry[2] == job_id for entry in self._heap)
+            if queued:
+                self._heap = [entry for entry in self._heap if entry[2] != job_id]
+                heapq.heapify(self._heap)
+
+        message = "Treinamento cancelado antes de iniciar" if queued else "Cancelamento solicitado pelo usuário"
+        # Não sobrescreve um job que terminou enquanto isso
+        return self.jobs.update(job_id, {"status": "cancelado"}, log=message, expected_status=ACTIVE_STATUSES)
+
+    def queued(self) -> List[str]:
+        """
+        IDs dos jobs na fila, na ordem em que vão rodar.
+        """
+        with self._condition:
+            return [entry[2] for entry in sorted(self._heap)]
+
+    def running(self) -> List[str]:
+        with self._condition:
+            return list(self._running.keys())
+
+    def _push(self, job_id: str, priority: int):
+        with self._condition:
+            heapq.heappush(self._heap, (-int(priority), next(self._counter), job_id))
+            self._condition.notify()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                _, _, job_id = heapq.heappop(self._heap)
+                self._running[job_id] = threading.current_thread()
+
+            try:
+                job = self.jobs.get(job_id)
+                # Jobs cancelados ou removidos enquanto estavam na fila
+                if job is not None and job["status"] == "pending":
+                    self.runner(job)
+            except Exception as e:
+                error_msg = f"Erro durante o treinamento: {str(e)}"
+                print(error_msg)
+                self.jobs.update(job_id, {"status": "failed", "error": error_msg}, log=error_msg)
+            finally:
+                with self._condition:
+                    self._running.pop(job_id, None)